@@ -0,0 +1,78 @@
+import numpy
+import os
+
+from io import StringIO
+
+
+def copy_from_dataframe(cursor, table, frame, not_null=(), chunk_size=50000):
+    """
+    Stream a DataFrame to a PostgreSQL table thanks to the COPY command. The
+    DataFrame is serialized to CSV by chunks so that we never hold the whole
+    CSV payload in memory.
+
+    Parameters
+    ----------
+    cursor : :obj:`CursorWrapper`
+        A database cursor (psycopg2 backend)
+    table : str
+        The target table name
+    frame : :obj:`DataFrame`
+        The data to copy: column names MUST match the target table columns
+    not_null : iterable, optional
+        Columns for which an empty value should be copied as an empty string
+        instead of NULL
+    chunk_size : int, optional
+        The number of rows sent per COPY statement. Defaults to 50000.
+
+    Returns
+    -------
+    int
+        The number of copied rows
+    """
+
+    sql = 'COPY {} ({}) FROM STDIN WITH (FORMAT csv{})'.format(
+        table,
+        ', '.join(frame.columns),
+        ', FORCE_NOT_NULL ({})'.format(', '.join(not_null))
+        if len(not_null) else ''
+    )
+
+    for start in range(0, len(frame), chunk_size):
+        buffer = StringIO()
+        frame.iloc[start:start + chunk_size].to_csv(
+            buffer,
+            header=False,
+            index=False
+        )
+        buffer.seek(0)
+        cursor.copy_expert(sql, buffer)
+
+    return len(frame)
+
+
+def random_uuids(size):
+    """
+    Generate random (version 4) UUIDs in bulk, which is much faster than
+    calling `uuid.uuid4()` for each row of a large DataFrame.
+
+    Parameters
+    ----------
+    size : int
+        The number of UUIDs to generate
+
+    Returns
+    -------
+    list
+        UUIDs as 32 characters hexadecimal strings
+    """
+
+    raw = numpy.frombuffer(
+        os.urandom(16 * size),
+        dtype=numpy.uint8
+    ).reshape(size, 16).copy()
+    # Set the version (4) and variant (RFC 4122) bits
+    raw[:, 6] = (raw[:, 6] & 0x0f) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3f) | 0x80
+
+    hexdigest = raw.tobytes().hex()
+    return [hexdigest[i:i + 32] for i in range(0, 32 * size, 32)]
@@ -296,10 +296,12 @@ class PixelSet(UUIDModelMixin, models.Model):
             flat=True
         ))
 
-    def update_cached_fields(self):
-        self.cached_species = list(self.get_species())
-        self.cached_omics_unit_types = list(self.get_omics_unit_types())
-        self.cached_omics_areas = list(self.get_omics_areas())
+    def set_cached_fields(self, species, omics_unit_types, omics_areas):
+        # Cached fields can be set from already known values (e.g. while
+        # importing pixels) to avoid the costly update_cached_fields() method
+        self.cached_species = sorted(species)
+        self.cached_omics_unit_types = sorted(omics_unit_types)
+        self.cached_omics_areas = sorted(omics_areas)
         self.save(
             update_fields=[
                 'cached_species',
@@ -308,6 +310,13 @@ class PixelSet(UUIDModelMixin, models.Model):
             ]
         )
 
+    def update_cached_fields(self):
+        self.set_cached_fields(
+            self.get_species(),
+            self.get_omics_unit_types(),
+            self.get_omics_areas(),
+        )
+
 
 class Pixel(UUIDModelMixin, models.Model):
     """A pixel is the smallest measurement unit for an Omics study
@@ -0,0 +1,60 @@
+import uuid
+
+import pandas
+
+from django.db import connection
+from django.test import TestCase
+
+from apps.data.factories import RepositoryFactory
+from apps.data.models import Entry
+from ..db import copy_from_dataframe, random_uuids
+
+
+class CopyFromDataFrameTestCase(TestCase):
+
+    def test_copy_from_dataframe(self):
+
+        repository = RepositoryFactory()
+        frame = pandas.DataFrame({
+            'id': random_uuids(3),
+            'identifier': ['foo', 'bar', ''],
+            'description': ['Foo', None, 'Baz'],
+            'url': '',
+            'repository_id': repository.pk,
+            'fingerprint': '',
+        }, columns=(
+            'id',
+            'identifier',
+            'description',
+            'url',
+            'repository_id',
+            'fingerprint',
+        ))
+
+        with connection.cursor() as cursor:
+            copied = copy_from_dataframe(
+                cursor,
+                'data_entry',
+                frame,
+                not_null=('identifier', 'description', 'url', 'fingerprint'),
+                chunk_size=2
+            )
+
+        self.assertEqual(copied, 3)
+        self.assertEqual(repository.entries.count(), 3)
+        self.assertEqual(Entry.objects.get(identifier='bar').description, '')
+        self.assertEqual(Entry.objects.get(description='Baz').identifier, '')
+
+
+class RandomUUIDsTestCase(TestCase):
+
+    def test_random_uuids(self):
+
+        self.assertEqual(random_uuids(0), [])
+
+        uuids = random_uuids(1000)
+        self.assertEqual(len(uuids), 1000)
+        self.assertEqual(len(set(uuids)), 1000)
+        for value in uuids:
+            self.assertEqual(uuid.UUID(value).version, 4)
+            self.assertEqual(uuid.UUID(value).variant, uuid.RFC_4122)
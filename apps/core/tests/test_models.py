@@ -422,6 +422,22 @@ class PixelSetTestCase(CoreFixturesTestCase):
             [self.experiment.omics_area.name, ]
         )
 
+    def test_set_cached_fields(self):
+
+        self.pixel_set.set_cached_fields(
+            {'Saccharomyces cerevisiae', 'Candida glabrata'},
+            {'protein'},
+            ['RNAseq'],
+        )
+        self.pixel_set.refresh_from_db()
+
+        self.assertEqual(
+            self.pixel_set.cached_species,
+            ['Candida glabrata', 'Saccharomyces cerevisiae']
+        )
+        self.assertEqual(self.pixel_set.cached_omics_unit_types, ['protein'])
+        self.assertEqual(self.pixel_set.cached_omics_areas, ['RNAseq'])
+
 
 class PixelTestCase(TestCase):
 
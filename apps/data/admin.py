@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Entry, Repository
+from .models import Alias, Entry, Repository, RepositoryFile
 
 
 @admin.register(Repository)
@@ -19,3 +19,21 @@ class EntryAdmin(admin.ModelAdmin):
         'identifier', 'description', 'url'
     )
     list_filter = ('repository', )
+
+
+@admin.register(Alias)
+class AliasAdmin(admin.ModelAdmin):
+    search_fields = ['identifier', 'entry__identifier']
+    list_display = (
+        'identifier', 'entry', 'repository'
+    )
+    list_filter = ('repository', )
+    raw_id_fields = ('entry', )
+
+
+@admin.register(RepositoryFile)
+class RepositoryFileAdmin(admin.ModelAdmin):
+    list_display = (
+        'name', 'repository', 'checksum', 'ignore_aliases', 'loaded_at'
+    )
+    list_filter = ('repository', )
@@ -1,14 +1,65 @@
 import logging
 import pandas
 
+from collections import OrderedDict
+from pathlib import Path
+from django.db import connection, transaction
 from django.utils.translation import ugettext
-from hashlib import blake2b
+from hashlib import blake2b, sha256
+from time import perf_counter
 
-from ..models import Entry, Repository
+from apps.core.db import copy_from_dataframe
+from ..models import Alias, Entry, Repository, RepositoryFile
 
 logger = logging.getLogger(__name__)
 
 
+def get_fingerprint(description, url, aliases):
+    """
+    Calculate an entry content fingerprint given a feature description, url
+    and aliases
+
+    Parameters
+    ----------
+    description : str
+        The feature description (including the gene name if any)
+    url : str
+        The feature url
+    aliases : str
+        The feature raw aliases
+
+    Returns
+    -------
+    fingerprint : str
+        The entry fingerprint (hexdigest)
+    """
+    return blake2b(
+        bytes('\t'.join((description, url, aliases)), encoding='utf8'),
+        digest_size=16
+    ).hexdigest()
+
+
+def get_file_checksum(file_path):
+    """
+    Calculate a sha256 checksum for a file
+
+    Parameters
+    ----------
+    file_path : :obj:`Path`
+        Path to the sha256 checksum target file
+
+    Returns
+    -------
+    checksum : str
+        Target file sha256 checksum (hexdigest)
+    """
+    m = sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            m.update(chunk)
+    return m.hexdigest()
+
+
 class ChrFeatureParser(object):
     def __init__(self, file_path, database_name, root_url, skip_rows=0):
 
@@ -16,7 +67,13 @@ class ChrFeatureParser(object):
         self.database_name = database_name
         self.root_url = root_url
         self.features = None
+        self.repository = None
         self.skip_rows = skip_rows
+        self.unchanged = 0
+        # Identifiers already processed while streaming features by chunks
+        self.seen_identifiers = None
+        self.seen_aliases = None
+        self.aliases = None
         self.entries = {
             'new': [],
             'update': [],
@@ -40,102 +97,550 @@ class ChrFeatureParser(object):
             )
         )
 
-    def parse(self):
-        self.features = pandas.read_table(
+    def _read_table(self, **kwargs):
+        """
+        Read the features file. Compressed files (.gz, .bz2) are decompressed
+        on the fly given their extension.
+        """
+        return pandas.read_table(
             self.file_path,
             header=None,
             names=self._get_headers(),
-            skiprows=self.skip_rows
+            skiprows=self.skip_rows,
+            compression='infer',
+            **kwargs
         )
 
+    def parse(self):
+        self.features = self._read_table()
+
+    def iter_features(self, chunk_size):
+        """
+        Yield features DataFrames of (at most) chunk_size rows
+        """
+        for features in self._read_table(chunksize=chunk_size):
+            yield features
+
+    def _get_identifiers(self, features, ignore_aliases):
+        """
+        Return a DataFrame with one row per (feature, identifier) pair. The
+        `row` column points to the related feature (index) and the `position`
+        column keeps the identifier order for a feature: the feature name
+        comes first, followed by its aliases (if any).
+        """
+        names = pandas.DataFrame({
+            'row': features.index,
+            'position': 0,
+            'identifier': features['name'].astype(str).values,
+        })
+
+        if ignore_aliases:
+            return names
+
+        raw_aliases = features['aliases'].dropna()
+        if not len(raw_aliases):
+            return names
+
+        aliases = raw_aliases.astype(str).str.split(
+            '|',
+            expand=True
+        ).stack().dropna()
+        too_long = aliases.str.len() > 100
+        for row in aliases[too_long].index.get_level_values(0).unique():
+            logger.warning(
+                'Ignored long aliases (100+ chars) in {}'.format(
+                    raw_aliases[row]
+                )
+            )
+        aliases = aliases[~too_long]
+
+        aliases = pandas.DataFrame({
+            'row': aliases.index.get_level_values(0),
+            'position': aliases.index.get_level_values(1) + 1,
+            'identifier': aliases.values,
+        })
+
+        return pandas.concat(
+            [names, aliases],
+            ignore_index=True
+        ).sort_values(
+            ['row', 'position'],
+            kind='mergesort'
+        )
+
+    def _get_pks(self, identifiers, suffix=''):
+        """
+        Return precomputed primary keys given identifiers and the parser
+        repository.
+        """
+        suffix = '/{}{}'.format(self.repository.pk.hex, suffix)
+        return [
+            blake2b(
+                bytes(identifier + suffix, encoding='utf8'),
+                digest_size=16
+            ).hexdigest()
+            for identifier in identifiers
+        ]
+
+    def _to_frames(self, ignore_aliases):
+        """
+        Return two DataFrames: the entries and the aliases to save.
+
+        Entries columns are named after the `data_entry` table columns, plus
+        two boolean columns: `new` tells whether the entry already exists in
+        the repository or not, and `changed` tells whether an existing entry
+        content (fingerprint) has changed since it has been imported.
+
+        Aliases columns are named after the `data_alias` table columns, except
+        for the `entry_identifier` column that points to the canonical entry
+        (feature name).
+        """
+        self.repository, _ = Repository.objects.get_or_create(
+            name=self.database_name
+        )
+
+        features = self.features.reset_index(drop=True)
+
+        invalid_names = features['name'].isna()
+        for feature_id in features.loc[invalid_names, 'id']:
+            logger.warning(f"Invalid feature name for id={feature_id}")
+        features = features[~invalid_names]
+
+        urls = self.root_url + features['id'].astype(str)
+
+        descriptions = features['description'].where(
+            features['gene_name'].isna(),
+            features['gene_name'].astype(str).str.strip() +
+            ' | ' +
+            features['description'].astype(str)
+        )
+
+        fingerprints = pandas.Series([
+            get_fingerprint(description, url, aliases)
+            for description, url, aliases in zip(
+                descriptions.astype(str),
+                urls,
+                features['aliases'].fillna('').astype(str),
+            )
+        ], index=features.index)
+
+        # We only keep the first occurrence of an identifier, and an alias
+        # never shadows a feature name.
+        identifiers = self._get_identifiers(features, ignore_aliases)
+        is_name = identifiers['position'] == 0
+        names = identifiers[is_name].drop_duplicates('identifier')
+        aliases = identifiers[~is_name].drop_duplicates('identifier')
+        aliases = aliases[~aliases['identifier'].isin(names['identifier'])]
+        if self.seen_identifiers is not None:
+            names = names[~names['identifier'].isin(self.seen_identifiers)]
+            self.seen_identifiers.update(names['identifier'])
+            aliases = aliases[
+                ~aliases['identifier'].isin(self.seen_identifiers) &
+                ~aliases['identifier'].isin(self.seen_aliases)
+            ]
+            self.seen_aliases.update(aliases['identifier'])
+
+        rows = names['row'].values
+        identifiers = names['identifier'].values
+        frame = pandas.DataFrame({
+            # The Entry primary key is precomputed given an identifier and a
+            # repository.
+            'id': self._get_pks(identifiers),
+            'identifier': identifiers,
+            'description': descriptions.loc[rows].values,
+            'url': urls.loc[rows].values,
+            'repository_id': self.repository.pk.hex,
+            'fingerprint': fingerprints.loc[rows].values,
+        }, columns=(
+            'id',
+            'identifier',
+            'description',
+            'url',
+            'repository_id',
+            'fingerprint',
+        ))
+        known_entries = dict(
+            self.repository.entries.filter(
+                identifier__in=frame['identifier'].tolist()
+            ).values_list(
+                'identifier',
+                'fingerprint'
+            )
+        )
+        known_fingerprints = frame['identifier'].map(known_entries)
+        frame['new'] = known_fingerprints.isna()
+        frame['changed'] = (
+            ~frame['new'] & (known_fingerprints != frame['fingerprint'])
+        )
+
+        identifiers = aliases['identifier'].values
+        aliases = pandas.DataFrame({
+            'id': self._get_pks(identifiers, suffix='/alias'),
+            'identifier': identifiers,
+            'entry_identifier': features['name'].astype(str).loc[
+                aliases['row']
+            ].values,
+            'repository_id': self.repository.pk.hex,
+        }, columns=(
+            'id',
+            'identifier',
+            'entry_identifier',
+            'repository_id',
+        ))
+
+        return frame, aliases
+
     def _to_entries(self, ignore_aliases):
 
         if self.features is None:
             return
 
-        repository, _ = Repository.objects.get_or_create(
-            name=self.database_name
-        )
-        known_entries = repository.entries.values_list('identifier', flat=True)
-        entries = {
-            'update': [],
-            'new': [],
-        }
+        frame, self.aliases = self._to_frames(ignore_aliases)
+
+        # Unchanged entries are not considered for update
+        self.unchanged = int((~frame['new'] & ~frame['changed']).sum())
+        frame = frame[frame['new'] | frame['changed']]
 
-        for idx, feature in self.features.iterrows():
-            url = '{}{}'.format(self.root_url, feature['id'])
-            aliases = []
+        entries = [
+            Entry(
+                pk=pk,
+                identifier=identifier,
+                description=description,
+                url=url,
+                repository=self.repository,
+                fingerprint=fingerprint,
+            )
+            for pk, identifier, description, url, fingerprint in zip(
+                frame['id'],
+                frame['identifier'],
+                frame['description'],
+                frame['url'],
+                frame['fingerprint'],
+            )
+        ]
+
+        self.entries['new'] = [
+            e for e, new in zip(entries, frame['new']) if new
+        ]
+        self.entries['update'] = [
+            e for e, new in zip(entries, frame['new']) if not new
+        ]
+
+    def _save_aliases(self):
+        """
+        Create new aliases and update aliases pointing to another entry.
+        Aliased entries MUST have been saved.
+
+        Returns the number of created, updated and unchanged aliases.
+        """
 
-            if pandas.isna(feature['name']):
-                logger.warning(f"Invalid feature name for id={feature['id']}")
-                continue
+        if self.aliases is None or not len(self.aliases):
+            return 0, 0, 0
 
-            if not pandas.isna(feature['aliases']) and not ignore_aliases:
-                splitted_aliases = feature['aliases'].split('|')
-                aliases = list(
-                    filter(
-                        lambda a: len(a) <= 100,
-                        map(str, splitted_aliases)
+        entry_identifiers = self.aliases['entry_identifier'].unique().tolist()
+        entry_ids = dict(
+            self.repository.entries.filter(
+                identifier__in=entry_identifiers
+            ).values_list('identifier', 'id')
+        )
+        known_aliases = dict(
+            self.repository.aliases.filter(
+                identifier__in=self.aliases['identifier'].tolist()
+            ).values_list('identifier', 'entry_id')
+        )
+
+        new, updated, unchanged = [], [], 0
+        for pk, identifier, entry_identifier in zip(
+            self.aliases['id'],
+            self.aliases['identifier'],
+            self.aliases['entry_identifier'],
+        ):
+            entry_id = entry_ids[entry_identifier]
+            if identifier not in known_aliases:
+                new.append(
+                    Alias(
+                        pk=pk,
+                        identifier=identifier,
+                        entry_id=entry_id,
+                        repository=self.repository,
                     )
                 )
+            elif known_aliases[identifier] != entry_id:
+                updated.append((identifier, entry_id))
+            else:
+                unchanged += 1
+
+        Alias.objects.bulk_create(new, batch_size=500)
+        for identifier, entry_id in updated:
+            self.repository.aliases.filter(
+                identifier=identifier
+            ).update(
+                entry_id=entry_id
+            )
 
-                if len(aliases) != len(splitted_aliases):
-                    logger.warning(
-                        'Ignored long aliases (100+ chars) in {}'.format(
-                            feature['aliases']
-                        )
-                    )
+        return len(new), len(updated), unchanged
 
-            for identifier in (str(feature['name']), *aliases):
-
-                # The Entry primary key is precomputed given an identifier and
-                # a repository. By doing so, we will be able to create a set()
-                # to remove duplicates potentially generated by aliases.
-                pk = blake2b(
-                    bytes(
-                        '/'.join((identifier, repository.pk.hex)),
-                        encoding='utf8'
-                    ),
-                    digest_size=16
-                ).hexdigest()
-
-                description = feature['description']
-
-                if not pandas.isna(feature['gene_name']):
-                    gene_name = feature['gene_name'].strip()
-                    description = '{} | {}'.format(gene_name, description)
-
-                entry = Entry(
-                    pk=pk,
-                    identifier=identifier,
-                    description=description,
-                    url=url,
-                    repository=repository,
-                )
+    def _copy(self, ignore_aliases, stats):
+        """
+        Stream entries (and aliases) to temporary staging tables with COPY
+        and merge them into the `data_entry` (and `data_alias`) table with a
+        single upsert statement.
+        """
+
+        start = perf_counter()
+        frame, aliases = self._to_frames(ignore_aliases)
+        unchanged = ~frame['new'] & ~frame['changed']
+        frame = frame[~unchanged].drop(['new', 'changed'], axis=1)
+        # Django casts non-string values (e.g. NaN) to str before saving a
+        # TextField, we do the same.
+        frame['description'] = frame['description'].astype(str)
+        stats['prepare'] = {
+            'rows': len(frame),
+            'unchanged': int(unchanged.sum()),
+            'duration': perf_counter() - start,
+        }
 
-                if identifier in known_entries:
-                    entries['update'].append(entry)
-                else:
-                    entries['new'].append(entry)
+        with transaction.atomic(), connection.cursor() as cursor:
 
-        self.entries['new'] = list(set(entries.get('new')))
-        self.entries['update'] = list(set(entries.get('update')))
+            start = perf_counter()
+            cursor.execute(
+                'CREATE TEMPORARY TABLE data_entry_staging'
+                ' (LIKE data_entry)'
+            )
+            copied = copy_from_dataframe(
+                cursor,
+                'data_entry_staging',
+                frame,
+                not_null=('identifier', 'description', 'url')
+            )
+            stats['copy'] = {
+                'rows': copied,
+                'duration': perf_counter() - start,
+            }
+
+            start = perf_counter()
+            cursor.execute(
+                'WITH upserted AS ('
+                '  INSERT INTO data_entry'
+                '    (id, identifier, description, url, repository_id,'
+                '     fingerprint)'
+                '  SELECT'
+                '    id, identifier, description, url, repository_id,'
+                '    fingerprint'
+                '  FROM data_entry_staging'
+                '  ON CONFLICT (identifier, repository_id)'
+                '  DO UPDATE SET'
+                '    description = EXCLUDED.description,'
+                '    url = EXCLUDED.url,'
+                '    fingerprint = EXCLUDED.fingerprint'
+                '  WHERE'
+                '    data_entry.fingerprint IS DISTINCT FROM'
+                '    EXCLUDED.fingerprint'
+                '  RETURNING (xmax = 0) AS inserted'
+                ')'
+                ' SELECT'
+                '  COUNT(*) FILTER (WHERE inserted),'
+                '  COUNT(*) FILTER (WHERE NOT inserted)'
+                ' FROM upserted'
+            )
+            inserted, updated = cursor.fetchone()
+            # We may run in an outer transaction, hence we cannot rely on
+            # ON COMMIT DROP
+            cursor.execute('DROP TABLE data_entry_staging')
+            stats['merge'] = {
+                'rows': inserted + updated,
+                'inserted': inserted,
+                'updated': updated,
+                'duration': perf_counter() - start,
+            }
+
+            if not len(aliases):
+                return
+
+            start = perf_counter()
+            cursor.execute(
+                'CREATE TEMPORARY TABLE data_alias_staging ('
+                '  id uuid,'
+                '  identifier varchar(100),'
+                '  entry_identifier varchar(100),'
+                '  repository_id uuid'
+                ')'
+            )
+            copy_from_dataframe(
+                cursor,
+                'data_alias_staging',
+                aliases,
+                not_null=('identifier', 'entry_identifier')
+            )
+            cursor.execute(
+                'WITH upserted AS ('
+                '  INSERT INTO data_alias'
+                '    (id, identifier, entry_id, repository_id)'
+                '  SELECT'
+                '    s.id, s.identifier, e.id, s.repository_id'
+                '  FROM data_alias_staging s'
+                '  INNER JOIN data_entry e'
+                '    ON e.identifier = s.entry_identifier'
+                '    AND e.repository_id = s.repository_id'
+                '  ON CONFLICT (identifier, repository_id)'
+                '  DO UPDATE SET'
+                '    entry_id = EXCLUDED.entry_id'
+                '  WHERE'
+                '    data_alias.entry_id IS DISTINCT FROM EXCLUDED.entry_id'
+                '  RETURNING (xmax = 0) AS inserted'
+                ')'
+                ' SELECT'
+                '  COUNT(*) FILTER (WHERE inserted),'
+                '  COUNT(*) FILTER (WHERE NOT inserted)'
+                ' FROM upserted'
+            )
+            inserted, updated = cursor.fetchone()
+            cursor.execute('DROP TABLE data_alias_staging')
+            stats['aliases'] = {
+                'rows': inserted + updated,
+                'inserted': inserted,
+                'updated': updated,
+                'unchanged': len(aliases) - inserted - updated,
+                'duration': perf_counter() - start,
+            }
+
+    def save(self, ignore_aliases=True, copy=False):
+        """
+        Save parsed features as entries. If `copy` is True, entries are
+        written thanks to PostgreSQL COPY and a single upsert statement.
+
+        Returns an ordered dictionary with row counts and timings (in
+        seconds) for each phase of the importation.
+        """
 
-    def save(self, ignore_aliases=True):
+        stats = OrderedDict()
 
+        if self.features is None:
+            return stats
+
+        if copy:
+            self._copy(ignore_aliases, stats)
+            return stats
+
+        start = perf_counter()
         self._to_entries(ignore_aliases=ignore_aliases)
+        stats['prepare'] = {
+            'rows': len(self.entries['new']) + len(self.entries['update']),
+            'unchanged': self.unchanged,
+            'duration': perf_counter() - start,
+        }
 
         # Create new entries
+        start = perf_counter()
         Entry.objects.bulk_create(self.entries['new'], batch_size=500)
+        stats['create'] = {
+            'rows': len(self.entries['new']),
+            'duration': perf_counter() - start,
+        }
 
-        # Update old entries
+        # Update changed entries
+        start = perf_counter()
         for updated_entry in self.entries['update']:
-            entry = Entry.objects.get(
+            Entry.objects.filter(
                 identifier=updated_entry.identifier,
                 repository=updated_entry.repository
+            ).update(
+                description=updated_entry.description,
+                url=updated_entry.url,
+                fingerprint=updated_entry.fingerprint,
             )
-            entry.description = updated_entry.description
-            entry.save(update_fields=['description', ])
+        stats['update'] = {
+            'rows': len(self.entries['update']),
+            'duration': perf_counter() - start,
+        }
+
+        # Create or update aliases
+        start = perf_counter()
+        created, updated, unchanged = self._save_aliases()
+        if created or updated or unchanged:
+            stats['aliases'] = {
+                'rows': created + updated,
+                'inserted': created,
+                'updated': updated,
+                'unchanged': unchanged,
+                'duration': perf_counter() - start,
+            }
+
+        return stats
+
+    def is_loaded(self, ignore_aliases=True):
+        """
+        Check if the features file has already been loaded (with the same
+        content and options) for the parser repository.
+        """
+        return RepositoryFile.objects.filter(
+            repository__name=self.database_name,
+            name=Path(self.file_path).name,
+            checksum=get_file_checksum(self.file_path),
+            ignore_aliases=ignore_aliases,
+        ).exists()
+
+    def set_loaded(self, ignore_aliases=True):
+        """
+        Store the features file checksum for the parser repository so that
+        further imports of the same file can be skipped.
+        """
+        repository, _ = Repository.objects.get_or_create(
+            name=self.database_name
+        )
+        RepositoryFile.objects.update_or_create(
+            repository=repository,
+            name=Path(self.file_path).name,
+            defaults={
+                'checksum': get_file_checksum(self.file_path),
+                'ignore_aliases': ignore_aliases,
+            }
+        )
+
+    def stream(self, chunk_size, ignore_aliases=True, copy=False):
+        """
+        Read and save features by chunks of chunk_size rows: a chunk is saved
+        before the next one is read, so that memory usage does not depend on
+        the features file size.
+
+        Returns an ordered dictionary with cumulated row counts and timings
+        for each phase of the importation (see the save() method).
+        """
+
+        stats = OrderedDict()
+        stats['read'] = {
+            'rows': 0,
+            'duration': 0.,
+        }
+
+        self.seen_identifiers = set()
+        self.seen_aliases = set()
+        try:
+            features = self.iter_features(chunk_size)
+            while True:
+                start = perf_counter()
+                self.features = next(features, None)
+                if self.features is None:
+                    break
+                stats['read']['rows'] += len(self.features)
+                stats['read']['duration'] += perf_counter() - start
+
+                chunk_stats = self.save(
+                    ignore_aliases=ignore_aliases,
+                    copy=copy
+                )
+                for phase, phase_stats in chunk_stats.items():
+                    cumulated = stats.setdefault(
+                        phase,
+                        {k: 0 for k in phase_stats}
+                    )
+                    for key, value in phase_stats.items():
+                        cumulated[key] += value
+        finally:
+            self.seen_identifiers = None
+            self.seen_aliases = None
+
+        return stats
 
 
 class CGDParser(ChrFeatureParser):
@@ -1,50 +1,367 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
+from time import perf_counter
 
-from django.core.management.base import BaseCommand
+from django import db
+from django.core.management.base import BaseCommand, CommandError
 from django.utils.translation import ugettext as _
 
 from ...io.parsers import CGDParser, SGDParser
 
+PARSERS = {
+    'CGD': CGDParser,
+    'SGD': SGDParser,
+}
+
+
+def load_file(database, filename, ignore_aliases=False, copy=False,
+              chunk_size=None, force=False):
+    """Load entries from a chromosome features file
+
+    Returns: importation stats (see ChrFeatureParser.save()) or None if the
+    file has not changed since last load
+    """
+    chr_parser = PARSERS[database](Path(filename))
+
+    if not force and chr_parser.is_loaded(ignore_aliases=ignore_aliases):
+        return None
+
+    if chunk_size:
+        stats = chr_parser.stream(
+            chunk_size,
+            ignore_aliases=ignore_aliases,
+            copy=copy
+        )
+    else:
+        chr_parser.parse()
+        stats = chr_parser.save(ignore_aliases=ignore_aliases, copy=copy)
+
+    chr_parser.set_loaded(ignore_aliases=ignore_aliases)
+
+    return stats
+
+
+def parse_file(database, filename, ignore_aliases=False, force=False):
+    """Parse a chromosome features file in a worker process (the database is
+    only queried to check if the file has already been loaded)
+
+    Returns: a (parser, read stats) tuple, the parser is None if the file has
+    not changed since last load
+    """
+    try:
+        chr_parser = PARSERS[database](Path(filename))
+        if not force and chr_parser.is_loaded(ignore_aliases=ignore_aliases):
+            return None, None
+
+        start = perf_counter()
+        chr_parser.parse()
+        return chr_parser, {
+            'rows': len(chr_parser.features),
+            'duration': perf_counter() - start,
+        }
+    finally:
+        # Each worker process opens its own database connection
+        db.connections.close_all()
+
+
+def write_repository_files(files, ignore_aliases=False, copy=False):
+    """Sequentially write files related to the same repository, once they
+    have been parsed. Files are given as (database, filename, future) tuples
+    where the future result is a parse_file() result.
+
+    Returns: a list of (database, filename, stats) tuples
+    """
+    results = []
+    try:
+        for database, filename, future in files:
+            chr_parser, read_stats = future.result()
+            if chr_parser is None:
+                results.append((database, filename, None))
+                continue
+
+            stats = OrderedDict(read=read_stats)
+            stats.update(
+                chr_parser.save(ignore_aliases=ignore_aliases, copy=copy)
+            )
+            chr_parser.set_loaded(ignore_aliases=ignore_aliases)
+            results.append((database, filename, stats))
+    finally:
+        # Each writer thread opens its own database connection
+        db.connection.close()
+    return results
+
+
+def load_repository_files(files, **options):
+    """Sequentially load files related to the same repository in a worker
+    process
+
+    Returns: a list of (database, filename, stats) tuples
+    """
+    try:
+        return [
+            (database, filename, load_file(database, filename, **options))
+            for database, filename in files
+        ]
+    finally:
+        # Each worker process opens its own database connection
+        db.connections.close_all()
+
 
 class Command(BaseCommand):
-    SUPPORTED_DATABASES = (
-        'CGD',
-        'SGD',
-    )
+    SUPPORTED_DATABASES = tuple(PARSERS.keys())
     help = _("Load entries from various repositories")
 
     def add_arguments(self, parser):
         parser.add_argument(
             'filename',
-            help=_("Path to the file containing chromosome features (.tab)")
+            nargs='?',
+            help=_(
+                "Path to the file containing chromosome features (.tab, "
+                ".tab.gz or .tab.bz2)"
+            )
         )
         parser.add_argument(
             '--database',
             choices=self.SUPPORTED_DATABASES,
-            required=True,
-            help=_("The database related to the file (REQUIRED)")
+            help=_(
+                "The database related to the file (REQUIRED if no manifest "
+                "is given)"
+            )
+        )
+        parser.add_argument(
+            '--manifest',
+            help=_(
+                "Path to a manifest file listing files to load: one "
+                "'DATABASE PATH' pair per line"
+            )
+        )
+        parser.add_argument(
+            '--jobs',
+            type=int,
+            default=1,
+            help=_(
+                "Number of worker processes used to parse files (files "
+                "related to the same database are written sequentially)"
+            )
         )
         parser.add_argument(
             '--ignore-aliases',
             action='store_true',
             help=_("Ignore aliases in omics units/entries")
         )
+        parser.add_argument(
+            '--copy',
+            action='store_true',
+            help=_(
+                "Write entries thanks to PostgreSQL COPY and a single upsert "
+                "statement (faster for large files)"
+            )
+        )
+
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            help=_(
+                "Read and save the file by chunks of CHUNK_SIZE rows to limit "
+                "memory usage"
+            )
+        )
+
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help=_("Load the file even if it has not changed since last load")
+        )
+
+    def parse_manifest(self, manifest):
+        """Parse a manifest file. Relative paths are relative to the manifest
+        directory.
+
+        Returns: a list of (database, filename) tuples
+        """
+        manifest = Path(manifest)
+        if not manifest.exists():
+            raise CommandError(
+                _("Manifest {} not found").format(manifest)
+            )
+
+        files = []
+        with open(manifest) as f:
+            for line_number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not len(line) or line.startswith('#'):
+                    continue
+
+                try:
+                    database, filename = line.split(maxsplit=1)
+                except ValueError:
+                    raise CommandError(
+                        _("Invalid manifest line {}: {}").format(
+                            line_number, line
+                        )
+                    )
+                if database not in self.SUPPORTED_DATABASES:
+                    raise CommandError(
+                        _("Unsupported database {} (line {})").format(
+                            database, line_number
+                        )
+                    )
+                files.append((database, manifest.parent / filename))
+
+        return files
+
+    def write_stats(self, stats):
+
+        for phase, phase_stats in stats.items():
+            details = ', '.join(
+                '{}: {}'.format(k, v) for k, v in phase_stats.items()
+                if k not in ('rows', 'duration')
+            )
+            self.stdout.write(
+                _("{}: {} rows in {:.2f}s{}").format(
+                    phase,
+                    phase_stats['rows'],
+                    phase_stats['duration'],
+                    ' ({})'.format(details) if details else ''
+                )
+            )
+
+    def load_files_in_parallel(self, repositories, jobs, ignore_aliases=False,
+                               copy=False, chunk_size=None, force=False):
+        """Parse all files in a process pool, while a writer thread per
+        repository saves parsed files in the manifest order: writes to
+        different repositories run concurrently, writes to the same
+        repository are serialized.
+
+        Files read by chunks are parsed and written at the same time, hence
+        they are loaded by a worker process per repository.
+
+        Returns: a list of (database, filename, stats) tuples
+        """
+        # Forked processes must not share the parent database connection
+        db.connections.close_all()
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            if chunk_size:
+                futures = [
+                    executor.submit(
+                        load_repository_files,
+                        repository_files,
+                        ignore_aliases=ignore_aliases,
+                        copy=copy,
+                        chunk_size=chunk_size,
+                        force=force
+                    )
+                    for repository_files in repositories.values()
+                ]
+                return [r for f in futures for r in f.result()]
+
+            parsed = [
+                [
+                    (database, filename, executor.submit(
+                        parse_file,
+                        database,
+                        filename,
+                        ignore_aliases=ignore_aliases,
+                        force=force
+                    ))
+                    for database, filename in repository_files
+                ]
+                for repository_files in repositories.values()
+            ]
+            with ThreadPoolExecutor(max_workers=len(parsed)) as writers:
+                futures = [
+                    writers.submit(
+                        write_repository_files,
+                        repository_files,
+                        ignore_aliases=ignore_aliases,
+                        copy=copy
+                    )
+                    for repository_files in parsed
+                ]
+                return [r for f in futures for r in f.result()]
 
     def handle(self, *args, **options):
         filename = options.get('filename')
         database = options.get('database')
-        ignore_aliases = options.get('ignore_aliases', False)
+        manifest = options.get('manifest')
+        jobs = options.get('jobs') or 1
+        load_options = {
+            'ignore_aliases': options.get('ignore_aliases', False),
+            'copy': options.get('copy', False),
+            'chunk_size': options.get('chunk_size'),
+            'force': options.get('force', False),
+        }
+
+        if manifest is not None:
+            files = self.parse_manifest(manifest)
+        elif filename is not None and database is not None:
+            files = [(database, filename)]
+        else:
+            raise CommandError(
+                _(
+                    "You should either give a filename and a database, or a "
+                    "manifest"
+                )
+            )
 
-        if database == 'CGD':
-            chr_parser = CGDParser(Path(filename))
-        elif database == 'SGD':
-            chr_parser = SGDParser(Path(filename))
+        # Writes to the same repository are serialized
+        repositories = OrderedDict()
+        for database, filename in files:
+            repositories.setdefault(database, []).append((database, filename))
 
-        chr_parser.parse()
-        chr_parser.save(ignore_aliases=ignore_aliases)
+        start = perf_counter()
+        if jobs > 1 and len(files) > 1:
+            results = self.load_files_in_parallel(
+                repositories,
+                jobs,
+                **load_options
+            )
+        else:
+            results = [
+                (database, filename, load_file(
+                    database,
+                    filename,
+                    **load_options
+                ))
+                for database, filename in files
+            ]
+        duration = perf_counter() - start
+
+        total_rows = 0
+        for database, filename, stats in results:
+            if stats is None:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        _("File {} has not changed since last load, skipping")
+                        .format(filename)
+                    )
+                )
+                continue
 
-        self.stdout.write(
-            self.style.SUCCESS(
-                _("Successfully imported file: {}".format(filename))
+            self.stdout.write(_("{} ({}):").format(filename, database))
+            self.write_stats(stats)
+            prepare_stats = stats.get('prepare', {})
+            total_rows += (
+                prepare_stats.get('rows', 0) +
+                prepare_stats.get('unchanged', 0)
+            )
+            self.stdout.write(
+                self.style.SUCCESS(
+                    _("Successfully imported file: {}".format(filename))
+                )
+            )
+
+        if len(results) > 1:
+            self.stdout.write(
+                _(
+                    "Loaded {} files ({} entries) in {:.2f}s "
+                    "({:.0f} entries/s)"
+                ).format(
+                    len(results),
+                    total_rows,
+                    duration,
+                    total_rows / duration if duration else 0
+                )
             )
-        )
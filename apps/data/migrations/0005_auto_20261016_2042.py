@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.15 on 2026-10-16 20:42
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data', '0004_auto_20180122_1055'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RepositoryFile',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255, verbose_name='Name')),
+                ('checksum', models.CharField(help_text='Loaded file sha256 checksum', max_length=64, verbose_name='Checksum')),
+                ('ignore_aliases', models.BooleanField(default=False, verbose_name='Ignore aliases')),
+                ('loaded_at', models.DateTimeField(auto_now=True)),
+                ('repository', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='files', related_query_name='file', to='data.Repository')),
+            ],
+            options={
+                'verbose_name': 'Repository file',
+                'verbose_name_plural': 'Repository files',
+                'ordering': ('repository', 'name'),
+            },
+        ),
+        migrations.AddField(
+            model_name='entry',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, help_text='Imported content (description, url and aliases) fingerprint', max_length=32, verbose_name='Fingerprint'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='repositoryfile',
+            unique_together=set([('repository', 'name')]),
+        ),
+    ]
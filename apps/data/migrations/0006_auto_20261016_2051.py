@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.15 on 2026-10-16 20:51
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data', '0005_auto_20261016_2042'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Alias',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('identifier', models.CharField(max_length=100, verbose_name='Identifier')),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aliases', related_query_name='alias', to='data.Entry')),
+                ('repository', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aliases', related_query_name='alias', to='data.Repository')),
+            ],
+            options={
+                'verbose_name': 'Alias',
+                'verbose_name_plural': 'Aliases',
+                'ordering': ('repository', 'identifier'),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='alias',
+            unique_together=set([('identifier', 'repository')]),
+        ),
+        # Case-insensitive exact lookups (identifier__iexact)
+        migrations.RunSQL(
+            'CREATE INDEX data_alias_identifier_upper_idx'
+            ' ON data_alias (UPPER(identifier::text))',
+            reverse_sql='DROP INDEX data_alias_identifier_upper_idx',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX data_entry_identifier_upper_idx'
+            ' ON data_entry (UPPER(identifier::text))',
+            reverse_sql='DROP INDEX data_entry_identifier_upper_idx',
+        ),
+    ]
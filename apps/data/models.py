@@ -72,6 +72,16 @@ class Entry(UUIDModelMixin, models.Model):
         related_query_name='entry',
     )
 
+    fingerprint = models.CharField(
+        _("Fingerprint"),
+        max_length=32,
+        help_text=_(
+            "Imported content (description, url and aliases) fingerprint"
+        ),
+        blank=True,
+        editable=False,
+    )
+
     class Meta:
         ordering = ('repository', 'identifier')
         unique_together = (
@@ -90,3 +100,96 @@ class Entry(UUIDModelMixin, models.Model):
             raise ValidationError(
                 _("You need to provide an identifier or an url for an Entry")
             )
+
+
+class Alias(models.Model):
+    """An alternative identifier pointing to a canonical repository Entry
+    (e.g. a chromosomal feature alias).
+    """
+
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False,
+    )
+
+    identifier = models.CharField(
+        _("Identifier"),
+        max_length=100,
+    )
+
+    entry = models.ForeignKey(
+        'Entry',
+        on_delete=models.CASCADE,
+        related_name='aliases',
+        related_query_name='alias',
+    )
+
+    repository = models.ForeignKey(
+        'Repository',
+        on_delete=models.CASCADE,
+        related_name='aliases',
+        related_query_name='alias',
+    )
+
+    class Meta:
+        ordering = ('repository', 'identifier')
+        unique_together = (
+            ('identifier', 'repository'),
+        )
+        verbose_name = _("Alias")
+        verbose_name_plural = _("Aliases")
+
+    def __str__(self):
+        return self.identifier
+
+
+class RepositoryFile(models.Model):
+    """A file from which repository entries have been loaded. Its checksum is
+    used to skip loading unchanged files.
+    """
+
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False,
+    )
+
+    repository = models.ForeignKey(
+        'Repository',
+        on_delete=models.CASCADE,
+        related_name='files',
+        related_query_name='file',
+    )
+
+    name = models.CharField(
+        _("Name"),
+        max_length=255,
+    )
+
+    checksum = models.CharField(
+        _("Checksum"),
+        help_text=_("Loaded file sha256 checksum"),
+        max_length=64,
+    )
+
+    ignore_aliases = models.BooleanField(
+        _("Ignore aliases"),
+        default=False,
+    )
+
+    loaded_at = models.DateTimeField(
+        auto_now=True,
+        editable=False,
+    )
+
+    class Meta:
+        ordering = ('repository', 'name')
+        unique_together = (
+            ('repository', 'name'),
+        )
+        verbose_name = _("Repository file")
+        verbose_name_plural = _("Repository files")
+
+    def __str__(self):
+        return self.name
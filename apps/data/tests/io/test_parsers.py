@@ -6,7 +6,7 @@ import pytest
 from django.test import TestCase
 
 from ...factories import EntryFactory, RepositoryFactory
-from ...models import Entry
+from ...models import Alias, Entry, RepositoryFile
 from ...io.parsers import ChrFeatureParser, CGDParser, SGDParser
 
 
@@ -151,8 +151,52 @@ class CGDParserTestCase(ChrFeatureParserTestMixin, TestCase):
         parser.parse()
         parser._to_entries(ignore_aliases=False)
 
-        assert len(parser.entries['new']) == 30
+        # Aliases do not generate entries
+        assert len(parser.entries['new']) == 10
         assert len(parser.entries['update']) == 0
+        assert len(parser.aliases) == 20
+        alias = parser.aliases.set_index('identifier').loc['CAG57670.1']
+        assert alias['entry_identifier'] == 'CAGL0A00165g'
+
+    def test__get_identifiers(self):
+
+        parser = self.ChrParserClass(self.file_path)
+        parser.parse()
+
+        identifiers = parser._get_identifiers(
+            parser.features,
+            ignore_aliases=True
+        )
+        assert len(identifiers) == 10
+        assert list(identifiers['position'].unique()) == [0]
+
+        identifiers = parser._get_identifiers(
+            parser.features,
+            ignore_aliases=False
+        )
+        # Duplicated identifiers are removed later on by _to_frames()
+        assert len(identifiers) == 32
+        # Feature names come first, followed by their aliases
+        assert list(identifiers['identifier'][:6]) == [
+            'CAGL0A00105g',
+            'CAGL0A00110g.1',
+            'CAGL0A00116g',
+            'CAGL0A00110g.2',
+            'CAGL0A00132g',
+            'Novel_proteincoding2',
+        ]
+
+    def test__to_entries_primary_keys(self):
+
+        parser = self.ChrParserClass(self.file_path)
+        parser.parse()
+        parser._to_entries(ignore_aliases=False)
+        pks = set(e.pk for e in parser.entries['new'])
+        assert len(pks) == 10
+
+        # Primary keys are deterministic given an identifier and a repository
+        parser._to_entries(ignore_aliases=False)
+        assert pks == set(e.pk for e in parser.entries['new'])
 
     def test_save(self):
 
@@ -194,6 +238,56 @@ class CGDParserTestCase(ChrFeatureParserTestMixin, TestCase):
         assert entry.identifier == first_entry.identifier
         assert entry.description == 'Cen0A | Centromere, chromosome A'
 
+    def test_save_only_updates_changed_entries(self):
+
+        parser = self.ChrParserClass(self.file_path)
+        parser.parse()
+        parser.save()
+        assert Entry.objects.count() == 10
+        assert Entry.objects.filter(fingerprint='').count() == 0
+
+        # Modify an entry without modifying its fingerprint
+        Entry.objects.filter(
+            identifier='CAGL0A00116g'
+        ).update(
+            description='Modified'
+        )
+
+        # Only the modified feature should be updated
+        parser.features.loc[0, 'description'] = 'Protein of known function'
+        stats = parser.save()
+        assert stats['prepare']['unchanged'] == 9
+        assert stats['create']['rows'] == 0
+        assert stats['update']['rows'] == 1
+
+        entry = Entry.objects.get(identifier='CAGL0A00105g')
+        assert entry.description == 'Protein of known function'
+
+        # Entries with an unchanged fingerprint are left untouched
+        entry = Entry.objects.get(identifier='CAGL0A00116g')
+        assert entry.description == 'Modified'
+
+    def test_is_loaded(self):
+
+        parser = self.ChrParserClass(self.file_path)
+        assert not parser.is_loaded()
+
+        parser.set_loaded()
+        assert parser.is_loaded()
+        assert not parser.is_loaded(ignore_aliases=False)
+        assert RepositoryFile.objects.count() == 1
+
+        parser.set_loaded(ignore_aliases=False)
+        assert parser.is_loaded(ignore_aliases=False)
+        assert RepositoryFile.objects.count() == 1
+
+        repository_file = RepositoryFile.objects.get()
+        assert repository_file.repository.name == 'CGD'
+        assert repository_file.name == self.file_path.name
+        repository_file.checksum = 'foo'
+        repository_file.save()
+        assert not parser.is_loaded(ignore_aliases=False)
+
     def test_save_with_aliases(self):
 
         parser = self.ChrParserClass(self.file_path)
@@ -201,14 +295,188 @@ class CGDParserTestCase(ChrFeatureParserTestMixin, TestCase):
 
         assert Entry.objects.count() == 0
 
+        stats = parser.save(ignore_aliases=False)
+        assert Entry.objects.count() == 10
+        assert Alias.objects.count() == 20
+        assert stats['aliases']['inserted'] == 20
+
+        alias = Alias.objects.get(identifier='CAG57670.1')
+        assert alias.entry.identifier == 'CAGL0A00165g'
+        assert alias.entry.url == (
+            'http://www.candidagenome.org/cgi-bin/locus.pl?dbid=CAL0126541'
+        )
+        assert alias.repository.name == 'CGD'
+
+        # Aliases are looked up case-insensitively
+        assert Entry.objects.filter(
+            alias__identifier__iexact='cag57670.1'
+        ).get() == alias.entry
+
+        # Saving the same aliases twice should not update them
+        stats = parser.save(ignore_aliases=False)
+        assert Alias.objects.count() == 20
+        assert stats['aliases']['rows'] == 0
+        assert stats['aliases']['unchanged'] == 20
+
+    def test_save_with_aliases_pointing_to_another_entry(self):
+
+        parser = self.ChrParserClass(self.file_path)
+        parser.parse()
         parser.save(ignore_aliases=False)
-        assert Entry.objects.count() == 30
 
-        entry = Entry.objects.get(identifier='CAG57670.1')
+        alias = Alias.objects.get(identifier='CAG57670.1')
+        alias.entry = Entry.objects.get(identifier='CAGL0A00116g')
+        alias.save()
+
+        stats = parser.save(ignore_aliases=False)
+        assert stats['aliases']['updated'] == 1
+        alias.refresh_from_db()
+        assert alias.entry.identifier == 'CAGL0A00165g'
+
+    def test_save_returns_stats(self):
+
+        parser = self.ChrParserClass(self.file_path)
+        assert parser.save() == {}
+
+        parser.parse()
+        stats = parser.save()
+        assert list(stats.keys()) == ['prepare', 'create', 'update']
+        assert stats['prepare']['rows'] == 10
+        assert stats['create']['rows'] == 10
+        assert stats['update']['rows'] == 0
+        for phase_stats in stats.values():
+            assert phase_stats['duration'] >= 0
+
+    def test_save_with_copy(self):
+
+        parser = self.ChrParserClass(self.file_path)
+        parser.parse()
+
+        assert Entry.objects.count() == 0
+
+        stats = parser.save(ignore_aliases=False, copy=True)
+        assert Entry.objects.count() == 10
+        assert Alias.objects.count() == 20
+        assert list(stats.keys()) == ['prepare', 'copy', 'merge', 'aliases']
+        assert stats['prepare']['rows'] == 10
+        assert stats['copy']['rows'] == 10
+        assert stats['merge']['inserted'] == 10
+        assert stats['merge']['updated'] == 0
+        assert stats['aliases']['inserted'] == 20
+
+        alias = Alias.objects.get(identifier='CAG57670.1')
+        assert alias.entry.identifier == 'CAGL0A00165g'
+
+        # Saving the same aliases twice should not update them
+        stats = parser.save(ignore_aliases=False, copy=True)
+        assert Alias.objects.count() == 20
+        assert stats['aliases']['rows'] == 0
+        assert stats['aliases']['unchanged'] == 20
+
+        entry = Entry.objects.get(identifier='CAGL0A02321g')
         assert entry.url == (
+            'http://www.candidagenome.org/cgi-bin/locus.pl?dbid=CAL0126815'
+        )
+        assert entry.description.startswith('HXT3 | Ortholog(s) have')
+        assert entry.repository.name == 'CGD'
+
+    def test_save_with_copy_and_existing_entries(self):
+
+        repository = RepositoryFactory(name='CGD')
+        first_entry = EntryFactory(
+            identifier='CAGL0A00759s',
+            description='Old description',
+            url=(
+                'http://www.candidagenome.org/cgi-bin/locus.pl?dbid='
+                'CAL0137785'
+            ),
+            repository=repository
+        )
+
+        parser = self.ChrParserClass(self.file_path)
+        parser.parse()
+        stats = parser.save(copy=True)
+        assert Entry.objects.count() == 10
+        assert stats['merge']['inserted'] == 9
+        assert stats['merge']['updated'] == 1
+
+        entry = Entry.objects.get(url=first_entry.url)
+        assert entry.id == first_entry.id
+        assert entry.description == 'Cen0A | Centromere, chromosome A'
+
+        # Saving the same entries twice should not update them
+        stats = parser.save(copy=True)
+        assert Entry.objects.count() == 10
+        assert stats['prepare']['unchanged'] == 10
+        assert stats['copy']['rows'] == 0
+        assert stats['merge']['inserted'] == 0
+        assert stats['merge']['updated'] == 0
+
+    def test_parse_bz2_file(self):
+
+        parser = self.ChrParserClass(
+            self.file_path.with_suffix('.tab.bz2')
+        )
+        parser.parse()
+        assert len(parser.features) == 10
+        assert parser.features.iloc[0]['name'] == 'CAGL0A00105g'
+
+    def test_iter_features(self):
+
+        parser = self.ChrParserClass(self.file_path)
+        chunks = list(parser.iter_features(chunk_size=4))
+
+        assert [len(c) for c in chunks] == [4, 4, 2]
+        assert chunks[0].iloc[0]['name'] == 'CAGL0A00105g'
+        assert chunks[-1].iloc[-1]['name'] == 'CAGL0A02321g'
+
+    def test_stream(self):
+
+        parser = self.ChrParserClass(self.file_path)
+
+        assert Entry.objects.count() == 0
+
+        stats = parser.stream(chunk_size=3, ignore_aliases=False)
+        assert Entry.objects.count() == 10
+        assert Alias.objects.count() == 20
+        assert parser.seen_identifiers is None
+        assert parser.seen_aliases is None
+        assert list(stats.keys()) == [
+            'read', 'prepare', 'create', 'update', 'aliases'
+        ]
+        assert stats['read']['rows'] == 10
+        assert stats['prepare']['rows'] == 10
+        assert stats['create']['rows'] == 10
+        assert stats['update']['rows'] == 0
+        assert stats['aliases']['inserted'] == 20
+
+        alias = Alias.objects.get(identifier='CAG57670.1')
+        assert alias.entry.url == (
             'http://www.candidagenome.org/cgi-bin/locus.pl?dbid=CAL0126541'
         )
 
+        # Stream the same file twice: entries have not changed
+        stats = parser.stream(chunk_size=3, ignore_aliases=False)
+        assert Entry.objects.count() == 10
+        assert stats['prepare']['unchanged'] == 10
+        assert stats['create']['rows'] == 0
+        assert stats['update']['rows'] == 0
+
+    def test_stream_with_copy(self):
+
+        parser = self.ChrParserClass(self.file_path)
+        stats = parser.stream(chunk_size=4, ignore_aliases=False, copy=True)
+
+        assert Entry.objects.count() == 10
+        assert Alias.objects.count() == 20
+        assert list(stats.keys()) == [
+            'read', 'prepare', 'copy', 'merge', 'aliases'
+        ]
+        assert stats['copy']['rows'] == 10
+        assert stats['merge']['inserted'] == 10
+        assert stats['merge']['updated'] == 0
+        assert stats['aliases']['inserted'] == 20
+
 
 class SGDParserTestCase(ChrFeatureParserTestMixin, TestCase):
 
@@ -253,6 +521,20 @@ class SGDParserTestCase(ChrFeatureParserTestMixin, TestCase):
         assert pandas.isna(last_feature['name'])
         assert last_feature['id'] == 'S000002143'
 
+    def test_parse_gz_file(self):
+
+        parser = self.ChrParserClass(self.file_path.with_suffix('.tab.gz'))
+        parser.parse()
+        assert len(parser.features) == 11
+        assert parser.features.iloc[0]['name'] == 'YAL069W'
+
+    def test_stream_skips_na_names(self):
+
+        parser = self.ChrParserClass(self.file_path.with_suffix('.tab.gz'))
+        parser.stream(chunk_size=5, ignore_aliases=False)
+        assert Entry.objects.count() == 8
+        assert Alias.objects.count() == 2
+
     def test_save_skips_long_aliases(self):
         # L4 of the fixtures file has a very long alias
         parser = self.ChrParserClass(self.file_path)
@@ -263,7 +545,8 @@ class SGDParserTestCase(ChrFeatureParserTestMixin, TestCase):
         assert Entry.objects.count() == 0
 
         parser.save(ignore_aliases=False)
-        assert Entry.objects.count() == 10
+        assert Entry.objects.count() == 8
+        assert Alias.objects.count() == 2
 
     def test_save_skips_na_names(self):
         # L11 of the fixtures file has no name
@@ -275,4 +558,4 @@ class SGDParserTestCase(ChrFeatureParserTestMixin, TestCase):
         assert Entry.objects.count() == 0
 
         parser.save(ignore_aliases=False)
-        assert Entry.objects.count() == 10
+        assert Entry.objects.count() == 8
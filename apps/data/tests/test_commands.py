@@ -1,11 +1,12 @@
 from pathlib import Path
+from tempfile import NamedTemporaryFile
 
 from django.core.management import call_command
 from django.core.management.base import CommandError
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from django.utils.six import StringIO
 
-from ..models import Entry
+from ..models import Alias, Entry, Repository
 
 
 class LoadEntriesCommandTestCase(TestCase):
@@ -46,7 +47,8 @@ class LoadEntriesCommandTestCase(TestCase):
             *args,
             stdout=output
         )
-        self.assertEqual(Entry.objects.count(), 30)
+        self.assertEqual(Entry.objects.count(), 10)
+        self.assertEqual(Alias.objects.count(), 20)
 
         expected_output = 'Successfully imported file: {}'.format(
             self.cgd_file
@@ -64,7 +66,8 @@ class LoadEntriesCommandTestCase(TestCase):
             *args,
             stdout=output
         )
-        self.assertEqual(Entry.objects.count(), 10)
+        self.assertEqual(Entry.objects.count(), 8)
+        self.assertEqual(Alias.objects.count(), 2)
 
         expected_output = 'Successfully imported file: {}'.format(
             self.sgd_file
@@ -84,6 +87,7 @@ class LoadEntriesCommandTestCase(TestCase):
             stdout=output
         )
         self.assertEqual(Entry.objects.count(), 10)
+        self.assertEqual(Alias.objects.count(), 0)
 
         expected_output = 'Successfully imported file: {}'.format(
             self.cgd_file
@@ -108,3 +112,219 @@ class LoadEntriesCommandTestCase(TestCase):
             self.sgd_file
         )
         self.assertIn(expected_output, output.getvalue())
+
+    def test_command_load_cgd_file_with_copy(self):
+
+        output = StringIO()
+        args = [self.cgd_file, '--database', 'CGD', '--copy']
+
+        self.assertEqual(Entry.objects.count(), 0)
+        call_command(
+            'load_entries',
+            *args,
+            stdout=output
+        )
+        self.assertEqual(Entry.objects.count(), 10)
+        self.assertEqual(Alias.objects.count(), 20)
+
+        self.assertIn('copy: 10 rows in', output.getvalue())
+        self.assertIn(
+            'merge: 10 rows in',
+            output.getvalue()
+        )
+        self.assertIn('(inserted: 10, updated: 0)', output.getvalue())
+        self.assertIn(
+            'aliases: 20 rows in',
+            output.getvalue()
+        )
+        expected_output = 'Successfully imported file: {}'.format(
+            self.cgd_file
+        )
+        self.assertIn(expected_output, output.getvalue())
+
+    def test_command_load_compressed_sgd_file_by_chunks(self):
+
+        output = StringIO()
+        sgd_file = self.sgd_file.with_suffix('.tab.gz')
+        args = [sgd_file, '--database', 'SGD', '--chunk-size', '4']
+
+        self.assertEqual(Entry.objects.count(), 0)
+        call_command(
+            'load_entries',
+            *args,
+            stdout=output
+        )
+        self.assertEqual(Entry.objects.count(), 8)
+
+        self.assertIn('read: 11 rows in', output.getvalue())
+        expected_output = 'Successfully imported file: {}'.format(sgd_file)
+        self.assertIn(expected_output, output.getvalue())
+
+    def test_command_skips_unchanged_file(self):
+
+        args = [self.cgd_file, '--database', 'CGD']
+        call_command('load_entries', *args, stdout=StringIO())
+        self.assertEqual(Entry.objects.count(), 10)
+        self.assertEqual(Alias.objects.count(), 20)
+
+        Entry.objects.all().delete()
+
+        output = StringIO()
+        call_command('load_entries', *args, stdout=output)
+        self.assertEqual(Entry.objects.count(), 0)
+        self.assertIn(
+            'File {} has not changed since last load, skipping'.format(
+                self.cgd_file
+            ),
+            output.getvalue()
+        )
+
+        # Options are part of the file fingerprint
+        call_command(
+            'load_entries',
+            *args,
+            ignore_aliases=True,
+            stdout=StringIO()
+        )
+        self.assertEqual(Entry.objects.count(), 10)
+        self.assertEqual(Alias.objects.count(), 0)
+
+        # Force file loading
+        output = StringIO()
+        call_command('load_entries', *args, '--force', stdout=output)
+        self.assertEqual(Entry.objects.count(), 10)
+        self.assertEqual(Alias.objects.count(), 20)
+        self.assertIn('unchanged: 10', output.getvalue())
+
+    def test_command_with_missing_database(self):
+
+        with self.assertRaises(CommandError):
+            call_command('load_entries', self.cgd_file, stdout=StringIO())
+
+    def test_command_with_invalid_manifest(self):
+
+        with self.assertRaises(CommandError):
+            call_command(
+                'load_entries',
+                '--manifest', 'path/to/manifest.txt',
+                stdout=StringIO()
+            )
+
+        with NamedTemporaryFile('w', suffix='.txt') as manifest:
+            manifest.write('INVALID path/to/file.tab\n')
+            manifest.flush()
+
+            with self.assertRaises(CommandError):
+                call_command(
+                    'load_entries',
+                    '--manifest', manifest.name,
+                    stdout=StringIO()
+                )
+
+    def test_command_load_manifest(self):
+
+        output = StringIO()
+
+        with NamedTemporaryFile('w', suffix='.txt') as manifest:
+            manifest.write(
+                '# Entries to load\n'
+                'CGD {}\n'
+                '\n'
+                'SGD {}\n'.format(
+                    self.cgd_file.absolute(),
+                    self.sgd_file.absolute()
+                )
+            )
+            manifest.flush()
+
+            call_command(
+                'load_entries',
+                '--manifest', manifest.name,
+                stdout=output
+            )
+
+        self.assertEqual(Entry.objects.count(), 18)
+        self.assertIn(
+            'Loaded 2 files (18 entries) in',
+            output.getvalue()
+        )
+
+
+class ParallelLoadEntriesCommandTestCase(TransactionTestCase):
+
+    # Worker processes use their own database connection, hence we cannot run
+    # this test in a transaction
+    available_apps = ['apps.data']
+
+    def test_command_load_manifest_with_workers(self):
+
+        output = StringIO()
+        fixtures = Path('apps/data/fixtures/').absolute()
+
+        with NamedTemporaryFile('w', suffix='.txt') as manifest:
+            manifest.write(
+                'CGD {}\n'
+                'SGD {}\n'
+                'CGD {}\n'.format(
+                    fixtures / 'C_glabrata_CBS138_current_chromosomal_'
+                               'feature_10.tab',
+                    fixtures / 'SGD_feature_S000002143.tab',
+                    fixtures / 'C_glabrata_CBS138_current_chromosomal_'
+                               'feature_10.tab.bz2',
+                )
+            )
+            manifest.flush()
+
+            call_command(
+                'load_entries',
+                '--manifest', manifest.name,
+                '--jobs', '2',
+                stdout=output
+            )
+
+        self.assertEqual(
+            Entry.objects.filter(repository__name='CGD').count(),
+            10
+        )
+        self.assertEqual(
+            Entry.objects.filter(repository__name='SGD').count(),
+            8
+        )
+        self.assertEqual(Alias.objects.count(), 22)
+        self.assertEqual(Repository.objects.count(), 2)
+        # The second CGD file has the same content, entries are unchanged
+        self.assertIn('(unchanged: 10)', output.getvalue())
+        self.assertIn(
+            'Loaded 3 files (28 entries) in',
+            output.getvalue()
+        )
+
+    def test_command_load_manifest_by_chunks_with_workers(self):
+
+        output = StringIO()
+        fixtures = Path('apps/data/fixtures/').absolute()
+
+        with NamedTemporaryFile('w', suffix='.txt') as manifest:
+            manifest.write(
+                'CGD {}\n'
+                'SGD {}\n'.format(
+                    fixtures / 'C_glabrata_CBS138_current_chromosomal_'
+                               'feature_10.tab',
+                    fixtures / 'SGD_feature_S000002143.tab',
+                )
+            )
+            manifest.flush()
+
+            call_command(
+                'load_entries',
+                '--manifest', manifest.name,
+                '--jobs', '2',
+                '--chunk-size', '4',
+                stdout=output
+            )
+
+        self.assertEqual(Entry.objects.count(), 18)
+        self.assertIn(
+            'Loaded 2 files (18 entries) in',
+            output.getvalue()
+        )
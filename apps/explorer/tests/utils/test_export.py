@@ -7,6 +7,7 @@ from apps.core import factories
 from apps.core.models import PixelSet
 from apps.core.tests import CoreFixturesTestCase
 from apps.data.factories import EntryFactory
+from apps.data.models import Alias
 
 from ...utils import (
     PIXELSET_EXPORT_META_FILENAME, PIXELSET_EXPORT_PIXELS_FILENAME,
@@ -248,6 +249,26 @@ class ExportPixelsTestCase(CoreFixturesTestCase):
         assert (pixels_csv['QS'][0] ==
                 pytest.approx(selected_pixel.quality_score))
 
+    def test_export_pixels_with_omics_unit_alias(self):
+
+        pixel_set = factories.PixelSetFactory.create()
+        pixels = factories.PixelFactory.create_batch(3, pixel_set=pixel_set)
+        selected_pixel = pixels[1]
+        reference = selected_pixel.omics_unit.reference
+        Alias.objects.create(
+            identifier='ALIAS-0001',
+            entry=reference,
+            repository=reference.repository
+        )
+
+        pixels_csv = self._export_pixels(
+            pixel_set,
+            search_terms=['ALIAS-0001']
+        )
+
+        assert len(pixels_csv['Omics Unit'].items()) == 1
+        assert pixels_csv['Omics Unit'][0] == reference.identifier
+
     def test_export_pixels_with_term_in_description(self):
 
         pixel_set = factories.PixelSetFactory.create()
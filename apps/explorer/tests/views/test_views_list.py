@@ -11,6 +11,7 @@ from zipfile import ZipFile
 from apps.core import factories, models
 from apps.core.templatetags.files import filename
 from apps.core.tests import CoreFixturesTestCase
+from apps.data.models import Alias
 from apps.core.management.commands.make_development_fixtures import (
     make_development_fixtures
 )
@@ -691,6 +692,38 @@ class PixelSetListViewTestCase(CoreFixturesTestCase):
             html=True,
         )
 
+    def test_search_filter_with_omics_unit_reference_alias(self):
+
+        # Create 8 pixelset
+        make_development_fixtures(
+            n_pixel_sets=8,
+            n_pixels_per_set=1
+        )
+
+        pixel_set = models.PixelSet.objects.all()[4]
+        reference = pixel_set.pixels.get().omics_unit.reference
+        Alias.objects.create(
+            identifier='ALIAS-0001',
+            entry=reference,
+            repository=reference.repository
+        )
+
+        # filter with Omics Unit reference alias search (case-insensitive)
+        data = {
+            'search': 'alias-0001'
+        }
+        response = self.client.get(self.url, data)
+        self.assertContains(
+            response,
+            '<tr class="pixelset">',
+            count=1
+        )
+        self.assertContains(
+            response,
+            f'href="{pixel_set.get_absolute_url()}"',
+            count=1,
+        )
+
     def test_search_filter_with_analysis_id(self):
 
         # Create 8 pixelset
@@ -9,6 +9,7 @@ from django.db.models import Q
 from django.utils.translation import ugettext as _
 
 from apps.core.models import Pixel
+from apps.data.models import Alias
 from apps.explorer.templatetags.explorer import highlight_terms
 
 
@@ -148,8 +149,14 @@ def get_queryset_filtered_by_search_terms(qs, search_terms=None):
         for term in search_terms[1:]:
             clauses &= Q(omics_unit__reference__description__icontains=term)
 
+        aliased_entries = Alias.objects.filter(
+            identifier__in=search_terms
+        ).values('entry')
+
         qs = qs.filter(
-            Q(omics_unit__reference__identifier__in=search_terms) | clauses
+            Q(omics_unit__reference__identifier__in=search_terms) |
+            Q(omics_unit__reference__in=aliased_entries) |
+            clauses
         )
 
     return qs
@@ -11,6 +11,7 @@ from django.views.generic import (
 from django.views.generic.edit import FormMixin
 
 from apps.core.models import OmicsArea, PixelSet, Tag
+from apps.data.models import Alias, Entry
 
 from ..forms import (
     PixelSetFiltersForm, PixelSetExportForm,
@@ -88,11 +89,19 @@ class PixelSetListView(LoginRequiredMixin, FormMixin, ListView):
 
             search = form.cleaned_data.get('search')
             if len(search):
+                # Omics units are searched by identifier or alias
+                entries = Entry.objects.filter(
+                    identifier__iexact=search
+                ).values('id')
+                aliased_entries = Alias.objects.filter(
+                    identifier__iexact=search
+                ).values('entry')
                 qs = qs.filter(
                     Q(analysis__id__istartswith=search) |
                     Q(analysis__experiments__description__icontains=search) |
                     Q(analysis__description__icontains=search) |
-                    Q(pixel__omics_unit__reference__identifier__iexact=search)
+                    Q(pixel__omics_unit__reference__in=entries) |
+                    Q(pixel__omics_unit__reference__in=aliased_entries)
                 )
 
         # optimize db queries
@@ -0,0 +1,27 @@
+from django.contrib import admin
+
+from .models import ImportJob
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'process', 'pixeler', 'status', 'priority', 'attempts', 'run_at',
+        'worker', 'started_at', 'finished_at'
+    )
+    list_editable = ('priority', )
+    list_filter = ('status', )
+    search_fields = ['process__label', 'pixeler__username']
+    fields = (
+        'process', 'task', 'pixeler', 'status', 'priority', 'attempts',
+        'run_at', 'locked_until', 'worker', 'error', 'created_at',
+        'started_at', 'finished_at'
+    )
+    readonly_fields = (
+        'process', 'task', 'pixeler', 'status', 'attempts', 'locked_until',
+        'worker', 'error', 'created_at', 'started_at', 'finished_at'
+    )
+
+    def has_add_permission(self, request):
+        # Jobs are queued by submissions
+        return False
@@ -6,6 +6,10 @@ class InvalidArchiveFormatError(ArchiveError):
     pass
 
 
+class UnsafeArchiveMemberError(ArchiveError):
+    pass
+
+
 class MetaFileRequiredError(ArchiveError):
     pass
 
@@ -18,6 +22,22 @@ class MetaFileParsingError(ArchiveError):
     pass
 
 
+class MissingEntriesError(ArchiveError):
+    pass
+
+
+class ImportInterruptedError(Exception):
+    pass
+
+
+class ImportCanceledError(ImportInterruptedError):
+    pass
+
+
+class ImportTimeoutError(ImportInterruptedError):
+    pass
+
+
 class PixelSetParserError(Exception):
     pass
 
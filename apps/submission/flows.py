@@ -2,10 +2,8 @@ import logging
 
 from pathlib import Path
 
-import background
-
-from django import db
 from django.conf import settings
+from django.dispatch import receiver
 from django.utils.timezone import now
 from viewflow import flow, signals as vf_signals
 from viewflow.activation import Context, STATUS
@@ -14,6 +12,7 @@ from viewflow.flow.views import CreateProcessView
 from viewflow.nodes.handler import HandlerActivation
 
 from . import views
+from .jobs import enqueue_import
 from .models import SubmissionProcess
 from .io.archive import PixelArchive
 
@@ -177,74 +176,27 @@ class SubmissionFlow(Flow):
 
         archive_path = self.get_archive_path(activation)
         archive = PixelArchive(archive_path)
-        archive.parse(serialized=True)
+        try:
+            # Fail before the importation is queued on missing entries
+            archive.validate()
+            archive.parse(serialized=True)
+        finally:
+            archive.cleanup()
         activation.process.meta = archive.meta
         activation.process.save()
 
     def perform_archive_importation(self, activation):
+        """
+        Queue the archive importation: an import worker (see the
+        run_import_workers command) imports it and completes this task.
+        """
+
+        enqueue_import(activation.process, activation.task)
 
-        archive_path = self.get_archive_path(activation)
-        process = activation.process
-        pixeler = process.created_by
-        task = process.get_task(self.import_archive)
-
-        @background.task
-        def async_import_archive():
-            logger.debug("Async import started…")
-
-            archive = PixelArchive(archive_path)
-            logger.debug("Archive instanciated")
-
-            logger.debug("Saving archive…")
-            return archive.save(pixeler=pixeler, submission=process)
-
-        @background.callback
-        def importation_callback(future):
-            """
-            We need to force databases connection closing since the background
-            process (in a separated thread) creates a new connection that would
-            never be closed otherwise.
-            """
-            logger.debug("Background importation callback started…")
-
-            e = future.exception()
-            logger.debug("Future exception: {} ({})".format(e, type(e)))
-
-            if e is not None:
-                task.status = STATUS.ERROR
-                task.comments = str(e)
-                task.finished = now()
-                task.save()
-
-                # Re-raise the exception for lazy logging
-                try:
-                    raise e
-                except Exception:
-                    logger.exception(
-                        "Importation failed! archive: {} (pixeler: {})".format(
-                            archive_path,
-                            pixeler
-                        )
-                    )
-                    logger.debug(
-                        "Closing open database connections "
-                        "(background callback exception)"
-                    )
-                    db.connections.close_all()
-                    raise
-
-            process.imported = True
-            process.save()
-            logger.debug("Submission process updated (imported: True)")
-
-            logger.debug("Proceeding with activation callback")
-            activation.callback()
-
-            logger.debug(
-                "Closing open database connections (background callback)"
-            )
-            db.connections.close_all()
 
-            logger.debug("Background importation callback done")
+@receiver(vf_signals.task_finished, sender=SubmissionFlow)
+@receiver(vf_signals.task_failed, sender=SubmissionFlow)
+def update_process_completion(sender, process, task, **kwargs):
+    """Keep process completion and failed columns up to date"""
 
-        async_import_archive()
+    process.update_completion()
@@ -1,4 +1,7 @@
+import hashlib
+
 from django import forms
+from django.conf import settings
 from django.utils.translation import ugettext as _
 
 from apps.core.models import Tag
@@ -114,3 +117,59 @@ class SubmissionTagsForm(forms.ModelForm):
         self._set_tags()
 
         return super().save(**kwargs)
+
+
+class ArchiveChunkForm(forms.Form):
+    """An archive chunk sent to the upload step"""
+
+    chunk = forms.FileField()
+
+    filename = forms.CharField(max_length=255)
+
+    offset = forms.IntegerField(min_value=0)
+
+    size = forms.IntegerField(
+        help_text=_("The whole archive size (in bytes)"),
+        min_value=1,
+    )
+
+    checksum = forms.RegexField(
+        help_text=_("The chunk SHA-256 hexadecimal digest"),
+        regex=r'^[0-9a-f]{64}$',
+    )
+
+    def clean_chunk(self):
+
+        chunk = self.cleaned_data['chunk']
+        if chunk.size > settings.PIXELS_UPLOAD_CHUNK_SIZE:
+            raise forms.ValidationError(
+                _("Chunk size should not exceed {} bytes").format(
+                    settings.PIXELS_UPLOAD_CHUNK_SIZE
+                )
+            )
+        return chunk
+
+    def clean(self):
+
+        cleaned_data = super().clean()
+        chunk = cleaned_data.get('chunk')
+        if chunk is None or self.has_error('offset') or \
+                self.has_error('size') or self.has_error('checksum'):
+            return cleaned_data
+
+        if cleaned_data['offset'] + chunk.size > cleaned_data['size']:
+            raise forms.ValidationError(
+                _("Chunk exceeds the archive size")
+            )
+
+        m = hashlib.sha256()
+        for block in chunk.chunks():
+            m.update(block)
+        if m.hexdigest() != cleaned_data['checksum']:
+            # The upload script sends again chunks with checksum errors
+            self.add_error(
+                'checksum',
+                _("Chunk checksum mismatch, it should be sent again")
+            )
+
+        return cleaned_data
@@ -1,21 +1,316 @@
+import atexit
+import io
 import logging
-
-from pathlib import Path
-from shutil import copyfile
+import os
+import tarfile
+
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+from pathlib import Path, PurePosixPath
+from shutil import copyfileobj, rmtree
 from tempfile import mkdtemp
 from zipfile import ZipFile, is_zipfile
 
+from django.conf import settings
+from django.db import OperationalError
 from django.utils.translation import ugettext as _
 
-from apps.core.models import Analysis, Experiment
+from apps.core.models import Analysis, Experiment, Pixel, PixelSet
 from apps.data.models import Entry
 from apps.submission.io.xlsx import parse_template
 from .. import exceptions, signals
-from ..utils import make_absolute_path
-from .pixel import PixelSetParser
+from ..utils import sha256_digest, store_file
+from .pixel import PixelSetParser, analyze_pixels, parse_pixelset
+from .progress import ImportProgress
+from .resolver import OmicsUnitResolver
 
 logger = logging.getLogger(__name__)
 META_FILENAME = 'meta.xlsx'
+# Zstandard frame magic number
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+# PostgreSQL error code of statements canceled by the statement_timeout
+QUERY_CANCELED = '57014'
+
+# Root directory of archives members extracted by this process
+_extraction_root = None
+# Maximum number of archives whose checksum and members names are cached
+ARCHIVES_CACHE_SIZE = 32
+# Archives checksums given their (path, size, modification time)
+_checksums = OrderedDict()
+# Archives members (names and sizes) given their (path, size, modification
+# time)
+_names = OrderedDict()
+
+
+def _get_archive_key(archive_path):
+    stat = Path(archive_path).stat()
+    return (str(Path(archive_path).resolve()), stat.st_size, stat.st_mtime)
+
+
+def _cache(cache, key, value):
+    """Cache a value, the least recently cached values are dropped once
+    ARCHIVES_CACHE_SIZE values are cached (e.g. in long-lived workers)"""
+
+    cache[key] = value
+    while len(cache) > ARCHIVES_CACHE_SIZE:
+        cache.popitem(last=False)
+    return value
+
+
+def get_extraction_root():
+    """
+    Return the root directory of extracted archives members. It is created
+    once per process and removed when the process ends. Worker processes
+    forked afterwards extract members in the same directory.
+    """
+    global _extraction_root
+
+    if _extraction_root is None:
+        _extraction_root = Path(mkdtemp(prefix='pixel-archives-'))
+        atexit.register(rmtree, str(_extraction_root), ignore_errors=True)
+    return _extraction_root
+
+
+def remove_extraction_root():
+    """
+    Remove the extraction root directory of this process, if any. Processes
+    ending with os._exit() (e.g. multiprocessing children) do not run atexit
+    handlers, hence they should call this function before exiting.
+    """
+    global _extraction_root
+
+    if _extraction_root is not None:
+        rmtree(str(_extraction_root), ignore_errors=True)
+        _extraction_root = None
+
+
+def get_archive_checksum(archive_path):
+    """
+    Return an archive SHA-256 digest (computed once per archive version)
+    """
+
+    key = _get_archive_key(archive_path)
+    if key not in _checksums:
+        _cache(_checksums, key, sha256_digest(archive_path))
+    return _checksums[key]
+
+
+def import_zstandard():
+    """Import zstandard (an optional dependency) to read zstd tarballs
+
+    Raises an InvalidArchiveFormatError if zstandard is not installed
+    """
+    try:
+        import zstandard
+    except ImportError:
+        raise exceptions.InvalidArchiveFormatError(
+            _(
+                "The zstandard package is required to read zstd compressed "
+                "tarballs"
+            )
+        )
+    return zstandard
+
+
+def is_tarball(archive_path):
+    """
+    Check if a file is a (gzip or zstd compressed) tarball. Only its first
+    header is read.
+    """
+
+    try:
+        with open_tarball(archive_path) as tar:
+            return tar.next() is not None
+    except (tarfile.TarError, EOFError, OSError):
+        return False
+
+
+@contextmanager
+def open_tarball(archive_path):
+    """
+    Open a tarball in stream mode: members can only be read in the tarball
+    order, but nothing is extracted and the tarball is decompressed on the
+    fly. Gzip, bzip2 and xz compressed tarballs are handled by tarfile, zstd
+    compressed tarballs require the zstandard package.
+    """
+
+    with open(str(archive_path), 'rb') as f:
+        fileobj, mode = f, 'r|*'
+        if f.read(len(ZSTD_MAGIC)) == ZSTD_MAGIC:
+            zstandard = import_zstandard()
+            fileobj, mode = zstandard.ZstdDecompressor().stream_reader(f), 'r|'
+        f.seek(0)
+        with tarfile.open(fileobj=fileobj, mode=mode) as tar:
+            yield tar
+
+
+def get_archive_members(archive_path):
+    """
+    Return an ordered mapping of archive members names to their uncompressed
+    size (listed once per archive version). Listing a tarball members
+    decompresses it without extracting it.
+    """
+
+    key = _get_archive_key(archive_path)
+    if key not in _names:
+        if is_zipfile(str(archive_path)):
+            with ZipFile(str(archive_path)) as z:
+                members = OrderedDict(
+                    (info.filename, info.file_size) for info in z.infolist()
+                )
+        else:
+            with open_tarball(archive_path) as tar:
+                # Names are normalized (e.g. "./meta.xlsx" is "meta.xlsx")
+                members = OrderedDict()
+                for m in tar:
+                    name = str(PurePosixPath(m.name))
+                    members[name + '/' if m.isdir() else name] = m.size
+        _cache(_names, key, members)
+    return _names[key]
+
+
+def get_archive_names(archive_path):
+    """
+    Return archive members names (see get_archive_members)
+    """
+
+    return get_archive_members(archive_path).keys()
+
+
+class TarMemberReader(io.RawIOBase):
+    """A tarball member stream: the tarball is decompressed up to the member,
+    which is then read on the fly. The tarball is closed with the stream.
+    """
+
+    def __init__(self, archive_path, member):
+        self._stack = ExitStack()
+        tar = self._stack.enter_context(open_tarball(archive_path))
+        for info in tar:
+            if PurePosixPath(info.name) == member and info.isfile():
+                self._member = tar.extractfile(info)
+                return
+        self._stack.close()
+        raise FileNotFoundError(
+            _("{} not found in {}").format(member, archive_path)
+        )
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._member.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._stack.close()
+        super().close()
+
+
+class ArchiveMember(object):
+    """A file of a zip archive or a tarball. It implements the part of the
+    Path interface used by importers (name, suffix, parent, /, exists(),
+    open(), read_bytes()), so that archive files are read as streams without
+    extracting the archive.
+    """
+
+    def __init__(self, archive_path, member):
+        self.archive_path = Path(archive_path)
+        self.member = PurePosixPath(member)
+        # Members names come from the archive and meta.xlsx cells: they
+        # should not point outside the archive (see extract())
+        if self.member.is_absolute() or '..' in self.member.parts:
+            raise exceptions.UnsafeArchiveMemberError(
+                _("{} is not a valid archive file path").format(member)
+            )
+
+    def __repr__(self):
+        return 'ArchiveMember({}, {})'.format(self.archive_path, self.member)
+
+    def __str__(self):
+        return str(self.member)
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, ArchiveMember) and
+            (self.archive_path, self.member) == (
+                other.archive_path, other.member
+            )
+        )
+
+    def __hash__(self):
+        return hash((self.archive_path, self.member))
+
+    def __truediv__(self, other):
+        return ArchiveMember(self.archive_path, self.member / str(other))
+
+    @property
+    def name(self):
+        return self.member.name
+
+    @property
+    def suffix(self):
+        return self.member.suffix
+
+    @property
+    def parent(self):
+        return ArchiveMember(self.archive_path, self.member.parent)
+
+    def exists(self):
+        names = get_archive_names(self.archive_path)
+        return str(self.member) in names or '{}/'.format(self.member) in names
+
+    @property
+    def size(self):
+        """The member uncompressed size (in bytes)"""
+
+        try:
+            return get_archive_members(self.archive_path)[str(self.member)]
+        except KeyError:
+            raise FileNotFoundError(
+                _("{} not found in {}").format(self.member, self.archive_path)
+            )
+
+    def open(self, mode='rb'):
+        if mode != 'rb':
+            raise ValueError(_("Archive members can only be read"))
+        if is_zipfile(str(self.archive_path)):
+            # The archive file is closed with the returned member stream
+            return ZipFile(str(self.archive_path)).open(str(self.member))
+        return io.BufferedReader(
+            TarMemberReader(self.archive_path, self.member)
+        )
+
+    def read_bytes(self):
+        with self.open() as f:
+            return f.read()
+
+    def extract(self):
+        """
+        Extract the member (when a real file is required, e.g. to seek or
+        memory map it). Extracted members are cached per archive checksum.
+
+        Returns: the extracted file Path
+        """
+
+        destination = get_extraction_root() / get_archive_checksum(
+            self.archive_path
+        )
+        path = destination / str(self.member)
+        if destination.resolve() not in path.resolve().parents:
+            raise exceptions.UnsafeArchiveMemberError(
+                _("{} is not a valid archive file path").format(self.member)
+            )
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Members may be extracted concurrently by worker processes
+            tmp_path = path.with_name('.{}.{}'.format(path.name, os.getpid()))
+            with self.open() as src, tmp_path.open('wb') as dest:
+                copyfileobj(src, dest)
+            tmp_path.rename(path)
+        return path
 
 
 class PixelArchive(object):
@@ -28,31 +323,53 @@ class PixelArchive(object):
                 _("PixelArchive {} not found".format(archive_path))
             )
 
-        if not is_zipfile(archive_path):
+        if not is_zipfile(str(archive_path)) and not is_tarball(archive_path):
             raise exceptions.InvalidArchiveFormatError(
-                _("Pixel submission must be a zip archive")
+                _(
+                    "Pixel submission must be a zip archive or a gzip or zstd "
+                    "compressed tarball"
+                )
             )
 
         self.archive_path = archive_path
-        self.cwd = None
         self.meta = None
         self.meta_path = None
         self.files = []
 
-        self._extract()
+        # Members may be extracted by worker processes: the extraction root
+        # should be created by this process to be cleaned up
+        get_extraction_root()
+
+        self._set_files()
         self._set_meta()
         self.parse()
 
-    def _extract(self, force=False):
-
-        if self.cwd is not None and not force:
-            return
-        self.cwd = Path(mkdtemp())
+    def cleanup(self):
+        """
+        Remove members extracted from this archive and forget its cached
+        checksum and members names (long-lived import workers call it after
+        each importation).
+        """
+
+        archive_path = str(Path(self.archive_path).resolve())
+        for key in [k for k in _checksums if k[0] == archive_path]:
+            rmtree(
+                str(get_extraction_root() / _checksums.pop(key)),
+                ignore_errors=True
+            )
+        for key in [k for k in _names if k[0] == archive_path]:
+            del _names[key]
 
-        z = ZipFile(self.archive_path)
-        z.extractall(path=self.cwd)
+    def _set_files(self):
+        """
+        List archive members. Nothing is extracted: members are read as
+        streams from the archive (tarball members in the tarball order).
+        """
 
-        self.files = [f for f in self.cwd.glob('**/*')]
+        self.files = [
+            ArchiveMember(self.archive_path, n)
+            for n in get_archive_names(self.archive_path)
+        ]
 
     def _set_meta(self):
 
@@ -70,16 +387,145 @@ class PixelArchive(object):
 
         self.meta = parse_template(self.meta_path, serialized=serialized)
 
-    def save(self, pixeler, submission=None):
+    def validate(self, progress=None):
+        """
+        Check datasets before any database write: the identifiers of all
+        datasets are collected (pixels files are read by chunks) and checked
+        against entries with one query per set of repositories.
+
+        Raises a MissingEntriesError reporting all missing identifiers.
+        """
+        logger.debug('Validating datasets for {}…'.format(self.archive_path))
+
+        resolver = OmicsUnitResolver()
+        identifiers = {}
+        for dataset in self.meta['datasets']:
+            pixelset_path, omics_unit_type, strain, description = dataset
+            parser = PixelSetParser(pixelset_path)
+            repositories = resolver.get_repositories(strain)
+            for pixels in parser.iter_pixels(settings.PIXELS_CHUNK_SIZE):
+                parser.pixels = pixels
+                pixels, na, fuzzy = parser.filter(counts=True)
+                identifiers.setdefault(repositories, set()).update(
+                    pixels.index
+                )
+                if progress is not None:
+                    progress.checkpoint()
+
+        missing = set()
+        for repositories, dataset_identifiers in identifiers.items():
+            missing.update(
+                resolver.get_missing_identifiers(
+                    dataset_identifiers,
+                    repositories
+                )
+            )
+
+        if len(missing):
+            raise exceptions.MissingEntriesError(
+                _(
+                    "{} entries are missing ({}). Please load entries first "
+                    "thanks to the load_entries management command."
+                ).format(
+                    len(missing),
+                    ", ".join(sorted(missing))
+                )
+            )
+
+    def _parse_datasets(self, jobs):
+        """
+        Yield (dataset, pixels) tuples in datasets order.
+
+        With more than one job, pixels files are parsed and filtered in a
+        process pool, at most `jobs` datasets ahead of the consumer (the
+        database writer). Otherwise, pixels are None: the pixels file will be
+        streamed by the writer (by chunks).
+
+        A worker process holds a whole pixels file in memory (and sends it to
+        the writer), hence pixels files larger than
+        PIXELS_IMPORT_JOBS_MAX_FILE_SIZE bytes are always streamed.
+        """
+
+        datasets = iter(self.meta['datasets'])
+        if jobs < 2 or len(self.meta['datasets']) < 2:
+            for dataset in datasets:
+                yield dataset, None
+            return
+
+        max_size = settings.PIXELS_IMPORT_JOBS_MAX_FILE_SIZE
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            pending = deque()
+            for dataset in datasets:
+                future = None
+                if dataset[0].size <= max_size:
+                    future = executor.submit(parse_pixelset, dataset[0])
+                pending.append((dataset, future))
+                if len(pending) < jobs:
+                    continue
+                dataset, future = pending.popleft()
+                yield dataset, future and future.result()
+
+            while len(pending):
+                dataset, future = pending.popleft()
+                yield dataset, future and future.result()
+
+    def save(self, pixeler, submission=None, jobs=None):
+        """
+        Import the archive. Each pixel set is published in its own
+        transaction: when the importation is interrupted (canceled, timed out
+        or stopped by the database statement timeout), objects it created are
+        deleted before raising an ImportInterruptedError.
+        """
         logger.debug('Saving data for {}…'.format(self.archive_path))
 
+        progress = ImportProgress(submission)
+        progress.checkpoint(
+            stage=ImportProgress.STAGE_IMPORTING,
+            datasets=len(self.meta['datasets'])
+        )
+
+        created = []
+        try:
+            return self._save(pixeler, submission, jobs, progress, created)
+        except exceptions.ImportInterruptedError:
+            self._rollback(created)
+            raise
+        except OperationalError as e:
+            if getattr(e.__cause__, 'pgcode', None) != QUERY_CANCELED:
+                raise
+            self._rollback(created)
+            raise exceptions.ImportTimeoutError(
+                _(
+                    "A database statement exceeded the {} seconds statement "
+                    "timeout"
+                ).format(settings.PIXELS_IMPORT_STATEMENT_TIMEOUT)
+            ) from e
+
+    def _rollback(self, created):
+        """Delete objects created by an interrupted importation (most recent
+        first). Pixels are deleted with a single statement per pixel set."""
+
+        logger.warning(
+            'Rolling back interrupted importation of {}'.format(
+                self.archive_path
+            )
+        )
+        for instance in reversed(created):
+            if isinstance(instance, PixelSet):
+                Pixel.objects.filter(pixel_set=instance).delete()
+            instance.delete()
+
+    def _save(self, pixeler, submission, jobs, progress, created):
+
         # -- Experiment
-        experiment, _ = Experiment.objects.get_or_create(
+        experiment, is_new = Experiment.objects.get_or_create(
             description=self.meta['experiment']['summary'],
             omics_area=self.meta['experiment']['omics_area'],
             completed_at=self.meta['experiment']['completion_date'],
             released_at=self.meta['experiment']['release_date'],
         )
+        if is_new:
+            created.append(experiment)
 
         # Add missing related entries
         entry, _ = Entry.objects.get_or_create(
@@ -91,16 +537,19 @@ class PixelArchive(object):
             experiment.entries.add(entry)
 
         # -- Analysis
-        analysis, _ = Analysis.objects.get_or_create(
+        analysis, is_new = Analysis.objects.get_or_create(
             description=self.meta['analysis']['description'],
             experiments__pk__in=[experiment.pk, ],
             pixeler=pixeler,
             completed_at=self.meta['analysis']['date'],
         )
+        if is_new:
+            created.append(analysis)
 
         if submission is not None:
             submission.analysis = analysis
-            submission.save()
+            # Do not overwrite concurrent changes (e.g. cancel_requested)
+            submission.save(update_fields=['analysis'])
 
             # Update tags
             experiment.tags = submission.tags.get('experiment')
@@ -109,27 +558,17 @@ class PixelArchive(object):
             analysis.tags = submission.tags.get('analysis')
             analysis.save()
 
-        # Copy archive files to the media tree
-        relative_dest = Path(
-            Analysis.secondary_data_upload_to(
-                analysis,
-                self.meta['analysis']['secondary_data_path'].name
-            )
+        # Store archive files in the media tree: extracted files are moved
+        analysis.secondary_data.name = store_file(
+            self.meta['analysis']['secondary_data_path'],
+            move=True
         )
-        dest = make_absolute_path(relative_dest)
-        copyfile(self.meta['analysis']['secondary_data_path'], dest)
-        analysis.secondary_data.name = relative_dest
 
         if len(self.meta['analysis']['notebook_path'].name):
-            relative_dest = Path(
-                Analysis.notebook_upload_to(
-                    analysis,
-                    self.meta['analysis']['notebook_path'].name
-                )
+            analysis.notebook.name = store_file(
+                self.meta['analysis']['notebook_path'],
+                move=True
             )
-            dest = make_absolute_path(relative_dest)
-            copyfile(self.meta['analysis']['notebook_path'], dest)
-            analysis.notebook.name = relative_dest
 
         analysis.save()
 
@@ -140,18 +579,38 @@ class PixelArchive(object):
 
         # -- Pixels
         pixel_sets = []
-        for dataset in self.meta['datasets']:
+        # Identifiers are resolved once for all datasets
+        resolver = OmicsUnitResolver()
+        if jobs is None:
+            jobs = settings.PIXELS_IMPORT_JOBS
+        for dataset, pixels in self._parse_datasets(jobs):
             pixelset_path, omics_unit_type, strain, description = dataset
             parser = PixelSetParser(
                 pixelset_path,
                 description=description,
                 analysis=analysis,
                 omics_unit_type=omics_unit_type,
-                strain=strain
+                strain=strain,
+                resolver=resolver,
+                experiment=experiment,
+                move=True,
+                progress=progress
             )
-            parser.parse()
-            parser.save()
+            try:
+                if pixels is None:
+                    parser.stream(settings.PIXELS_CHUNK_SIZE, analyze=False)
+                else:
+                    parser.pixels = pixels
+                    parser.save(analyze=False)
+            finally:
+                if parser.pixelset_created:
+                    created.append(parser.pixelset)
             pixel_sets.append(parser.pixelset)
+            progress.add(datasets_done=1)
+        # Refresh planner statistics once for all pixel sets
+        progress.checkpoint(stage=ImportProgress.STAGE_ANALYZING)
+        analyze_pixels()
+        progress.checkpoint(stage=ImportProgress.STAGE_DONE)
 
         # Spread the word!
         logger.debug(
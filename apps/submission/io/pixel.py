@@ -1,19 +1,86 @@
 import logging
+import uuid
 
-from pathlib import Path
-from shutil import copyfile
+from pathlib import Path, PurePath
 
+import numpy
 import pandas
 
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
 from django.utils.translation import ugettext as _
 
-from apps.core.models import OmicsUnit, Pixel, PixelSet
-from apps.data.models import Entry
+from apps.core.db import copy_from_dataframe, random_uuids
+from apps.core.models import Pixel, PixelSet
 from ..exceptions import PixelSetParserError, PixelSetParserSaveError
-from ..utils import make_absolute_path
+from ..utils import make_absolute_path, store_file
+from .resolver import OmicsUnitResolver
 
 logger = logging.getLogger(__name__)
 
+PIXELS_COLUMNS = ('Value', 'Quality_score')
+# Columnar pixels file formats (read thanks to pyarrow) given the file
+# extension. Feather (v2) files are Arrow IPC files, both are read as Feather
+# files (Feather v1 files are supported as well).
+COLUMNAR_FORMATS = {
+    '.parquet': 'parquet',
+    '.feather': 'arrow',
+    '.arrow': 'arrow',
+}
+
+
+def get_pixelset_format(pixelset_path):
+    """Return a pixels file format given its extension: 'parquet', 'arrow'
+    (Arrow IPC or Feather) or 'text' (whitespace-delimited) for any other
+    extension
+    """
+    suffix = PurePath(str(pixelset_path)).suffix
+    return COLUMNAR_FORMATS.get(suffix.lower(), 'text')
+
+
+def import_pyarrow():
+    """Import pyarrow (an optional dependency) to read columnar pixels files
+
+    Raises a PixelSetParserError if pyarrow is not installed
+    """
+    try:
+        import pyarrow
+        import pyarrow.feather
+        import pyarrow.parquet
+    except ImportError:
+        raise PixelSetParserError(
+            _(
+                "The pyarrow package is required to read Parquet, Feather "
+                "and Arrow pixels files"
+            )
+        )
+    return pyarrow
+
+
+def parse_pixelset(pixelset_path):
+    """Parse and filter a pixels file. No database access is performed, so
+    that this function can run in a worker process.
+
+    Returns: filtered pixels DataFrame
+    """
+    parser = PixelSetParser(pixelset_path)
+    parser.parse()
+    pixels, na, fuzzy = parser.filter(counts=True)
+    logger.debug(
+        'Parsed {} pixels from {} ({} NA and {} fuzzy pixels ignored)'.format(
+            len(pixels), pixelset_path.name, na, fuzzy
+        )
+    )
+    return pixels
+
+
+def analyze_pixels():
+    """Refresh the pixels table planner statistics (PostgreSQL only)"""
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE core_pixel')
+
 
 class PixelSetParser(object):
 
@@ -22,15 +89,31 @@ class PixelSetParser(object):
                  description=None,
                  analysis=None,
                  omics_unit_type=None,
-                 strain=None):
+                 strain=None,
+                 resolver=None,
+                 experiment=None,
+                 move=False,
+                 progress=None):
 
         self.pixelset = None
+        # The PixelSet has been created by this parser
+        self.pixelset_created = False
         self.pixelset_path = pixelset_path
         self.description = description
         self.analysis = analysis
         self.omics_unit_type = omics_unit_type
         self.strain = strain
+        # Experiment used to set PixelSet cached omics areas
+        self.experiment = experiment
+        # Move the pixels file to the media tree rather than copying it
+        self.move = move
+        # Identifiers resolver (may be shared by many parsers)
+        self.resolver = resolver or OmicsUnitResolver()
+        # Importation progress checkpoints (see ImportProgress)
+        self.progress = progress
         self.pixels = None
+        # OmicsUnits already processed while streaming pixels by chunks
+        self.seen_omics_units = None
         self.db_pixels = {
             'new': [],
             'update': [],
@@ -45,28 +128,147 @@ class PixelSetParser(object):
             )
             return
 
-        self.pixels = pandas.read_csv(
-            self.pixelset_path,
+        if get_pixelset_format(self.pixelset_path) == 'text':
+            with self.pixelset_path.open('rb') as f:
+                self.pixels = self._read_csv(f)
+        else:
+            self.pixels = pandas.concat(list(self._iter_columnar()))
+
+    def _read_csv(self, f, **kwargs):
+        """
+        Read the pixels file from the f stream (the pixels file may be an
+        archive member). Values are explicitly parsed as floats so that pandas
+        does not need to infer column types (or fall back to objects).
+        """
+
+        return pandas.read_csv(
+            f,
             delim_whitespace=True,
-            index_col=0
+            index_col=0,
+            dtype={
+                'Value': 'float64',
+                'Quality_score': 'float64',
+            },
+            **kwargs
         )
 
-    def filter(self, na_filter=True, fuzzy_filter=True):
+    def _get_columns(self, names):
+        """
+        Return the columnar pixels file columns to read: the identifiers
+        column (the first column that is not a pixels column) and pixels
+        columns
+        """
+
+        missing = [c for c in PIXELS_COLUMNS if c not in names]
+        identifiers = [n for n in names if n not in PIXELS_COLUMNS]
+        if len(missing) or not len(identifiers):
+            raise PixelSetParserError(
+                _(
+                    "Invalid pixels file {}: an identifiers column and the {} "
+                    "columns are required"
+                ).format(self.pixelset_path.name, ", ".join(PIXELS_COLUMNS))
+            )
+        return [identifiers[0]] + list(PIXELS_COLUMNS)
+
+    def _iter_columnar(self, chunk_size=None):
+        """
+        Yield pixels DataFrames of (at most) chunk_size rows (or a single
+        DataFrame if chunk_size is None) from a columnar pixels file. Only
+        required columns are read, and values are converted from their binary
+        representation. Arrow IPC and Feather files are memory mapped.
+        """
+
+        pyarrow = import_pyarrow()
+        path = self.pixelset_path
+        if not isinstance(path, Path):
+            # Archive members are extracted as columnar files are not read
+            # sequentially
+            path = path.extract()
+        path = str(path)
+
+        try:
+            yield from self._read_columnar(pyarrow, path, chunk_size)
+        except pyarrow.ArrowException as e:
+            raise PixelSetParserError(
+                _("Invalid pixels file {}: {}").format(
+                    self.pixelset_path.name,
+                    e
+                )
+            ) from e
+
+    def _read_columnar(self, pyarrow, path, chunk_size):
+
+        if get_pixelset_format(self.pixelset_path) == 'parquet':
+            parquet_file = pyarrow.parquet.ParquetFile(path)
+            columns = self._get_columns(parquet_file.schema_arrow.names)
+            if chunk_size is None:
+                tables = [parquet_file.read(columns=columns)]
+            else:
+                tables = (
+                    pyarrow.Table.from_batches([batch])
+                    for batch in parquet_file.iter_batches(
+                        batch_size=chunk_size,
+                        columns=columns
+                    )
+                )
+        else:
+            table = pyarrow.feather.read_table(path, memory_map=True)
+            columns = self._get_columns(table.schema.names)
+            table = table.select(columns)
+            if chunk_size is None:
+                tables = [table]
+            else:
+                tables = (
+                    table.slice(offset, chunk_size)
+                    for offset in range(0, table.num_rows, chunk_size)
+                )
+
+        for table in tables:
+            yield table.to_pandas(
+                ignore_metadata=True
+            ).set_index(
+                columns[0]
+            ).astype({c: 'float64' for c in PIXELS_COLUMNS})
+
+    def iter_pixels(self, chunk_size):
+        """
+        Yield pixels DataFrames of (at most) chunk_size rows
+        """
+
+        if get_pixelset_format(self.pixelset_path) != 'text':
+            yield from self._iter_columnar(chunk_size=chunk_size)
+            return
+
+        with self.pixelset_path.open('rb') as f:
+            yield from self._read_csv(f, chunksize=chunk_size)
+
+    def filter(self, na_filter=True, fuzzy_filter=True, counts=False):
+        """
+        Filter out NA pixels (with a missing value or quality score) and fuzzy
+        pixels (whose identifier lists many omics units, e.g. "A;B").
+
+        Returns: filtered pixels, NA pixels and fuzzy pixels. If counts is
+        True, the number of NA and fuzzy pixels are returned instead of their
+        DataFrames, so that only the filtered pixels are copied (e.g. for each
+        chunk of a streamed pixels file).
+        """
 
         if self.pixels is None:
             return None, None, None
 
         pixels = self.pixels
-        na = pixels[pixels.isna().any(axis=1)]
-        fuzzy = pixels.filter(like=';', axis=0)
+        na = pixels.isna().any(axis=1).values
+        fuzzy = pixels.index.str.contains(';', regex=False, na=False)
 
+        keep = numpy.ones(len(pixels), dtype=bool)
         if na_filter:
-            pixels = pixels.dropna()
-
+            keep &= ~na
         if fuzzy_filter:
-            pixels = pixels.loc[pixels.index.drop(fuzzy.index), :]
+            keep &= ~fuzzy
 
-        return pixels, na, fuzzy
+        if counts:
+            return pixels[keep], int(na.sum()), int(fuzzy.sum())
+        return pixels[keep], pixels[na], pixels[fuzzy]
 
     def _set_pixel_set(self):
 
@@ -82,25 +284,25 @@ class PixelSetParser(object):
             "Will set PixelSet for file: {}".format(self.pixelset_path.name)
         )
 
-        self.pixelset, __ = PixelSet.objects.get_or_create(
+        self.pixelset, self.pixelset_created = PixelSet.objects.get_or_create(
             pixels_file__contains=self.pixelset_path.name,
             description=self.description,
             analysis=self.analysis,
         )
 
-        # Copy pixels file where appropriated and update record
-        relative_dest = Path(
-            PixelSet.pixelset_upload_to(
-                self.pixelset,
-                self.pixelset_path.name
-            )
-        )
-        dest = make_absolute_path(relative_dest)
-        copyfile(self.pixelset_path, dest)
+        # Store pixels file (once) and update record. Pixels are then read
+        # from the stored file (the source may have been moved or be an
+        # archive member).
+        relative_dest = store_file(self.pixelset_path, move=self.move)
+        self.pixelset_path = make_absolute_path(relative_dest)
         self.pixelset.pixels_file.name = relative_dest
         self.pixelset.save()
 
     def _get_omics_units(self, pixels, verbose=False):
+        """
+        Return a Series indexed by pixels identifiers with the related
+        OmicsUnit primary key as values (see OmicsUnitResolver).
+        """
 
         if any((self.strain is None, self.omics_unit_type is None)):
             raise PixelSetParserSaveError(
@@ -110,105 +312,352 @@ class PixelSetParser(object):
                 )
             )
 
-        identifiers = pixels.axes[0].tolist()
-        existing = OmicsUnit.objects.filter(
-            strain=self.strain,
-            type=self.omics_unit_type
-        ).values_list('reference__identifier', flat=True)
-
-        to_create = [
-            p for p in identifiers if p not in existing
-        ]
-
-        related_entries = Entry.objects.filter(identifier__in=to_create)
+        return self.resolver.resolve(
+            pixels.index.tolist(),
+            self.strain,
+            self.omics_unit_type
+        )
 
-        if related_entries.count() != len(to_create):
-            missing_entries = list(set(
-                to_create
-            ).difference(
-                set(related_entries.values_list('identifier', flat=True))
-            ))
-            raise PixelSetParserSaveError(
-                _(
-                    "{} entries are missing ({}). Please load entries first "
-                    "thanks to the load_entries management command."
-                ).format(
-                    len(missing_entries),
-                    ", ".join(missing_entries)
+    def _to_frame(self):
+        """
+        Return a DataFrame with one row per pixel to save. Columns are named
+        after the `core_pixel` table columns (except the primary key), plus a
+        boolean `existing` column that tells whether the pixel already exists
+        in the PixelSet or not.
+        """
+
+        if self.pixelset is None:
+            self._set_pixel_set()
+        pixels, na, fuzzy = self.filter(counts=True)
+        logger.debug('Ignored {} NA and {} fuzzy pixels'.format(na, fuzzy))
+
+        frame = pixels.assign(
+            omics_unit_id=self._get_omics_units(pixels).values
+        )
+        # An entry and its aliases resolve to the same OmicsUnit: we only keep
+        # the first pixel.
+        duplicated = frame['omics_unit_id'].duplicated()
+        for identifier in frame.index[duplicated]:
+            logger.warning(
+                'Ignored duplicated pixel {} (same omics unit)'.format(
+                    identifier
                 )
             )
-
-        omics_units = []
-        for entry in related_entries:
-            omics_units.append(
-                OmicsUnit(
-                    reference=entry,
-                    strain=self.strain,
-                    type=self.omics_unit_type,
+        frame = frame[~duplicated]
+        if self.seen_omics_units is not None:
+            duplicated = frame['omics_unit_id'].isin(self.seen_omics_units)
+            for identifier in frame.index[duplicated]:
+                logger.warning(
+                    'Ignored duplicated pixel {} (same omics unit)'.format(
+                        identifier
+                    )
                 )
-            )
-        OmicsUnit.objects.bulk_create(omics_units)
+            frame = frame[~duplicated]
+            self.seen_omics_units.update(frame['omics_unit_id'])
 
-        return OmicsUnit.objects.filter(
-            reference__identifier__in=identifiers,
-            strain=self.strain,
-            type=self.omics_unit_type,
+        # Pixels to update are those already existing for this PixelSet
+        existing = set(
+            Pixel.objects.filter(
+                omics_unit_id__in=frame['omics_unit_id'].tolist(),
+                pixel_set=self.pixelset,
+            ).values_list(
+                'omics_unit_id',
+                flat=True
+            )
         )
 
+        return pandas.DataFrame({
+            'value': frame['Value'].values,
+            'quality_score': frame['Quality_score'].values,
+            'omics_unit_id': frame['omics_unit_id'].values,
+            'pixel_set_id': self.pixelset.pk,
+            'existing': frame['omics_unit_id'].isin(existing).values,
+        }, columns=(
+            'value',
+            'quality_score',
+            'omics_unit_id',
+            'pixel_set_id',
+            'existing',
+        ))
+
+    def _to_instances(self, frame):
+
+        return [
+            Pixel(
+                value=value,
+                quality_score=quality_score,
+                omics_unit_id=omics_unit_id,
+                pixel_set=self.pixelset,
+            )
+            for value, quality_score, omics_unit_id in zip(
+                frame['value'],
+                frame['quality_score'],
+                frame['omics_unit_id'],
+            )
+        ]
+
     def _to_pixels(self):
 
         if self.pixels is None:
             return
 
-        self._set_pixel_set()
-        pixels, na, fuzzy = self.filter()
-
-        # Pixels and OmicsUnits are sorted by OmicsUnit reference identifier
-        omics_units = self._get_omics_units(pixels)
-
-        # Look for existing Pixels
-        identifiers = pixels.axes[0].tolist()
-        existing = Pixel.objects.filter(
-            omics_unit__reference__identifier__in=identifiers,
-            pixel_set=self.pixelset,
-        ).values_list(
-            'omics_unit__reference__identifier',
-            flat=True
+        frame = self._to_frame()
+        self.db_pixels['new'] = self._to_instances(frame[~frame['existing']])
+        self.db_pixels['update'] = self._to_instances(
+            frame[frame['existing']]
         )
 
-        for omics_unit in omics_units:
-            identifier = omics_unit.reference.identifier
-            pixel = pixels.ix[identifier]
-            db_pixel = Pixel(
-                value=pixel.Value,
-                quality_score=pixel.Quality_score,
-                omics_unit=omics_unit,
-                pixel_set=self.pixelset,
-            )
-            if identifier in existing:
-                self.db_pixels['update'].append(db_pixel)
-            else:
-                self.db_pixels['new'].append(db_pixel)
+    def _report_progress(self, **increments):
 
-    def save(self, update=False):
+        if self.progress is not None:
+            self.progress.add(**increments)
 
-        self._to_pixels()
+    def _use_copy(self):
+        """
+        Pixels are written thanks to PostgreSQL COPY unless the "orm"
+        ingestion backend is configured (or for other databases).
+        """
+
+        return (
+            settings.PIXELS_INGESTION_BACKEND == 'copy' and
+            connection.vendor == 'postgresql'
+        )
+
+    def _copy(self, chunks, update=False):
+        """
+        Write pixels chunks through a temporary staging table (not written to
+        the WAL, and dropped with the database session even if the worker is
+        killed): each chunk is streamed to the staging table with COPY (no
+        Pixel model instance is created). Once staged rows have been counted,
+        new pixels are moved to the `core_pixel` table with a single
+        `INSERT ... SELECT` statement in a transaction, so that PixelSet pixels
+        become visible at once. If `update` is True, existing pixels whose
+        value or quality score differs are updated in the same transaction,
+        with a single `UPDATE ... FROM` statement.
+
+        Returns the number of inserted, existing and changed pixels.
+        """
+
+        table = 'core_pixel_staging_{}'.format(uuid.uuid4().hex)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE {} ('
+                '  id uuid,'
+                '  value double precision,'
+                '  quality_score double precision,'
+                '  omics_unit_id uuid,'
+                '  pixel_set_id uuid,'
+                '  existing boolean'
+                ')'.format(table)
+            )
+            try:
+                staged = 0
+                for pixels in chunks:
+                    self.pixels = pixels
+                    frame = self._to_frame()
+                    frame.insert(0, 'id', random_uuids(len(frame)))
+                    staged += copy_from_dataframe(cursor, table, frame)
+                    self._report_progress(rows_parsed=len(pixels))
+
+                return self._publish(cursor, table, staged, update=update)
+            finally:
+                try:
+                    cursor.execute('DROP TABLE IF EXISTS {}'.format(table))
+                except DatabaseError:
+                    # An outer transaction has been aborted: the staging table
+                    # creation will be rolled back with it
+                    logger.debug(
+                        'Staging table {} has not been dropped'.format(table)
+                    )
+
+    def _publish(self, cursor, table, staged, update=False):
+        """
+        Move staged pixels to the `core_pixel` table (see the _copy() method)
+        """
+
+        cursor.execute(
+            'SELECT count(*), count(*) FILTER (WHERE existing)'
+            ' FROM {}'.format(table)
+        )
+        count, existing = cursor.fetchone()
+        if count != staged:
+            raise PixelSetParserSaveError(
+                _(
+                    "{} pixels have been staged instead of {}, the PixelSet "
+                    "has not been saved"
+                ).format(count, staged)
+            )
 
-        # Create news entries
-        Pixel.objects.bulk_create(self.db_pixels['new'], batch_size=500)
+        with transaction.atomic():
+            cursor.execute(
+                'INSERT INTO core_pixel'
+                '  (id, value, quality_score, omics_unit_id, pixel_set_id)'
+                ' SELECT id, value, quality_score, omics_unit_id, pixel_set_id'
+                ' FROM {}'
+                ' WHERE NOT existing'.format(table)
+            )
+            inserted = cursor.rowcount
+
+            if not update or not existing:
+                return inserted, existing, 0
+
+            cursor.execute(
+                'UPDATE core_pixel p'
+                ' SET'
+                '  value = s.value,'
+                '  quality_score = s.quality_score'
+                ' FROM {} s'
+                ' WHERE'
+                '  s.existing'
+                '  AND p.pixel_set_id = s.pixel_set_id'
+                '  AND p.omics_unit_id = s.omics_unit_id'
+                '  AND ('
+                '    p.value IS DISTINCT FROM s.value'
+                '    OR p.quality_score IS DISTINCT FROM s.quality_score'
+                '  )'.format(table)
+            )
+            changed = cursor.rowcount
+
+        return inserted, existing, changed
+
+    def _write(self, chunks, update=False):
+        """
+        Write pixels chunks to the database in a single transaction (see the
+        save() method)
+        """
+
+        if self._use_copy():
+            inserted, existing, changed = self._copy(chunks, update=update)
+        else:
+            inserted = existing = changed = 0
+            with transaction.atomic():
+                for pixels in chunks:
+                    self.pixels = pixels
+                    self._to_pixels()
+                    self._report_progress(rows_parsed=len(pixels))
+
+                    # Create news entries
+                    Pixel.objects.bulk_create(
+                        self.db_pixels['new'],
+                        batch_size=500
+                    )
+                    inserted += len(self.db_pixels['new'])
+
+                    # Update changed entries
+                    to_update = self.db_pixels['update'] if update else []
+                    for updated_pixel in to_update:
+                        changed += Pixel.objects.filter(
+                            omics_unit_id=updated_pixel.omics_unit_id,
+                            pixel_set=updated_pixel.pixel_set
+                        ).exclude(
+                            value=updated_pixel.value,
+                            quality_score=updated_pixel.quality_score
+                        ).update(
+                            value=updated_pixel.value,
+                            quality_score=updated_pixel.quality_score
+                        )
+                    existing += len(self.db_pixels['update'])
+
+        self._report_progress(rows_inserted=inserted)
+
+        return {
+            'inserted': inserted,
+            'changed': changed,
+            'unchanged': existing - changed,
+        }
 
-        # Populate PixelSet cached fields
-        self.pixelset.update_cached_fields()
+    def _update_cached_fields(self):
+        """
+        Populate PixelSet cached fields from the parser strain, omics unit
+        type and experiment instead of scanning saved pixels. Values already
+        cached for the PixelSet are kept.
+
+        With the PIXELS_VERIFY_CACHED_FIELDS setting, cached fields are then
+        checked against (and replaced by) a full rescan.
+        """
+
+        pixelset = self.pixelset
+        if self.experiment is not None:
+            omics_areas = {self.experiment.omics_area.name}
+        else:
+            omics_areas = pixelset.get_omics_areas()
+
+        pixelset.set_cached_fields(
+            set(pixelset.cached_species) | {self.strain.species.name},
+            set(pixelset.cached_omics_unit_types) | {
+                self.omics_unit_type.name
+            },
+            set(pixelset.cached_omics_areas) | omics_areas,
+        )
 
-        if not update:
+        if not settings.PIXELS_VERIFY_CACHED_FIELDS:
             return
 
-        # Update old entries
-        for updated_pixel in self.db_pixels['update']:
-            pixel = Pixel.objects.get(
-                omics_unit=updated_pixel.omics_unit,
-                pixel_set=updated_pixel.pixel_set
+        cached = (
+            pixelset.cached_species,
+            pixelset.cached_omics_unit_types,
+            pixelset.cached_omics_areas,
+        )
+        pixelset.update_cached_fields()
+        scanned = (
+            pixelset.cached_species,
+            pixelset.cached_omics_unit_types,
+            pixelset.cached_omics_areas,
+        )
+        if cached != scanned:
+            logger.warning(
+                'PixelSet {} cached fields {} differ from scanned {}'.format(
+                    pixelset.pk, cached, scanned
+                )
             )
-            pixel.value = updated_pixel.value
-            pixel.quality_score = updated_pixel.quality_score
-            pixel.save(update_fields=['value', 'quality_score'])
+
+    def save(self, update=False, analyze=True):
+        """
+        Save parsed pixels. Existing pixels of the PixelSet are updated if
+        `update` is True, and only when their value or quality score has
+        changed. Planner statistics of the pixels table are refreshed if
+        `analyze` is True.
+
+        Returns a dictionary with the number of `inserted`, `changed` and
+        `unchanged` (existing pixels left untouched) pixels.
+        """
+
+        stats = self._write([self.pixels], update=update)
+
+        self._update_cached_fields()
+
+        if analyze:
+            analyze_pixels()
+
+        return stats
+
+    def stream(self, chunk_size, update=False, analyze=True):
+        """
+        Read, filter and write pixels by chunks of chunk_size rows: a chunk is
+        written (staged) before the next one is read, so that memory usage
+        does not depend on the pixels file size. Pixels of an OmicsUnit
+        already written from a previous chunk are ignored. Pixels only become
+        visible once all chunks have been written.
+
+        Returns cumulated pixels counts (see the save() method).
+        """
+
+        self._set_pixel_set()
+        self.seen_omics_units = set()
+        try:
+            stats = self._write(self.iter_pixels(chunk_size), update=update)
+        finally:
+            self.seen_omics_units = None
+            self.pixels = None
+            self.db_pixels = {
+                'new': [],
+                'update': [],
+            }
+
+        self._update_cached_fields()
+
+        if analyze:
+            analyze_pixels()
+
+        return stats
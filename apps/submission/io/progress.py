@@ -0,0 +1,100 @@
+import logging
+
+from time import monotonic
+
+from django.conf import settings
+from django.utils.timezone import now
+from django.utils.translation import ugettext as _
+
+from ..exceptions import ImportCanceledError, ImportTimeoutError
+from ..models import SubmissionProcess
+
+logger = logging.getLogger(__name__)
+
+
+class ImportProgress(object):
+    """Archive importation progress checkpoints: the current stage, the number
+    of imported datasets and of parsed and inserted pixels rows.
+
+    The progress record of the submission process (if any) is updated with a
+    single UPDATE statement when the stage or the number of imported datasets
+    changes, and at most every PIXELS_PROGRESS_INTERVAL seconds otherwise.
+
+    Checkpoints also interrupt the importation when it runs for longer than
+    PIXELS_IMPORT_TIMEOUT seconds, or when it has been canceled: the progress
+    UPDATE statement skips canceled submissions, hence cancellation requests
+    are detected without extra queries.
+    """
+
+    STAGE_IMPORTING = 'importing'
+    STAGE_ANALYZING = 'analyzing'
+    STAGE_DONE = 'done'
+
+    def __init__(self, submission=None, interval=None, timeout=None):
+        self.submission = submission
+        if interval is None:
+            interval = settings.PIXELS_PROGRESS_INTERVAL
+        self.interval = interval
+        if timeout is None:
+            timeout = settings.PIXELS_IMPORT_TIMEOUT
+        self.timeout = timeout
+        self.deadline = monotonic() + timeout if timeout else None
+        self.record = {
+            'stage': None,
+            'datasets': 0,
+            'datasets_done': 0,
+            'rows_parsed': 0,
+            'rows_inserted': 0,
+        }
+        self._written_at = None
+        self.canceled = False
+
+    def checkpoint(self, **values):
+        """Set progress values, e.g. checkpoint(stage='analyzing')"""
+
+        force = any(
+            self.record[k] != values[k]
+            for k in ('stage', 'datasets', 'datasets_done') if k in values
+        )
+        self.record.update(values)
+        self.write(force=force)
+        self.check()
+
+    def add(self, **increments):
+        """Increment progress counters, e.g. add(rows_parsed=1000)"""
+
+        self.checkpoint(**{
+            k: self.record[k] + v for k, v in increments.items()
+        })
+
+    def write(self, force=False):
+        """Write the progress record (throttled unless force is True)"""
+
+        if self.submission is None:
+            return
+        if not force and self._written_at is not None and \
+                monotonic() - self._written_at < self.interval:
+            return
+
+        progress = dict(self.record, updated_at=now())
+        updated = SubmissionProcess.objects.filter(
+            pk=self.submission.pk,
+            cancel_requested=False,
+        ).update(progress=progress)
+        self.canceled = not updated
+        self.submission.progress = progress
+        self._written_at = monotonic()
+        logger.debug('Importation progress: {}'.format(progress))
+
+    def check(self):
+        """Raise ImportTimeoutError once the deadline is passed, and
+        ImportCanceledError if the importation has been canceled"""
+
+        if self.deadline is not None and monotonic() > self.deadline:
+            raise ImportTimeoutError(
+                _("Importation exceeded the {} seconds timeout").format(
+                    self.timeout
+                )
+            )
+        if self.canceled:
+            raise ImportCanceledError(_("Importation has been canceled"))
@@ -0,0 +1,217 @@
+import logging
+
+import pandas
+
+from django.db import connection
+from django.utils.translation import ugettext as _
+
+from apps.core.db import random_uuids
+from apps.core.models import OmicsUnit
+from apps.data.models import Alias, Entry
+from ..exceptions import PixelSetParserSaveError
+
+logger = logging.getLogger(__name__)
+
+
+class OmicsUnitResolver(object):
+    """
+    Resolve pixels identifiers to OmicsUnit primary keys.
+
+    Identifier to entry maps are loaded once per set of repositories, and
+    entry to OmicsUnit maps are loaded once per (strain, omics unit type), so
+    that a resolver can be shared by all PixelSetParser instances of an
+    archive.
+    """
+
+    def __init__(self):
+
+        # Repositories ids tuple (or None) -> {identifier: entry_id}
+        self.entries = {}
+        # (strain_id, type_id) -> {entry_id: omics_unit_id}
+        self.omics_units = {}
+
+    def get_repositories(self, strain):
+        """
+        Entries are looked up in the strain species repository (if any),
+        otherwise in all repositories (None).
+        """
+
+        repository_id = strain.species.repository_id
+        if repository_id is None:
+            return None
+        return (repository_id, )
+
+    def get_entries(self, repositories):
+        """
+        Return a dictionary mapping identifiers (entries identifiers and
+        aliases) to an entry primary key. An entry identifier always takes
+        precedence over an alias.
+        """
+
+        if repositories in self.entries:
+            return self.entries[repositories]
+
+        entries = Entry.objects.all()
+        aliases = Alias.objects.all()
+        if repositories is not None:
+            entries = entries.filter(repository_id__in=repositories)
+            aliases = aliases.filter(repository_id__in=repositories)
+
+        mapping = {}
+        for qs, column in ((aliases, 'entry_id'), (entries, 'id')):
+            # The same identifier may exist in many repositories: the first
+            # repository (by name) wins.
+            frame = pandas.DataFrame.from_records(
+                list(
+                    qs.order_by('repository__name').values_list(
+                        'identifier',
+                        column
+                    )
+                ),
+                columns=('identifier', 'pk')
+            ).drop_duplicates('identifier')
+            mapping.update(zip(frame['identifier'], frame['pk']))
+
+        self.entries[repositories] = mapping
+        return mapping
+
+    def get_missing_identifiers(self, identifiers, repositories):
+        """
+        Return the set of identifiers that match neither an entry nor an
+        alias, thanks to a single query. Nothing is cached.
+        """
+
+        condition = ''
+        if repositories is not None:
+            condition = ' AND {table}.repository_id = ANY(%(repositories)s)'
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT t.identifier'
+                ' FROM unnest(%(identifiers)s::text[]) AS t(identifier)'
+                ' WHERE NOT EXISTS ('
+                '  SELECT 1 FROM data_entry e'
+                '  WHERE e.identifier = t.identifier' +
+                condition.format(table='e') +
+                ' ) AND NOT EXISTS ('
+                '  SELECT 1 FROM data_alias a'
+                '  WHERE a.identifier = t.identifier' +
+                condition.format(table='a') +
+                ' )',
+                {
+                    'identifiers': list(identifiers),
+                    'repositories': list(repositories or ()),
+                }
+            )
+            return set(identifier for identifier, in cursor.fetchall())
+
+    def get_omics_units(self, strain, omics_unit_type, repositories):
+        """
+        Return a dictionary mapping entries primary keys to the related
+        OmicsUnit primary key for a strain and an omics unit type.
+        """
+
+        key = (strain.pk, omics_unit_type.pk)
+        if key in self.omics_units:
+            return self.omics_units[key]
+
+        omics_units = OmicsUnit.objects.filter(
+            strain=strain,
+            type=omics_unit_type,
+        )
+        if repositories is not None:
+            omics_units = omics_units.filter(
+                reference__repository_id__in=repositories
+            )
+
+        self.omics_units[key] = dict(
+            omics_units.values_list('reference_id', 'id')
+        )
+        return self.omics_units[key]
+
+    def _create_omics_units(self, entry_ids, strain, omics_unit_type):
+        """
+        Create missing omics units with a single INSERT statement; omics units
+        created concurrently are ignored (and fetched).
+
+        Returns a dictionary mapping entries primary keys to the created
+        OmicsUnit primary key.
+        """
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO core_omicsunit'
+                '  (id, reference_id, strain_id, type_id, status)'
+                ' SELECT id, reference_id, %s, %s, %s'
+                ' FROM unnest(%s::uuid[], %s::uuid[]) AS t(id, reference_id)'
+                ' ON CONFLICT (reference_id, strain_id, type_id) DO NOTHING'
+                ' RETURNING reference_id, id',
+                [
+                    strain.pk,
+                    omics_unit_type.pk,
+                    OmicsUnit.STATUS_DUBIOUS,
+                    random_uuids(len(entry_ids)),
+                    [str(pk) for pk in entry_ids],
+                ]
+            )
+            created = dict(cursor.fetchall())
+
+        conflicts = set(entry_ids).difference(created)
+        if len(conflicts):
+            created.update(
+                OmicsUnit.objects.filter(
+                    reference_id__in=conflicts,
+                    strain=strain,
+                    type=omics_unit_type,
+                ).values_list('reference_id', 'id')
+            )
+
+        return created
+
+    def resolve(self, identifiers, strain, omics_unit_type):
+        """
+        Return a Series indexed by identifiers with the related OmicsUnit
+        primary key as values. Missing omics units are created.
+
+        Raises a PixelSetParserSaveError if an identifier does not match any
+        entry.
+        """
+
+        repositories = self.get_repositories(strain)
+        entries = self.get_entries(repositories)
+
+        entry_ids = pandas.Series(
+            [entries.get(identifier) for identifier in identifiers],
+            index=identifiers,
+            dtype=object
+        )
+        missing = entry_ids.isna()
+        if missing.any():
+            # Entries may be loaded before the next resolution
+            del self.entries[repositories]
+            missing_entries = entry_ids.index[missing].unique().tolist()
+            raise PixelSetParserSaveError(
+                _(
+                    "{} entries are missing ({}). Please load entries first "
+                    "thanks to the load_entries management command."
+                ).format(
+                    len(missing_entries),
+                    ", ".join(missing_entries)
+                )
+            )
+
+        omics_units = self.get_omics_units(
+            strain,
+            omics_unit_type,
+            repositories
+        )
+        to_create = set(entry_ids).difference(omics_units)
+        if len(to_create):
+            logger.debug(
+                'Will create {} omics units'.format(len(to_create))
+            )
+            omics_units.update(
+                self._create_omics_units(to_create, strain, omics_unit_type)
+            )
+
+        return entry_ids.map(omics_units)
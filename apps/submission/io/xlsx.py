@@ -1,6 +1,7 @@
 import datetime
 import hashlib
 import re
+from io import BytesIO
 from pathlib import Path
 from zipfile import ZipFile
 
@@ -13,6 +14,8 @@ from openpyxl.worksheet.datavalidation import DataValidation
 from apps.core.models import OmicsArea, OmicsUnitType, Strain
 from apps.data.models import Repository
 from .. import exceptions
+from ..exceptions import PixelSetParserError
+from .pixel import get_pixelset_format, import_pyarrow
 
 
 def style_range(ws,
@@ -340,7 +343,8 @@ def generate_template(filename):
 
 def parse_template(meta_path, serialized=False):
 
-    wb = load_workbook(meta_path)
+    # meta_path may be an archive member: the workbook is read from memory
+    wb = load_workbook(BytesIO(meta_path.read_bytes()))
     ws = wb.active
 
     meta = {
@@ -475,6 +479,16 @@ def parse_template(meta_path, serialized=False):
             raise exceptions.MetaFileParsingError(
                 _("Dataset file {} not found").format(dataset_path.name)
             )
+        if get_pixelset_format(dataset_path) != 'text':
+            # Parquet, Feather and Arrow files require pyarrow
+            try:
+                import_pyarrow()
+            except PixelSetParserError as e:
+                raise exceptions.MetaFileParsingError(
+                    _("Cannot read dataset file {}: {}").format(
+                        dataset_path.name, e
+                    )
+                )
         if serialized:
             dataset_path = dataset_path.name
 
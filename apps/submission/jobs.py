@@ -0,0 +1,341 @@
+"""
+Archive importation jobs are queued in the database and run by import worker
+processes (see the run_import_workers management command), so that an
+importation does not depend on the web server process that queued it.
+"""
+import logging
+import os
+import socket
+
+from datetime import timedelta
+from pathlib import Path
+from time import sleep
+
+from django import db
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import (
+    Count, F, IntegerField, OuterRef, Q, Subquery, Value
+)
+from django.db.models.functions import Coalesce
+from django.utils.timezone import now
+from django.utils.translation import ugettext as _
+from viewflow import signals as vf_signals
+from viewflow.activation import STATUS
+
+from .exceptions import (
+    ArchiveError, ImportCanceledError, ImportInterruptedError,
+    PixelSetParserError
+)
+from .io.archive import PixelArchive
+from .models import ImportJob, SubmissionProcess
+
+logger = logging.getLogger(__name__)
+
+# Errors due to the archive content (importing it again would fail again), or
+# interruptions (cancellation and timeouts) that should not be retried
+FINAL_ERRORS = (ArchiveError, PixelSetParserError, ImportInterruptedError)
+
+# PostgreSQL advisory lock serializing job claims (see claim_job)
+SCHEDULER_LOCK_ID = 0x706978656c
+
+
+def get_worker_name():
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+def enqueue_import(process, task):
+    """Queue a submission process archive importation"""
+
+    logger.debug('Queuing importation for process {}'.format(process.pk))
+
+    return ImportJob.objects.create(
+        process=process,
+        task=task,
+        pixeler=process.created_by,
+    )
+
+
+def get_running_jobs():
+    """Running jobs whose lock has not expired"""
+
+    return ImportJob.objects.filter(
+        status=ImportJob.STATUS_RUNNING,
+        locked_until__gte=now(),
+    )
+
+
+def get_queue():
+    """
+    Jobs that can be claimed, in claim order: a pending job whose run date
+    has come, or a running job whose lock expired (its worker died).
+
+    Workers are shared fairly between pixelers: jobs with a higher priority
+    come first, then jobs of pixelers with the fewest running jobs, then jobs
+    of the pixeler served the longest time ago. Once a pixeler runs
+    PIXELS_IMPORT_MAX_RUNNING_PER_PIXELER jobs (if set), their other jobs wait.
+    """
+
+    running = get_running_jobs().filter(
+        pixeler=OuterRef('pixeler')
+    ).order_by().values('pixeler').annotate(count=Count('pk'))
+    served_at = ImportJob.objects.filter(
+        pixeler=OuterRef('pixeler'),
+        started_at__isnull=False,
+    ).order_by('-started_at')
+
+    queue = ImportJob.objects.filter(
+        Q(status=ImportJob.STATUS_PENDING, run_at__lte=now()) |
+        Q(status=ImportJob.STATUS_RUNNING, locked_until__lt=now())
+    ).annotate(
+        pixeler_running=Coalesce(
+            Subquery(running.values('count'), output_field=IntegerField()),
+            Value(0)
+        ),
+        pixeler_served_at=Subquery(served_at.values('started_at')[:1]),
+    )
+
+    per_pixeler = settings.PIXELS_IMPORT_MAX_RUNNING_PER_PIXELER
+    if per_pixeler:
+        queue = queue.filter(pixeler_running__lt=per_pixeler)
+
+    return queue.order_by(
+        '-priority',
+        'pixeler_running',
+        F('pixeler_served_at').asc(nulls_first=True),
+        'run_at',
+        'pk',
+    )
+
+
+def get_queue_position(process):
+    """
+    Returns: the position (starting at 1) of the process pending importation
+    in the queue, or None if it is not queued (or waits for a retry)
+    """
+
+    # values_list() would drop the annotations the queue is ordered by
+    pks = [job.pk for job in get_queue().only('pk')]
+    job = process.import_jobs.filter(
+        status=ImportJob.STATUS_PENDING,
+        pk__in=pks,
+    ).first()
+    if job is None:
+        return None
+    return pks.index(job.pk) + 1
+
+
+def lock_scheduler():
+    """Serialize job claims until the end of the current transaction, so that
+    concurrent workers cannot exceed the running jobs limits"""
+
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [SCHEDULER_LOCK_ID])
+
+
+def cancel_import(process):
+    """
+    Cancel a submission process archive importation: queued jobs are canceled
+    at once, while running jobs are interrupted (and their changes deleted) by
+    their worker at the next importation progress checkpoint.
+    """
+
+    logger.debug('Canceling importation for process {}'.format(process.pk))
+
+    SubmissionProcess.objects.filter(pk=process.pk).update(
+        cancel_requested=True
+    )
+    process.cancel_requested = True
+
+    with transaction.atomic():
+        # Jobs being claimed are canceled by their worker
+        jobs = ImportJob.objects.select_for_update(skip_locked=True).filter(
+            process=process,
+            status=ImportJob.STATUS_PENDING,
+        )
+        for job in jobs:
+            fail_job(
+                job,
+                ImportCanceledError(_("Importation has been canceled"))
+            )
+
+
+def claim_job(worker=None):
+    """
+    Claim the next job to run (see get_queue()), unless
+    PIXELS_IMPORT_MAX_RUNNING jobs are already running. Jobs being claimed by
+    other workers are skipped (SELECT ... FOR UPDATE SKIP LOCKED), hence a
+    job is claimed by a single worker.
+
+    Returns: the claimed job or None if there is no job to run
+    """
+
+    with transaction.atomic():
+        lock_scheduler()
+
+        max_running = settings.PIXELS_IMPORT_MAX_RUNNING
+        if max_running and get_running_jobs().count() >= max_running:
+            return None
+
+        job = get_queue().select_for_update(skip_locked=True).first()
+        if job is None:
+            return None
+
+        job.status = ImportJob.STATUS_RUNNING
+        job.attempts += 1
+        job.worker = worker or get_worker_name()
+        job.started_at = now()
+        job.locked_until = job.started_at + timedelta(
+            seconds=settings.PIXELS_IMPORT_JOB_LEASE
+        )
+        job.save()
+
+    logger.debug('Job {} claimed by {}'.format(job.pk, job.worker))
+    return job
+
+
+def fail_job(job, error):
+    """
+    Record a job failure. The job is retried later (with an exponential
+    backoff) unless the error is final (see FINAL_ERRORS) or the job exhausted
+    its attempts: its import_archive task is then marked as failed.
+    """
+
+    job.error = str(error)
+    job.locked_until = None
+
+    if not isinstance(error, FINAL_ERRORS) and \
+            job.attempts < settings.PIXELS_IMPORT_MAX_ATTEMPTS:
+        delay = settings.PIXELS_IMPORT_RETRY_DELAY * 2 ** (job.attempts - 1)
+        job.status = ImportJob.STATUS_PENDING
+        job.run_at = now() + timedelta(seconds=delay)
+        job.save()
+        logger.warning('Job {} will be retried at {}'.format(
+            job.pk,
+            job.run_at
+        ))
+        return
+
+    if isinstance(error, ImportCanceledError):
+        job.status = ImportJob.STATUS_CANCELED
+    else:
+        job.status = ImportJob.STATUS_FAILED
+    job.finished_at = now()
+    job.save()
+
+    task = job.task
+    task.status = STATUS.ERROR
+    task.comments = job.error
+    task.finished = job.finished_at
+    task.save()
+
+    vf_signals.task_failed.send(
+        sender=task.flow_task.flow_class,
+        process=job.process,
+        task=task
+    )
+
+
+def set_statement_timeout(timeout):
+    """Abort database statements running for longer than timeout seconds (0
+    disables the timeout). Only PostgreSQL is supported."""
+
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SET statement_timeout = %s', [int(timeout * 1000)]
+        )
+
+
+def run_job(job):
+    """
+    Import a claimed job archive and complete its import_archive task (the
+    flow proceeds from the worker).
+
+    Returns: True if the archive has been imported
+    """
+
+    process = job.process
+    archive_path = Path(settings.MEDIA_ROOT) / Path(process.archive.name)
+
+    if job.attempts > settings.PIXELS_IMPORT_MAX_ATTEMPTS:
+        fail_job(
+            job,
+            ArchiveError(
+                _("Importation did not complete after {} attempts").format(
+                    settings.PIXELS_IMPORT_MAX_ATTEMPTS
+                )
+            )
+        )
+        return False
+
+    if process.cancel_requested:
+        fail_job(job, ImportCanceledError(_("Importation has been canceled")))
+        return False
+
+    set_statement_timeout(settings.PIXELS_IMPORT_STATEMENT_TIMEOUT)
+    archive = None
+    try:
+        archive = PixelArchive(archive_path)
+        archive.save(pixeler=process.created_by, submission=process)
+    except Exception as e:
+        logger.exception(
+            "Importation failed! archive: {} (pixeler: {})".format(
+                archive_path,
+                process.created_by
+            )
+        )
+        fail_job(job, e)
+        return False
+    finally:
+        set_statement_timeout(0)
+        if archive is not None:
+            archive.cleanup()
+
+    with transaction.atomic():
+        process.imported = True
+        process.save(update_fields=['imported'])
+
+        job.status = ImportJob.STATUS_DONE
+        job.finished_at = now()
+        job.locked_until = None
+        job.error = ''
+        job.save()
+
+        logger.debug("Proceeding with activation callback")
+        job.task.activate().callback()
+
+    return True
+
+
+def run_worker(burst=False, poll_interval=None, worker=None):
+    """
+    Claim and run jobs, waiting poll_interval seconds for new jobs when the
+    queue is empty. With burst, return once the queue is empty.
+
+    Returns: the number of run jobs
+    """
+
+    if poll_interval is None:
+        poll_interval = settings.PIXELS_IMPORT_POLL_INTERVAL
+    worker = worker or get_worker_name()
+
+    count = 0
+    while True:
+        # Drop connections broken by a previous job
+        db.close_old_connections()
+
+        job = claim_job(worker)
+        if job is None:
+            if burst:
+                break
+            sleep(poll_interval)
+            continue
+
+        run_job(job)
+        count += 1
+
+    return count
@@ -0,0 +1,80 @@
+from multiprocessing import Process
+
+from django import db
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.translation import ugettext as _
+
+from ...io.archive import remove_extraction_root
+from ...jobs import run_worker
+
+
+def work(burst, poll_interval):
+    """Run an import worker
+
+    Returns: the number of run jobs
+    """
+    try:
+        return run_worker(burst=burst, poll_interval=poll_interval)
+    finally:
+        # Each worker opens its own database connection
+        db.connections.close_all()
+        # Forked workers exit without running atexit handlers
+        remove_extraction_root()
+
+
+class Command(BaseCommand):
+    help = _("Run workers importing queued submission archives")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            help=_(
+                "Number of worker processes, i.e. of archives imported "
+                "concurrently (defaults to the PIXELS_IMPORT_WORKERS setting)"
+            )
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            help=_(
+                "Seconds to wait for new jobs when the queue is empty "
+                "(defaults to the PIXELS_IMPORT_POLL_INTERVAL setting)"
+            )
+        )
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help=_("Exit once the queue is empty")
+        )
+
+    def handle(self, *args, **options):
+        concurrency = (
+            options.get('concurrency') or settings.PIXELS_IMPORT_WORKERS
+        )
+        burst = options.get('burst', False)
+        poll_interval = options.get('poll_interval')
+
+        if concurrency < 2:
+            count = work(burst, poll_interval)
+            if burst:
+                self.stdout.write(
+                    self.style.SUCCESS(_("{} job(s) run").format(count))
+                )
+            return
+
+        # Forked processes must not share the parent database connection
+        db.connections.close_all()
+        workers = [
+            Process(target=work, args=(burst, poll_interval))
+            for __ in range(concurrency)
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.8 on 2026-10-16 10:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('viewflow', '0006_i18n'),
+        ('submission', '0009_auto_20180119_0928'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'Pending'), (2, 'Running'), (3, 'Done'), (4, 'Failed')], default=1, verbose_name='Status')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Attempts')),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now, help_text='The job cannot be claimed by a worker before this date', verbose_name='Run at')),
+                ('locked_until', models.DateTimeField(blank=True, help_text='A running job is claimed again once its lock expired (e.g. when its worker died)', null=True, verbose_name='Locked until')),
+                ('worker', models.CharField(blank=True, help_text='The last worker (host:pid) that claimed this job', max_length=255, verbose_name='Worker')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('process', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', related_query_name='import_job', to='submission.SubmissionProcess')),
+                ('task', models.ForeignKey(help_text='The import_archive task completed by this job', on_delete=django.db.models.deletion.CASCADE, related_name='+', to='viewflow.Task')),
+            ],
+            options={
+                'ordering': ('run_at', 'id'),
+                'verbose_name': 'Import job',
+                'verbose_name_plural': 'Import jobs',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='importjob',
+            index=models.Index(fields=['status', 'run_at'], name='submission_job_status_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.8 on 2026-10-16 11:02
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields.jsonb
+import django.core.serializers.json
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submission', '0010_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submissionprocess',
+            name='progress',
+            field=django.contrib.postgres.fields.jsonb.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='Archive importation progress checkpoint', null=True, verbose_name='Progress'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.8 on 2026-10-16 11:34
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submission', '0011_submissionprocess_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submissionprocess',
+            name='cancel_requested',
+            field=models.BooleanField(default=False, help_text='The archive importation should be canceled', verbose_name='Cancel requested'),
+        ),
+        migrations.AlterField(
+            model_name='importjob',
+            name='status',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'Pending'), (2, 'Running'), (3, 'Done'), (4, 'Failed'), (5, 'Canceled')], default=1, verbose_name='Status'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.8 on 2026-10-16 14:52
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def set_jobs_pixeler(apps, schema_editor):
+
+    ImportJob = apps.get_model('submission', 'ImportJob')
+    Task = apps.get_model('viewflow', 'Task')
+
+    # Process.created_by is the owner of the process start task
+    for job in ImportJob.objects.all():
+        job.pixeler_id = Task.objects.filter(
+            process_id=job.process_id,
+            flow_task_type='START',
+        ).values_list('owner_id', flat=True).first()
+        job.save(update_fields=['pixeler'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('viewflow', '0006_i18n'),
+        ('submission', '0012_auto_20261016_1134'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='importjob',
+            options={'ordering': ('-priority', 'run_at', 'id'), 'verbose_name': 'Import job', 'verbose_name_plural': 'Import jobs'},
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='pixeler',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', related_query_name='import_job', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='priority',
+            field=models.SmallIntegerField(default=0, help_text='Pending jobs with a higher priority are claimed first, whatever their pixeler share', verbose_name='Priority'),
+        ),
+        migrations.RunPython(
+            set_jobs_pixeler,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
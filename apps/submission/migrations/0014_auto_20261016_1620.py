@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.8 on 2026-10-16 16:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Case, Count, When
+from viewflow.activation import STATUS
+
+
+def set_processes_completion(apps, schema_editor):
+
+    SubmissionProcess = apps.get_model('submission', 'SubmissionProcess')
+    Task = apps.get_model('viewflow', 'Task')
+
+    for process in SubmissionProcess.objects.all():
+        tasks = Task.objects.filter(process_id=process.pk).aggregate(
+            done=Count(
+                Case(When(status=STATUS.DONE, then='flow_task')),
+                distinct=True
+            ),
+            failed=Count(Case(When(status=STATUS.ERROR, then='pk'))),
+        )
+        total = len(process.flow_class._meta.nodes())
+        process.completion = int(tasks['done'] / total * 100.)
+        process.failed = tasks['failed'] > 0
+        process.save(update_fields=['completion', 'failed'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('viewflow', '0006_i18n'),
+        ('submission', '0013_auto_20261016_1452'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submissionprocess',
+            name='completion',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Ratio (in percent) of the submission flow steps done', verbose_name='Completion'),
+        ),
+        migrations.AddField(
+            model_name='submissionprocess',
+            name='failed',
+            field=models.BooleanField(default=False, help_text='The process has failed tasks', verbose_name='Failed'),
+        ),
+        migrations.RunPython(
+            set_processes_completion,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
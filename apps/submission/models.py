@@ -1,9 +1,15 @@
+from pathlib import Path
+from shutil import move
+
+from django.conf import settings
 from django.contrib.postgres.fields import JSONField
 from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models import Case, Count, When
+from django.utils.timezone import now
 from django.utils.translation import ugettext as _
 from viewflow.activation import STATUS
-from viewflow.models import Process
+from viewflow.models import Process, Task
 
 from apps.core.models import Analysis
 
@@ -70,6 +76,14 @@ class SubmissionProcess(Process):
         blank=True,
     )
 
+    progress = JSONField(
+        _("Progress"),
+        encoder=DjangoJSONEncoder,
+        help_text=_("Archive importation progress checkpoint"),
+        null=True,
+        blank=True,
+    )
+
     downloaded = models.BooleanField(default=False)
 
     uploaded = models.BooleanField(default=False)
@@ -88,14 +102,189 @@ class SubmissionProcess(Process):
 
     imported = models.BooleanField(default=False)
 
+    cancel_requested = models.BooleanField(
+        _("Cancel requested"),
+        help_text=_("The archive importation should be canceled"),
+        default=False,
+    )
+
+    # Denormalized from the process tasks by update_completion() (called
+    # from viewflow task signals), so that listings do not query tasks
+    completion = models.PositiveSmallIntegerField(
+        _("Completion"),
+        help_text=_("Ratio (in percent) of the submission flow steps done"),
+        default=0,
+    )
+
+    failed = models.BooleanField(
+        _("Failed"),
+        help_text=_("The process has failed tasks"),
+        default=False,
+    )
+
+    def set_archive(self, path, filename):
+        """
+        Move an archive file (e.g. an upload staging file) to the process
+        archive storage location and attach it to this process
+        """
+
+        storage = self.archive.storage
+        name = storage.get_available_name(
+            self.archive.field.generate_filename(self, filename)
+        )
+        archive_path = Path(storage.path(name))
+        archive_path.parent.mkdir(parents=True, exist_ok=True)
+        move(str(path), str(archive_path))
+        self.archive.name = name
+
+    def update_completion(self):
+        """Update the completion and failed columns from the process tasks
+        (with a single query)
+        """
+
+        tasks = self.task_set.aggregate(
+            done=Count(
+                Case(When(status=STATUS.DONE, then='flow_task')),
+                distinct=True
+            ),
+            failed=Count(Case(When(status=STATUS.ERROR, then='pk'))),
+        )
+        total = len(self.flow_class._meta.nodes())
+
+        self.completion = int(tasks['done'] / total * 100.)
+        self.failed = tasks['failed'] > 0
+        SubmissionProcess.objects.filter(pk=self.pk).update(
+            completion=self.completion,
+            failed=self.failed,
+        )
+
     @property
     def has_failed(self):
         """Check if process has failed tasks"""
 
-        return self.task_set.filter(status=STATUS.ERROR).count() > 0
+        return self.failed
 
     @property
     def is_done(self):
         """Check if the process is done"""
 
         return self.status == STATUS.DONE
+
+
+class ImportJob(models.Model):
+    """A submission archive importation, queued in the database and run by
+    import worker processes (see the run_import_workers command)
+    """
+
+    process = models.ForeignKey(
+        SubmissionProcess,
+        on_delete=models.CASCADE,
+        related_name='import_jobs',
+        related_query_name='import_job',
+    )
+
+    task = models.ForeignKey(
+        Task,
+        on_delete=models.CASCADE,
+        related_name='+',
+        help_text=_("The import_archive task completed by this job"),
+    )
+
+    # Denormalized from the process to share workers between pixelers
+    pixeler = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='import_jobs',
+        related_query_name='import_job',
+        null=True,
+        blank=True,
+    )
+
+    priority = models.SmallIntegerField(
+        _("Priority"),
+        help_text=_(
+            "Pending jobs with a higher priority are claimed first, whatever "
+            "their pixeler share"
+        ),
+        default=0,
+    )
+
+    STATUS_PENDING = 1
+    STATUS_RUNNING = 2
+    STATUS_DONE = 3
+    STATUS_FAILED = 4
+    STATUS_CANCELED = 5
+    STATUS_CHOICES = (
+        (STATUS_PENDING, _("Pending")),
+        (STATUS_RUNNING, _("Running")),
+        (STATUS_DONE, _("Done")),
+        (STATUS_FAILED, _("Failed")),
+        (STATUS_CANCELED, _("Canceled")),
+    )
+    status = models.PositiveSmallIntegerField(
+        _("Status"),
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+    )
+
+    attempts = models.PositiveSmallIntegerField(
+        _("Attempts"),
+        default=0,
+    )
+
+    run_at = models.DateTimeField(
+        _("Run at"),
+        help_text=_("The job cannot be claimed by a worker before this date"),
+        default=now,
+    )
+
+    locked_until = models.DateTimeField(
+        _("Locked until"),
+        help_text=_(
+            "A running job is claimed again once its lock expired (e.g. "
+            "when its worker died)"
+        ),
+        null=True,
+        blank=True,
+    )
+
+    worker = models.CharField(
+        _("Worker"),
+        help_text=_("The last worker (host:pid) that claimed this job"),
+        max_length=255,
+        blank=True,
+    )
+
+    error = models.TextField(
+        _("Error"),
+        blank=True,
+    )
+
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        editable=False,
+    )
+
+    started_at = models.DateTimeField(
+        null=True,
+        blank=True,
+    )
+
+    finished_at = models.DateTimeField(
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        ordering = ('-priority', 'run_at', 'id')
+        verbose_name = _("Import job")
+        verbose_name_plural = _("Import jobs")
+        indexes = [
+            models.Index(
+                fields=['status', 'run_at'],
+                name='submission_job_status_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return '{} ({})'.format(self.process, self.get_status_display())
@@ -2,7 +2,6 @@ from django import template
 from django.template.defaultfilters import stringfilter
 from viewflow.activation import STATUS
 
-from ..flows import SubmissionFlow
 from ..utils import is_hidden_task
 
 register = template.Library()
@@ -53,18 +52,3 @@ def is_completed(task):
     if task.status in (STATUS.DONE, STATUS.ERROR, STATUS.CANCELED):
         return True
     return False
-
-
-@register.simple_tag
-def submission_ratio(process):
-    """Calculates achived tasks ratio for a given submission process
-
-    Returns: an integer in [0;100]
-    """
-    total = len(SubmissionFlow()._meta.nodes())
-    done = process.task_set\
-        .filter(status=STATUS.DONE)\
-        .order_by('flow_task')\
-        .distinct('flow_task')\
-        .count()
-    return int(done/total * 100.)
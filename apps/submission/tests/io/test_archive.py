@@ -1,21 +1,36 @@
 import datetime
 import pytest
+import tarfile
 
+from importlib.util import find_spec
 from pathlib import Path
-from unittest.mock import MagicMock
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import skipUnless
+from unittest.mock import MagicMock, patch
 from zipfile import ZipFile
 
+from django.db import OperationalError
+
 from apps.core.factories import (
     AnalysisFactory, ExperimentFactory, PixelerFactory
 )
 from apps.core.models import (
-    Analysis, Experiment, OmicsArea, OmicsUnitType, Pixel, PixelSet,
-    Strain
+    Analysis, Experiment, OmicsArea, OmicsUnit, OmicsUnitType, Pixel,
+    PixelSet, Strain
 )
 from apps.core.tests import CoreFixturesTestCase
 from apps.data.factories import EntryFactory
 from apps.data.models import Repository
-from apps.submission.io.archive import META_FILENAME, PixelArchive
+from apps.submission.io import archive as archive_module
+from apps.submission.io.archive import (
+    ArchiveMember, PixelArchive, get_archive_checksum, get_archive_names,
+    get_extraction_root, is_tarball
+)
+from apps.submission.io.pixel import PixelSetParser, parse_pixelset
+from apps.submission.io.progress import ImportProgress
+from apps.submission.models import SubmissionProcess
+from apps.submission.utils import sha256_digest
 from ... import exceptions, signals
 from .test_pixel import LoadCGDMixin
 
@@ -66,28 +81,9 @@ class PixelArchiveTestCase(LoadCGDMixin, CoreFixturesTestCase):
         archive = PixelArchive(self.valid_archive_path)
 
         self.assertEqual(archive.archive_path, self.valid_archive_path)
-        self.assertIsNotNone(archive.cwd)
-        z = ZipFile(self.valid_archive_path)
-        expected_files = [
-            archive.cwd / f for f in z.namelist()
-        ]
-        self.assertEqual(
-            set(archive.files),
-            set(expected_files)
-        )
-        for f in archive.files:
-            self.assertTrue(f.exists())
-
-    def test_extract(self):
-
-        archive = PixelArchive(self.valid_archive_path)
-
-        archive._extract()
-        self.assertIsNotNone(archive.cwd)
-
         z = ZipFile(self.valid_archive_path)
         expected_files = [
-            archive.cwd / f for f in z.namelist()
+            ArchiveMember(self.valid_archive_path, f) for f in z.namelist()
         ]
         self.assertEqual(
             set(archive.files),
@@ -96,34 +92,26 @@ class PixelArchiveTestCase(LoadCGDMixin, CoreFixturesTestCase):
         for f in archive.files:
             self.assertTrue(f.exists())
 
-    def test_extract_cache(self):
-        """Calling _extract once again should not change the cwd"""
-        archive = PixelArchive(self.valid_archive_path)
-        archive._extract()
-
-        old_cwd = archive.cwd
-        archive._extract()
-        self.assertEqual(archive.cwd, old_cwd)
+    def test_init_does_not_extract_archive(self):
 
-    def test_extract_force_mode(self):
-        """Calling _extract in force mode should change the cwd"""
-        archive = PixelArchive(self.valid_archive_path)
-        archive._extract()
-
-        old_cwd = archive.cwd
-        archive._extract(force=True)
-        self.assertNotEqual(archive.cwd, old_cwd)
+        with patch('apps.submission.io.archive.ZipFile.extract') as extract:
+            with patch(
+                'apps.submission.io.archive.ZipFile.extractall'
+            ) as extractall:
+                PixelArchive(self.valid_archive_path)
+        extract.assert_not_called()
+        extractall.assert_not_called()
 
     def test_set_meta(self):
 
         archive = PixelArchive(self.valid_archive_path)
         self.assertEqual(
-            archive.meta_path.name,
-            META_FILENAME
+            archive.meta_path,
+            ArchiveMember(self.valid_archive_path, 'dataset-0001/meta.xlsx')
         )
         archive.files = [
-            archive.cwd / Path('foo'),
-            archive.cwd / Path('bar'),
+            ArchiveMember(self.valid_archive_path, 'foo'),
+            ArchiveMember(self.valid_archive_path, 'bar'),
         ]
         with pytest.raises(exceptions.MetaFileRequiredError):
             archive._set_meta()
@@ -157,11 +145,14 @@ class PixelArchiveTestCase(LoadCGDMixin, CoreFixturesTestCase):
                 'entry': 'Camadro laboratory',
             },
             'analysis': {
-                'secondary_data_path': archive.cwd / Path(
-                    'dataset-0001/'
-                    '1503002-protein-measurements-PD2.1.csv'
+                'secondary_data_path': ArchiveMember(
+                    self.valid_archive_path,
+                    'dataset-0001/1503002-protein-measurements-PD2.1.csv'
+                ),
+                'notebook_path': ArchiveMember(
+                    self.valid_archive_path,
+                    'dataset-0001/NoteBook.R'
                 ),
-                'notebook_path': archive.cwd / Path('dataset-0001/NoteBook.R'),
                 'description': (
                     'Protein abundances obtained in two cell growth '
                     'conditions (alkaline pH or standard) were compared, in '
@@ -173,7 +164,10 @@ class PixelArchiveTestCase(LoadCGDMixin, CoreFixturesTestCase):
             },
             'datasets': [
                 [
-                    archive.cwd / Path('dataset-0001/Pixel_C10.txt'),
+                    ArchiveMember(
+                        self.valid_archive_path,
+                        'dataset-0001/Pixel_C10.txt'
+                    ),
                     protein,
                     deltaHTU,
                     (
@@ -183,7 +177,10 @@ class PixelArchiveTestCase(LoadCGDMixin, CoreFixturesTestCase):
                     )
                 ],
                 [
-                    archive.cwd / Path('dataset-0001/Pixel_C60.txt'),
+                    ArchiveMember(
+                        self.valid_archive_path,
+                        'dataset-0001/Pixel_C60.txt'
+                    ),
                     protein,
                     deltaHTU,
                     (
@@ -208,6 +205,258 @@ class PixelArchiveTestCase(LoadCGDMixin, CoreFixturesTestCase):
         self.assertEqual(Experiment.objects.count(), 1)
         self.assertEqual(Analysis.objects.count(), 1)
 
+    def test_save_progress(self):
+
+        archive = PixelArchive(self.valid_archive_path)
+        self._load_cgd_entries()
+        submission = SubmissionProcess.objects.create(
+            label='test',
+            tags={'experiment': 'test', 'analysis': 'test'},
+        )
+        archive.save(pixeler=self.pixeler, submission=submission)
+
+        submission.refresh_from_db()
+        progress = submission.progress
+        self.assertEqual(progress['stage'], 'done')
+        self.assertEqual(progress['datasets'], 2)
+        self.assertEqual(progress['datasets_done'], 2)
+        self.assertEqual(progress['rows_inserted'], 3716)
+        self.assertGreaterEqual(progress['rows_parsed'], 3716)
+
+    def test_save_canceled(self):
+
+        archive = PixelArchive(self.valid_archive_path)
+        self._load_cgd_entries()
+        submission = SubmissionProcess.objects.create(
+            label='test',
+            tags={'experiment': 'test', 'analysis': 'test'},
+        )
+        experiments = Experiment.objects.count()
+        analyses = Analysis.objects.count()
+
+        # Cancel the importation while the first dataset is imported
+        add = ImportProgress.add
+
+        def add_and_cancel(progress, **increments):
+            add(progress, **increments)
+            SubmissionProcess.objects.filter(pk=submission.pk).update(
+                cancel_requested=True
+            )
+
+        with patch.object(ImportProgress, 'add', add_and_cancel):
+            with pytest.raises(exceptions.ImportCanceledError):
+                archive.save(pixeler=self.pixeler, submission=submission)
+
+        # Changes have been rolled back
+        self.assertEqual(Experiment.objects.count(), experiments)
+        self.assertEqual(Analysis.objects.count(), analyses)
+        self.assertEqual(PixelSet.objects.count(), 0)
+        self.assertEqual(Pixel.objects.count(), 0)
+
+    def test_save_with_statement_timeout(self):
+
+        class QueryCanceledError(Exception):
+            pgcode = '57014'
+
+        error = OperationalError('canceling statement')
+        error.__cause__ = QueryCanceledError()
+
+        archive = PixelArchive(self.valid_archive_path)
+        self._load_cgd_entries()
+        experiments = Experiment.objects.count()
+
+        with patch.object(PixelSetParser, 'stream', side_effect=error):
+            with pytest.raises(exceptions.ImportTimeoutError):
+                archive.save(pixeler=self.pixeler, jobs=1)
+
+        # Created analysis and experiment have been deleted
+        self.assertEqual(Experiment.objects.count(), experiments)
+        self.assertEqual(Analysis.objects.count(), 0)
+
+    def test_save_with_operational_error(self):
+
+        archive = PixelArchive(self.valid_archive_path)
+        self._load_cgd_entries()
+
+        with patch.object(
+                PixelSetParser,
+                'stream',
+                side_effect=OperationalError('lost')):
+            with pytest.raises(OperationalError):
+                archive.save(pixeler=self.pixeler, jobs=1)
+
+    def test__parse_datasets(self):
+
+        archive = PixelArchive(self.valid_archive_path)
+        datasets = archive.meta['datasets']
+
+        parsed = list(archive._parse_datasets(jobs=1))
+        self.assertEqual([d for d, p in parsed], datasets)
+        self.assertEqual([p for d, p in parsed], [None, None])
+
+        parsed = list(archive._parse_datasets(jobs=2))
+        self.assertEqual([d for d, p in parsed], datasets)
+        for dataset, pixels in parsed:
+            self.assertTrue(pixels.equals(parse_pixelset(dataset[0])))
+
+        # Large pixels files are streamed by the writer
+        with self.settings(PIXELS_IMPORT_JOBS_MAX_FILE_SIZE=0):
+            parsed = list(archive._parse_datasets(jobs=2))
+        self.assertEqual([d for d, p in parsed], datasets)
+        self.assertEqual([p for d, p in parsed], [None, None])
+
+    def test_archive_member_size(self):
+
+        member = ArchiveMember(
+            self.valid_archive_path,
+            'dataset-0001/Pixel_C10.txt'
+        )
+        self.assertEqual(
+            member.size,
+            ZipFile(self.valid_archive_path).getinfo(
+                'dataset-0001/Pixel_C10.txt'
+            ).file_size
+        )
+        with pytest.raises(FileNotFoundError):
+            (member.parent / 'foo.txt').size
+
+    def test_save_with_jobs(self):
+
+        archive = PixelArchive(self.valid_archive_path)
+        self._load_cgd_entries()
+        experiment, analysis, pixel_sets = archive.save(
+            pixeler=self.pixeler,
+            jobs=2
+        )
+        self.assertEqual(Pixel.objects.count(), 3716)
+        self.assertEqual(len(pixel_sets), 2)
+
+    def test_save_stores_files(self):
+
+        archive = PixelArchive(self.valid_archive_path)
+        self._load_cgd_entries()
+        secondary_data_path = archive.meta['analysis']['secondary_data_path']
+        experiment, analysis, pixel_sets = archive.save(pixeler=self.pixeler)
+
+        # Archive members are streamed to the content-addressed files tree
+        digest = sha256_digest(analysis.secondary_data.path)
+        self.assertEqual(
+            Path(analysis.secondary_data.path).read_bytes(),
+            secondary_data_path.read_bytes()
+        )
+        self.assertEqual(
+            Path(analysis.secondary_data.name),
+            Path('files') / digest[:2] / digest / secondary_data_path.name
+        )
+        for pixel_set in pixel_sets:
+            self.assertEqual(
+                Path(pixel_set.pixels_file.name).parts[0],
+                'files'
+            )
+
+        # Same files are stored once
+        archive = PixelArchive(self.valid_archive_path)
+        experiment, other_analysis, _ = archive.save(pixeler=self.pixeler)
+        self.assertEqual(
+            other_analysis.secondary_data.name,
+            analysis.secondary_data.name
+        )
+
+    def test_archive_member(self):
+
+        member = ArchiveMember(
+            self.valid_archive_path,
+            'dataset-0001/Pixel_C10.txt'
+        )
+        self.assertEqual(member.name, 'Pixel_C10.txt')
+        self.assertEqual(member.suffix, '.txt')
+        self.assertEqual(
+            member.parent / 'NoteBook.R',
+            ArchiveMember(self.valid_archive_path, 'dataset-0001/NoteBook.R')
+        )
+        self.assertTrue(member.exists())
+        self.assertTrue(member.parent.exists())
+        self.assertFalse((member.parent / 'foo.txt').exists())
+
+        expected = ZipFile(self.valid_archive_path).read(
+            'dataset-0001/Pixel_C10.txt'
+        )
+        self.assertEqual(member.read_bytes(), expected)
+        with member.open() as f:
+            self.assertEqual(
+                f.readline(),
+                b'OmicsUnit Value Quality_score\r\n'
+            )
+        with pytest.raises(ValueError):
+            member.open('w')
+
+    def test_archive_member_extract(self):
+
+        member = ArchiveMember(
+            self.valid_archive_path,
+            'dataset-0001/Pixel_C10.txt'
+        )
+        path = member.extract()
+        self.assertEqual(path.name, 'Pixel_C10.txt')
+        self.assertEqual(path.read_bytes(), member.read_bytes())
+        self.assertTrue(str(path).startswith(str(get_extraction_root())))
+
+        # Extracted members are cached
+        with patch.object(ArchiveMember, 'open') as open_member:
+            self.assertEqual(member.extract(), path)
+        open_member.assert_not_called()
+
+    def test_archive_member_with_unsafe_path(self):
+
+        for name in ('../../foo.txt', 'dataset-0001/../../foo.txt', '/foo'):
+            with pytest.raises(exceptions.UnsafeArchiveMemberError):
+                ArchiveMember(self.valid_archive_path, name)
+
+    def test_cleanup(self):
+
+        archive = PixelArchive(self.valid_archive_path)
+        path = ArchiveMember(
+            self.valid_archive_path,
+            'dataset-0001/Pixel_C10.txt'
+        ).extract()
+        self.assertTrue(path.exists())
+
+        archive.cleanup()
+        self.assertFalse(path.exists())
+        archive_path = str(self.valid_archive_path.resolve())
+        self.assertFalse(
+            any(k[0] == archive_path for k in archive_module._checksums)
+        )
+        self.assertFalse(
+            any(k[0] == archive_path for k in archive_module._names)
+        )
+
+    def test_archives_cache_is_bounded(self):
+
+        with patch.object(archive_module, 'ARCHIVES_CACHE_SIZE', 1):
+            get_archive_checksum(self.valid_archive_path)
+            get_archive_checksum(self.no_meta_archive_path)
+        self.assertEqual(len(archive_module._checksums), 1)
+        key = list(archive_module._checksums)[0]
+        self.assertEqual(key[0], str(self.no_meta_archive_path.resolve()))
+
+    def test_validate(self):
+
+        archive = PixelArchive(self.valid_archive_path)
+
+        # All missing entries are reported at once
+        with pytest.raises(exceptions.MissingEntriesError) as e:
+            archive.validate()
+        self.assertIn('CAGL0F02695g', str(e.value))
+        self.assertIn('CAGL0H08437g', str(e.value))
+        # Nothing has been written
+        self.assertEqual(Experiment.objects.count(), 0)
+        self.assertEqual(Analysis.objects.count(), 0)
+        self.assertEqual(OmicsUnit.objects.count(), 0)
+
+        self._load_cgd_entries()
+        archive.validate()
+
     def test_save_twice_the_same_archive(self):
 
         archive_path = Path(
@@ -274,8 +523,8 @@ class PixelArchiveTestCase(LoadCGDMixin, CoreFixturesTestCase):
         experiment.entries.add(entry)
         analysis = AnalysisFactory(
             description=archive.meta['analysis']['description'],
-            secondary_data__from_path=archive.meta['analysis']['secondary_data_path'],  # noqa
-            notebook__from_path=archive.meta['analysis']['notebook_path'],
+            secondary_data__from_path=archive.meta['analysis']['secondary_data_path'].extract(),  # noqa
+            notebook__from_path=archive.meta['analysis']['notebook_path'].extract(),  # noqa
             pixeler=self.pixeler,
             completed_at=archive.meta['analysis']['date'],
         )
@@ -291,3 +540,99 @@ class PixelArchiveTestCase(LoadCGDMixin, CoreFixturesTestCase):
         # No new experiment/analysis should have been created
         self.assertEqual(Experiment.objects.count(), 1)
         self.assertEqual(Analysis.objects.count(), 1)
+
+
+class PixelArchiveTarballTestCase(LoadCGDMixin, CoreFixturesTestCase):
+
+    def setUp(self):
+
+        self.zip_path = Path('apps/submission/fixtures/dataset-0001.zip')
+        self.pixeler = PixelerFactory(
+            is_active=True,
+            is_staff=True,
+            is_superuser=True,
+        )
+
+    def _make_tarball(self, mode='w:gz', compress=None):
+        """Repack the zip archive fixture as a tarball"""
+
+        root = Path(mkdtemp())
+        self.addCleanup(rmtree, str(root), ignore_errors=True)
+        with ZipFile(self.zip_path) as z:
+            z.extractall(str(root))
+        tarball_path = root / 'dataset-0001.tar'
+        with tarfile.open(str(tarball_path), mode) as tar:
+            tar.add(str(root / 'dataset-0001'), arcname='./dataset-0001')
+        if compress is not None:
+            tarball_path.write_bytes(compress(tarball_path.read_bytes()))
+        return tarball_path
+
+    def test_is_tarball(self):
+
+        self.assertTrue(is_tarball(self._make_tarball()))
+        self.assertFalse(is_tarball(self.zip_path))
+        self.assertFalse(is_tarball(Path('apps/submission/fixtures/fake.zip')))
+
+    def test_init(self):
+
+        tarball_path = self._make_tarball()
+        archive = PixelArchive(tarball_path)
+
+        # Only the dataset directory is repacked (not __MACOSX/ entries)
+        expected = [
+            name for name in ZipFile(self.zip_path).namelist()
+            if name.startswith('dataset-0001/')
+        ]
+        self.assertEqual(
+            sorted(get_archive_names(tarball_path)),
+            sorted(expected)
+        )
+        self.assertEqual(
+            archive.meta_path,
+            ArchiveMember(tarball_path, 'dataset-0001/meta.xlsx')
+        )
+        self.assertEqual(len(archive.meta['datasets']), 2)
+
+    def test_archive_member(self):
+
+        tarball_path = self._make_tarball()
+        member = ArchiveMember(tarball_path, 'dataset-0001/Pixel_C10.txt')
+
+        self.assertTrue(member.exists())
+        self.assertTrue(member.parent.exists())
+        self.assertFalse((member.parent / 'foo.txt').exists())
+
+        expected = ZipFile(self.zip_path).read('dataset-0001/Pixel_C10.txt')
+        self.assertEqual(member.read_bytes(), expected)
+        with member.open() as f:
+            self.assertEqual(
+                f.readline(),
+                b'OmicsUnit Value Quality_score\r\n'
+            )
+        self.assertEqual(member.extract().read_bytes(), expected)
+
+        with pytest.raises(FileNotFoundError):
+            (member.parent / 'foo.txt').open()
+
+    def test_save(self):
+
+        archive = PixelArchive(self._make_tarball())
+        self._load_cgd_entries()
+        archive.save(pixeler=self.pixeler)
+        self.assertEqual(Pixel.objects.count(), 3716)
+
+    @skipUnless(find_spec('zstandard'), "zstandard is not installed")
+    def test_save_zstd_tarball(self):
+
+        import zstandard
+
+        tarball_path = self._make_tarball(
+            mode='w',
+            compress=zstandard.ZstdCompressor().compress
+        )
+        self.assertTrue(is_tarball(tarball_path))
+
+        archive = PixelArchive(tarball_path)
+        self._load_cgd_entries()
+        archive.save(pixeler=self.pixeler)
+        self.assertEqual(Pixel.objects.count(), 3716)
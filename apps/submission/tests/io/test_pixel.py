@@ -1,15 +1,27 @@
+from importlib.util import find_spec
 from pathlib import Path
+from tempfile import mkdtemp
+from unittest import skipUnless
+from unittest.mock import patch
 
+import pandas
+
+from django.db import connection
+from django.test import override_settings
+
+from apps.core.db import copy_from_dataframe
 from apps.core.factories import (
     NOTEBOOK_DEFAULT_PATH, SECONDARY_DATA_DEFAULT_PATH, AnalysisFactory,
-    OmicsUnitFactory, OmicsUnitTypeFactory, PixelFactory, StrainFactory
+    ExperimentFactory, OmicsUnitFactory, OmicsUnitTypeFactory, PixelFactory,
+    StrainFactory
 )
-from apps.core.models import OmicsUnit, Pixel
+from apps.core.models import OmicsUnit, Pixel, PixelSet
 from apps.core.tests import CoreFixturesTestCase
 from apps.data.factories import EntryFactory
 from apps.data.io.parsers import CGDParser
 from apps.data.models import Repository
-from apps.submission.io.pixel import PixelSetParser
+from apps.submission.io.pixel import PixelSetParser, get_pixelset_format
+from apps.submission.io.progress import ImportProgress
 from ...exceptions import PixelSetParserError, PixelSetParserSaveError
 
 
@@ -122,6 +134,17 @@ class PixelTestCase(LoadCGDMixin, CoreFixturesTestCase):
         self.assertEqual(fuzzy.index[0], 'CAGL0A02211g;CAGL0D02640g')
         self.assertEqual(fuzzy.index[-1], 'CAGL0G08173g;CAGL0D05082g')
 
+    def test_filter_counts(self):
+
+        pixelset = PixelSetParser(self.pixelset_path)
+        pixelset.parse()
+        expected = pixelset.filter()[0]
+
+        pixels, na, fuzzy = pixelset.filter(counts=True)
+        self.assertTrue(pixels.equals(expected))
+        self.assertEqual(na, 74)
+        self.assertEqual(fuzzy, 25)
+
     def test_na_filter(self):
 
         pixelset = PixelSetParser(self.pixelset_path)
@@ -213,7 +236,7 @@ class PixelTestCase(LoadCGDMixin, CoreFixturesTestCase):
 
         # Then create omics units
         omics_units = parser._get_omics_units(pixels, verbose=True)
-        self.assertEqual(omics_units.count(), 1837)
+        self.assertEqual(len(omics_units), 1837)
         self.assertEqual(OmicsUnit.objects.count(), 1837)
 
     def test__to_pixels(self):
@@ -243,11 +266,46 @@ class PixelTestCase(LoadCGDMixin, CoreFixturesTestCase):
         self.assertEqual(len(parser.db_pixels['update']), 0)
 
         db_pixel = parser.db_pixels['new'][0]
-        pixel = parser.pixels.ix[db_pixel.omics_unit.reference.identifier]
+        pixel = parser.pixels.loc[db_pixel.omics_unit.reference.identifier]
 
         self.assertEqual(db_pixel.value, pixel.Value)
         self.assertEqual(db_pixel.quality_score, pixel.Quality_score)
 
+    def test__to_frame_with_aliases(self):
+
+        parser = PixelSetParser(
+            self.pixelset_path,
+            description=self.description,
+            analysis=self.analysis,
+            omics_unit_type=self.omics_unit_type,
+            strain=self.strain,
+        )
+        parser.parse()
+        self._load_cgd_entries()
+
+        # CAGL0F07183g is an alias of the CAGL0F07172g entry
+        self.assertIn('CAGL0F07183g', parser.pixels.index)
+        self.assertNotIn('CAGL0F07172g', parser.pixels.index)
+        frame = parser._to_frame()
+        self.assertEqual(len(frame), 1837)
+        omics_unit = OmicsUnit.objects.get(
+            reference__identifier='CAGL0F07172g',
+            strain=self.strain,
+            type=self.omics_unit_type,
+        )
+        self.assertIn(omics_unit.pk, frame['omics_unit_id'].tolist())
+
+        # Pixels for an alias and its canonical entry are duplicates
+        parser.pixels = pandas.concat([
+            parser.pixels,
+            parser.pixels.loc[['CAGL0F07183g']].rename(
+                index={'CAGL0F07183g': 'CAGL0F07172g'}
+            )
+        ])
+        frame = parser._to_frame()
+        self.assertEqual(len(frame), 1837)
+        self.assertFalse(frame['omics_unit_id'].duplicated().any())
+
     def test__to_pixels_with_existing_pixel(self):
 
         parser = PixelSetParser(
@@ -270,7 +328,7 @@ class PixelTestCase(LoadCGDMixin, CoreFixturesTestCase):
 
         # We should have updated existing pixel data
         identifier = existing_db_pixel.omics_unit.reference.identifier
-        pixel = parser.pixels.ix[identifier]
+        pixel = parser.pixels.loc[identifier]
         updated_db_pixel = parser.db_pixels['update'][0]
         self.assertEqual(updated_db_pixel.value, pixel.Value)
         self.assertEqual(updated_db_pixel.quality_score, pixel.Quality_score)
@@ -329,6 +387,131 @@ class PixelTestCase(LoadCGDMixin, CoreFixturesTestCase):
         # - https://github.com/Candihub/pixel/pull/296
         self.assertEqual(Pixel.objects.count(), 7)
 
+    def test_save_with_copy(self):
+
+        parser = PixelSetParser(
+            self.pixelset_path,
+            description=self.description,
+            analysis=self.analysis,
+            omics_unit_type=self.omics_unit_type,
+            strain=self.strain,
+        )
+        parser.parse()
+        self._load_cgd_entries()
+
+        self.assertTrue(parser._use_copy())
+        parser.save()
+        self.assertEqual(Pixel.objects.count(), 1837)
+        # No model instance is created for new pixels
+        self.assertEqual(parser.db_pixels['new'], [])
+
+        pixel = Pixel.objects.get(
+            omics_unit__reference__identifier='CAGL0F02695g'
+        )
+        self.assertEqual(pixel.pixel_set, parser.pixelset)
+        self.assertAlmostEqual(
+            pixel.value,
+            parser.pixels.loc['CAGL0F02695g', 'Value']
+        )
+        self.assertAlmostEqual(
+            pixel.quality_score,
+            parser.pixels.loc['CAGL0F02695g', 'Quality_score']
+        )
+        self.assertEqual(pixel.id.version, 4)
+
+    def _get_staging_tables(self):
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT tablename FROM pg_tables"
+                " WHERE tablename LIKE 'core_pixel_staging_%'"
+            )
+            return cursor.fetchall()
+
+    def test_save_with_copy_drops_staging_table(self):
+
+        parser = PixelSetParser(
+            self.pixelset_path,
+            description=self.description,
+            analysis=self.analysis,
+            omics_unit_type=self.omics_unit_type,
+            strain=self.strain,
+        )
+        parser.parse()
+        self._load_cgd_entries()
+
+        parser.save()
+        self.assertEqual(Pixel.objects.count(), 1837)
+        self.assertEqual(self._get_staging_tables(), [])
+
+    def test_save_with_copy_checks_staged_rows(self):
+
+        parser = PixelSetParser(
+            self.pixelset_path,
+            description=self.description,
+            analysis=self.analysis,
+            omics_unit_type=self.omics_unit_type,
+            strain=self.strain,
+        )
+        parser.parse()
+        self._load_cgd_entries()
+
+        with patch(
+            'apps.submission.io.pixel.copy_from_dataframe',
+            side_effect=lambda *args: copy_from_dataframe(*args) + 1
+        ):
+            with self.assertRaises(PixelSetParserSaveError):
+                parser.save()
+        self.assertEqual(Pixel.objects.count(), 0)
+        self.assertEqual(self._get_staging_tables(), [])
+
+    def test_stream_with_copy_publishes_complete_pixelsets(self):
+
+        parser = PixelSetParser(
+            self.pixelset_path,
+            description=self.description,
+            analysis=self.analysis,
+            omics_unit_type=self.omics_unit_type,
+            strain=self.strain,
+        )
+        self._load_cgd_entries()
+
+        # The second chunk cannot be saved: first chunk pixels should not be
+        # published
+        missing = pandas.DataFrame(
+            {'Value': [1.], 'Quality_score': [0.1]},
+            index=['MISSING'],
+            columns=('Value', 'Quality_score')
+        )
+        reader = PixelSetParser(self.pixelset_path)
+        reader.parse()
+        with patch.object(parser, 'iter_pixels', return_value=[
+            reader.pixels,
+            missing,
+        ]):
+            with self.assertRaises(PixelSetParserSaveError):
+                parser.stream(2000)
+        self.assertEqual(Pixel.objects.count(), 0)
+        self.assertEqual(self._get_staging_tables(), [])
+
+    @override_settings(PIXELS_INGESTION_BACKEND='orm')
+    def test_save_with_orm(self):
+
+        parser = PixelSetParser(
+            self.pixelset_path,
+            description=self.description,
+            analysis=self.analysis,
+            omics_unit_type=self.omics_unit_type,
+            strain=self.strain,
+        )
+        parser.parse()
+        self._load_cgd_entries()
+
+        self.assertFalse(parser._use_copy())
+        parser.save()
+        self.assertEqual(Pixel.objects.count(), 1837)
+        self.assertEqual(len(parser.db_pixels['new']), 1837)
+
     def test_save_with_existing_pixel(self):
 
         parser = PixelSetParser(
@@ -344,8 +527,12 @@ class PixelTestCase(LoadCGDMixin, CoreFixturesTestCase):
 
         self._create_pixel_from_set(parser.pixelset)
         self.assertEqual(Pixel.objects.count(), 1)
-        parser.save()
+        stats = parser.save()
         self.assertEqual(Pixel.objects.count(), 1837)
+        self.assertEqual(
+            stats,
+            {'inserted': 1836, 'changed': 0, 'unchanged': 1}
+        )
 
     def test_save_with_update(self):
 
@@ -365,13 +552,68 @@ class PixelTestCase(LoadCGDMixin, CoreFixturesTestCase):
         self.assertEqual(pixel.value, 4.2)
         self.assertEqual(pixel.quality_score, 0.8)
 
-        parser.save(update=True)
+        stats = parser.save(update=True)
         self.assertEqual(Pixel.objects.count(), 1837)
+        self.assertEqual(
+            stats,
+            {'inserted': 1836, 'changed': 1, 'unchanged': 0}
+        )
 
         pixel = Pixel.objects.get(pk=pixel.pk)
         self.assertEqual(pixel.value, 2.703695974165)
         self.assertEqual(pixel.quality_score, 0.00268822352590468)
 
+    def _test_save_with_update_only_changes_modified_pixels(self):
+
+        parser = PixelSetParser(
+            self.pixelset_path,
+            description=self.description,
+            analysis=self.analysis,
+            omics_unit_type=self.omics_unit_type,
+            strain=self.strain,
+        )
+        parser.parse()
+        self._load_cgd_entries()
+        stats = parser.save(update=True)
+        self.assertEqual(
+            stats,
+            {'inserted': 1837, 'changed': 0, 'unchanged': 0}
+        )
+
+        # Saving the same pixels twice should not update them
+        stats = parser.save(update=True)
+        self.assertEqual(Pixel.objects.count(), 1837)
+        self.assertEqual(
+            stats,
+            {'inserted': 0, 'changed': 0, 'unchanged': 1837}
+        )
+
+        # Only corrected pixels are updated
+        parser.pixels.loc['CAGL0F02695g', 'Value'] = 42.
+        parser.pixels.loc['CAGL0H08437g', 'Quality_score'] = 0.5
+        stats = parser.save(update=True)
+        self.assertEqual(
+            stats,
+            {'inserted': 0, 'changed': 2, 'unchanged': 1835}
+        )
+        pixel = Pixel.objects.get(
+            omics_unit__reference__identifier='CAGL0F02695g'
+        )
+        self.assertEqual(pixel.value, 42.)
+        pixel = Pixel.objects.get(
+            omics_unit__reference__identifier='CAGL0H08437g'
+        )
+        self.assertEqual(pixel.quality_score, 0.5)
+
+    def test_save_with_update_only_changes_modified_pixels(self):
+
+        self._test_save_with_update_only_changes_modified_pixels()
+
+    @override_settings(PIXELS_INGESTION_BACKEND='orm')
+    def test_save_with_update_only_changes_modified_pixels_with_orm(self):
+
+        self._test_save_with_update_only_changes_modified_pixels()
+
     def test_save_populates_cached_fields(self):
 
         parser = PixelSetParser(
@@ -397,3 +639,247 @@ class PixelTestCase(LoadCGDMixin, CoreFixturesTestCase):
             parser.pixelset.cached_omics_unit_types,
             [self.omics_unit_type.name]
         )
+
+    def test_save_populates_cached_fields_with_experiment(self):
+
+        experiment = ExperimentFactory()
+        parser = PixelSetParser(
+            self.pixelset_path,
+            description=self.description,
+            analysis=self.analysis,
+            omics_unit_type=self.omics_unit_type,
+            strain=self.strain,
+            experiment=experiment,
+        )
+        parser.parse()
+        self._load_cgd_entries()
+
+        # Pixels are not scanned
+        with patch.object(PixelSet, 'update_cached_fields') as update:
+            parser.save()
+        update.assert_not_called()
+
+        parser.pixelset.refresh_from_db()
+        self.assertEqual(
+            parser.pixelset.cached_species,
+            [self.strain.species.name]
+        )
+        self.assertEqual(
+            parser.pixelset.cached_omics_areas,
+            [experiment.omics_area.name]
+        )
+        self.assertEqual(
+            parser.pixelset.cached_omics_unit_types,
+            [self.omics_unit_type.name]
+        )
+
+    @override_settings(PIXELS_VERIFY_CACHED_FIELDS=True)
+    def test_save_verifies_cached_fields(self):
+
+        parser = PixelSetParser(
+            self.pixelset_path,
+            description=self.description,
+            analysis=self.analysis,
+            omics_unit_type=self.omics_unit_type,
+            strain=self.strain,
+            experiment=ExperimentFactory(),
+        )
+        parser.parse()
+        self._load_cgd_entries()
+
+        # The experiment is not related to the analysis: scanned omics areas
+        # differ
+        with self.assertLogs('apps.submission.io.pixel', level='WARNING'):
+            parser.save()
+        self.assertEqual(parser.pixelset.cached_omics_areas, [])
+        self.assertEqual(
+            parser.pixelset.cached_species,
+            [self.strain.species.name]
+        )
+
+    def test_iter_pixels(self):
+
+        parser = PixelSetParser(self.pixelset_path)
+        chunks = list(parser.iter_pixels(500))
+
+        self.assertEqual([len(c) for c in chunks], [500, 500, 500, 436])
+        self.assertEqual(chunks[0].index[0], 'CAGL0F02695g')
+        self.assertEqual(chunks[0]['Value'].dtype, 'float64')
+        self.assertIsNone(parser.pixels)
+
+    def test_stream(self):
+
+        parser = PixelSetParser(
+            self.pixelset_path,
+            description=self.description,
+            analysis=self.analysis,
+            omics_unit_type=self.omics_unit_type,
+            strain=self.strain,
+        )
+        self._load_cgd_entries()
+
+        stats = parser.stream(500)
+        self.assertEqual(Pixel.objects.count(), 1837)
+        self.assertEqual(
+            stats,
+            {'inserted': 1837, 'changed': 0, 'unchanged': 0}
+        )
+        self.assertIsNone(parser.pixels)
+        self.assertIsNone(parser.seen_omics_units)
+        self.assertEqual(
+            parser.pixelset.cached_omics_unit_types,
+            [self.omics_unit_type.name]
+        )
+
+        stats = parser.stream(500, update=True)
+        self.assertEqual(Pixel.objects.count(), 1837)
+        self.assertEqual(
+            stats,
+            {'inserted': 0, 'changed': 0, 'unchanged': 1837}
+        )
+
+    def test_stream_progress(self):
+
+        progress = ImportProgress()
+        parser = PixelSetParser(
+            self.pixelset_path,
+            description=self.description,
+            analysis=self.analysis,
+            omics_unit_type=self.omics_unit_type,
+            strain=self.strain,
+            progress=progress,
+        )
+        self._load_cgd_entries()
+
+        parser.stream(500)
+        self.assertGreaterEqual(progress.record['rows_parsed'], 1837)
+        self.assertEqual(progress.record['rows_inserted'], 1837)
+
+    def test_stream_with_duplicates_in_distinct_chunks(self):
+
+        parser = PixelSetParser(
+            self.pixelset_path,
+            description=self.description,
+            analysis=self.analysis,
+            omics_unit_type=self.omics_unit_type,
+            strain=self.strain,
+        )
+        self._load_cgd_entries()
+
+        # The CAGL0F07183g alias is in the first chunk and its canonical
+        # CAGL0F07172g entry in the second one
+        canonical = pandas.DataFrame(
+            {'Value': [1.], 'Quality_score': [0.1]},
+            index=['CAGL0F07172g'],
+            columns=('Value', 'Quality_score')
+        )
+        reader = PixelSetParser(self.pixelset_path)
+        reader.parse()
+        with patch.object(parser, 'iter_pixels', return_value=[
+            reader.pixels,
+            canonical,
+        ]):
+            stats = parser.stream(2000)
+        self.assertEqual(stats['inserted'], 1837)
+        self.assertEqual(Pixel.objects.count(), 1837)
+
+
+class PixelSetFormatTestCase(CoreFixturesTestCase):
+
+    def setUp(self):
+
+        self.pixelset_path = Path(
+            'apps/submission/fixtures/dataset-0001/Pixel_C10.txt'
+        )
+        parser = PixelSetParser(self.pixelset_path)
+        parser.parse()
+        self.pixels = parser.pixels
+
+    def _write(self, extension, **kwargs):
+
+        import pyarrow
+        import pyarrow.feather
+        import pyarrow.parquet
+
+        path = Path(mkdtemp()) / 'Pixel_C10{}'.format(extension)
+        # Identifiers are stored in the first column
+        table = pyarrow.Table.from_pandas(
+            self.pixels.reset_index(),
+            preserve_index=False
+        )
+        if extension == '.parquet':
+            pyarrow.parquet.write_table(table, str(path), **kwargs)
+        else:
+            pyarrow.feather.write_feather(table, str(path), **kwargs)
+        return path
+
+    def test_get_pixelset_format(self):
+
+        self.assertEqual(get_pixelset_format(self.pixelset_path), 'text')
+        self.assertEqual(get_pixelset_format(Path('foo.tsv')), 'text')
+        self.assertEqual(get_pixelset_format(Path('foo.parquet')), 'parquet')
+        self.assertEqual(get_pixelset_format(Path('foo.PARQUET')), 'parquet')
+        self.assertEqual(get_pixelset_format(Path('foo.feather')), 'arrow')
+        self.assertEqual(get_pixelset_format(Path('foo.arrow')), 'arrow')
+
+    @skipUnless(find_spec('pyarrow'), "pyarrow is not installed")
+    def test_parse_columnar_formats(self):
+
+        for extension in ('.parquet', '.feather', '.arrow'):
+            parser = PixelSetParser(self._write(extension))
+            parser.parse()
+
+            self.assertEqual(len(parser.pixels), 1936)
+            self.assertTrue(
+                parser.pixels.equals(self.pixels),
+                msg=extension
+            )
+
+            pixels, na, fuzzy = parser.filter()
+            self.assertEqual(len(pixels), 1837)
+            self.assertEqual(len(na), 74)
+            self.assertEqual(len(fuzzy), 25)
+
+    @skipUnless(find_spec('pyarrow'), "pyarrow is not installed")
+    def test_iter_pixels_columnar_formats(self):
+
+        for extension in ('.parquet', '.feather', '.arrow'):
+            parser = PixelSetParser(self._write(extension))
+            chunks = list(parser.iter_pixels(500))
+
+            self.assertEqual(
+                [len(c) for c in chunks],
+                [500, 500, 500, 436],
+                msg=extension
+            )
+            self.assertTrue(pandas.concat(chunks).equals(self.pixels))
+
+    @skipUnless(find_spec('pyarrow'), "pyarrow is not installed")
+    def test_parse_feather_v1(self):
+
+        parser = PixelSetParser(self._write('.feather', version=1))
+        parser.parse()
+        self.assertTrue(parser.pixels.equals(self.pixels))
+
+    @skipUnless(find_spec('pyarrow'), "pyarrow is not installed")
+    def test_parse_invalid_columnar_file(self):
+
+        for extension in ('.parquet', '.feather', '.arrow'):
+            path = Path(mkdtemp()) / 'Pixel_C10{}'.format(extension)
+            path.write_bytes(b'not a columnar file')
+
+            parser = PixelSetParser(path)
+            with self.assertRaises(PixelSetParserError, msg=extension):
+                parser.parse()
+
+    @skipUnless(find_spec('pyarrow'), "pyarrow is not installed")
+    def test_parse_columnar_format_with_missing_columns(self):
+
+        path = Path(mkdtemp()) / 'Pixel_C10.parquet'
+        self.pixels.reset_index().drop('Quality_score', axis=1).to_parquet(
+            path
+        )
+
+        parser = PixelSetParser(path)
+        with self.assertRaises(PixelSetParserError):
+            parser.parse()
@@ -0,0 +1,87 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from apps.submission.exceptions import (
+    ImportCanceledError, ImportTimeoutError
+)
+from apps.submission.io.progress import ImportProgress
+from apps.submission.models import SubmissionProcess
+
+
+class ImportProgressTestCase(TestCase):
+
+    def setUp(self):
+
+        self.process = SubmissionProcess.objects.create(label='test')
+
+    def test_checkpoint(self):
+
+        progress = ImportProgress(self.process, interval=60)
+        progress.checkpoint(stage=ImportProgress.STAGE_IMPORTING, datasets=2)
+
+        self.process.refresh_from_db()
+        self.assertEqual(self.process.progress['stage'], 'importing')
+        self.assertEqual(self.process.progress['datasets'], 2)
+        self.assertEqual(self.process.progress['datasets_done'], 0)
+        self.assertIn('updated_at', self.process.progress)
+
+    def test_add(self):
+
+        progress = ImportProgress(self.process, interval=60)
+        progress.checkpoint(stage=ImportProgress.STAGE_IMPORTING, datasets=2)
+
+        # Counters are written at most every interval seconds
+        with self.assertNumQueries(0):
+            progress.add(rows_parsed=1000)
+            progress.add(rows_parsed=1000)
+        self.assertEqual(progress.record['rows_parsed'], 2000)
+        self.process.refresh_from_db()
+        self.assertEqual(self.process.progress['rows_parsed'], 0)
+
+        # An imported dataset is always written
+        with self.assertNumQueries(1):
+            progress.add(datasets_done=1)
+        self.process.refresh_from_db()
+        self.assertEqual(self.process.progress['datasets_done'], 1)
+        self.assertEqual(self.process.progress['rows_parsed'], 2000)
+
+        with patch('apps.submission.io.progress.monotonic') as monotonic:
+            monotonic.return_value = progress._written_at + 61
+            with self.assertNumQueries(1):
+                progress.add(rows_inserted=1000)
+
+    def test_without_submission(self):
+
+        progress = ImportProgress()
+        with self.assertNumQueries(0):
+            progress.checkpoint(stage=ImportProgress.STAGE_DONE)
+        self.assertEqual(progress.record['stage'], 'done')
+
+    def test_check_timeout(self):
+
+        progress = ImportProgress(self.process, timeout=60)
+        progress.check()
+
+        with patch('apps.submission.io.progress.monotonic') as monotonic:
+            monotonic.return_value = progress.deadline + 1
+            with self.assertRaises(ImportTimeoutError):
+                progress.check()
+
+        # No timeout
+        progress = ImportProgress(self.process, timeout=0)
+        self.assertIsNone(progress.deadline)
+        progress.check()
+
+    def test_check_canceled(self):
+
+        progress = ImportProgress(self.process, interval=60)
+        progress.checkpoint(stage=ImportProgress.STAGE_IMPORTING, datasets=2)
+
+        SubmissionProcess.objects.filter(pk=self.process.pk).update(
+            cancel_requested=True
+        )
+        # Cancellation is detected when progress is written
+        progress.add(rows_parsed=1000)
+        with self.assertRaises(ImportCanceledError):
+            progress.add(datasets_done=1)
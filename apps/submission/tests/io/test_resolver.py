@@ -0,0 +1,159 @@
+from apps.core.factories import (
+    OmicsUnitFactory, OmicsUnitTypeFactory, StrainFactory
+)
+from apps.core.models import OmicsUnit
+from apps.core.tests import CoreFixturesTestCase
+from apps.data.factories import EntryFactory, RepositoryFactory
+from apps.data.models import Alias, Entry, Repository
+from apps.submission.io.resolver import OmicsUnitResolver
+from ...exceptions import PixelSetParserSaveError
+
+
+class OmicsUnitResolverTestCase(CoreFixturesTestCase):
+
+    def setUp(self):
+
+        self.repository = Repository.objects.get(name='CGD')
+        self.omics_unit_type = OmicsUnitTypeFactory()
+        self.strain = StrainFactory()
+        self.entries = [
+            EntryFactory(
+                identifier='CAGL0A0000{}g'.format(i),
+                repository=self.repository
+            ) for i in range(3)
+        ]
+        self.resolver = OmicsUnitResolver()
+
+    def test_get_repositories(self):
+
+        self.assertEqual(
+            self.resolver.get_repositories(self.strain),
+            (self.repository.pk, )
+        )
+
+        self.strain.species.repository = None
+        self.assertIsNone(self.resolver.get_repositories(self.strain))
+
+    def test_get_entries(self):
+
+        Alias.objects.create(
+            identifier='ALIAS',
+            entry=self.entries[0],
+            repository=self.repository
+        )
+        # An alias matching an entry identifier is ignored
+        Alias.objects.create(
+            identifier=self.entries[1].identifier,
+            entry=self.entries[2],
+            repository=self.repository
+        )
+        # Entries from other repositories are ignored
+        EntryFactory(identifier='OTHER', repository=RepositoryFactory())
+
+        entries = self.resolver.get_entries((self.repository.pk, ))
+        # Repository entries (including fixtures entries) and aliases
+        expected = set(
+            Entry.objects.filter(
+                repository=self.repository
+            ).values_list('identifier', flat=True)
+        ) | set(
+            Alias.objects.filter(
+                repository=self.repository
+            ).values_list('identifier', flat=True)
+        )
+        self.assertEqual(set(entries), expected)
+        self.assertEqual(entries['ALIAS'], self.entries[0].pk)
+        self.assertEqual(
+            entries[self.entries[1].identifier],
+            self.entries[1].pk
+        )
+        self.assertNotIn('OTHER', entries)
+
+        # Entries are loaded once
+        with self.assertNumQueries(0):
+            self.resolver.get_entries((self.repository.pk, ))
+
+    def test_get_missing_identifiers(self):
+
+        Alias.objects.create(
+            identifier='ALIAS',
+            entry=self.entries[0],
+            repository=self.repository
+        )
+        # Entries from other repositories are ignored
+        EntryFactory(identifier='OTHER', repository=RepositoryFactory())
+
+        identifiers = [
+            self.entries[0].identifier, 'ALIAS', 'OTHER', 'MISSING'
+        ]
+        with self.assertNumQueries(1):
+            missing = self.resolver.get_missing_identifiers(
+                identifiers,
+                (self.repository.pk, )
+            )
+        self.assertEqual(missing, {'OTHER', 'MISSING'})
+
+        # Look up all repositories
+        self.assertEqual(
+            self.resolver.get_missing_identifiers(identifiers, None),
+            {'MISSING'}
+        )
+
+    def test_resolve(self):
+
+        existing = OmicsUnitFactory(
+            reference=self.entries[0],
+            strain=self.strain,
+            type=self.omics_unit_type
+        )
+        identifiers = [e.identifier for e in self.entries]
+
+        omics_units = self.resolver.resolve(
+            identifiers,
+            self.strain,
+            self.omics_unit_type
+        )
+        self.assertEqual(omics_units.index.tolist(), identifiers)
+        self.assertEqual(omics_units[identifiers[0]], existing.pk)
+        self.assertEqual(OmicsUnit.objects.count(), 3)
+        for identifier, pk in omics_units.items():
+            omics_unit = OmicsUnit.objects.get(pk=pk)
+            self.assertEqual(omics_unit.reference.identifier, identifier)
+            self.assertEqual(omics_unit.strain, self.strain)
+            self.assertEqual(omics_unit.type, self.omics_unit_type)
+
+        # Maps are cached for this strain and omics unit type
+        with self.assertNumQueries(0):
+            self.resolver.resolve(
+                identifiers,
+                self.strain,
+                self.omics_unit_type
+            )
+
+    def test_resolve_with_missing_entries(self):
+
+        with self.assertRaises(PixelSetParserSaveError):
+            self.resolver.resolve(
+                ['CAGL0A00000g', 'MISSING'],
+                self.strain,
+                self.omics_unit_type
+            )
+        self.assertEqual(OmicsUnit.objects.count(), 0)
+
+    def test__create_omics_units(self):
+
+        existing = OmicsUnitFactory(
+            reference=self.entries[0],
+            strain=self.strain,
+            type=self.omics_unit_type
+        )
+
+        created = self.resolver._create_omics_units(
+            [e.pk for e in self.entries],
+            self.strain,
+            self.omics_unit_type
+        )
+        self.assertEqual(len(created), 3)
+        # Concurrently created omics units are fetched
+        self.assertEqual(created[self.entries[0].pk], existing.pk)
+        self.assertEqual(OmicsUnit.objects.count(), 3)
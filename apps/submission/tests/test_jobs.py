@@ -0,0 +1,302 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils.timezone import now
+from viewflow.activation import STATUS
+
+from apps.core.factories import PIXELER_PASSWORD, PixelerFactory
+from .. import exceptions
+from ..flows import SubmissionFlow
+from ..io.archive import PixelArchive
+from ..jobs import (
+    cancel_import, claim_job, enqueue_import, fail_job, get_queue,
+    get_queue_position, run_job
+)
+from ..models import ImportJob, SubmissionProcess
+from .test_views import TagsTestMixin
+
+
+class ImportJobTestCase(TagsTestMixin, TestCase):
+
+    fixtures = [
+        'apps/data/fixtures/initial_data.json',
+        'apps/data/fixtures/test_entries.json',
+        'apps/core/fixtures/initial_data.json',
+    ]
+
+    def setUp(self):
+
+        super().setUp()
+
+        # Submit tags: the archive importation is queued
+        self.client.post(
+            self.url,
+            data={
+                '_viewflow_activation-started': '2000-01-01',
+            },
+            follow=True,
+        )
+        self.job = ImportJob.objects.get()
+        self.task = self.job.task
+
+    def _enqueue_other_pixeler_import(self):
+
+        # Start another submission as another pixeler (start task owner)
+        other = PixelerFactory(
+            is_active=True,
+            is_staff=True,
+            is_superuser=True,
+        )
+        self.client.login(username=other.username, password=PIXELER_PASSWORD)
+        self.client.post(
+            reverse('submission:start'),
+            data={
+                'label': 'other',
+                '_viewflow_activation-started': '2000-01-01',
+            },
+        )
+        self.client.login(
+            username=self.user.username,
+            password=PIXELER_PASSWORD,
+        )
+
+        process = SubmissionProcess.objects.get(label='other')
+        self.assertEqual(process.created_by, other)
+        return enqueue_import(process, self.task)
+
+    def test_enqueue_import(self):
+
+        self.assertEqual(self.job.process, self.process)
+        self.assertEqual(self.job.pixeler, self.process.created_by)
+        self.assertEqual(self.task.flow_task, SubmissionFlow.import_archive)
+        self.assertEqual(self.job.status, ImportJob.STATUS_PENDING)
+        self.assertEqual(self.job.attempts, 0)
+
+        enqueue_import(self.process, self.task)
+        self.assertEqual(ImportJob.objects.count(), 2)
+
+    def test_claim_job(self):
+
+        job = claim_job(worker='test')
+        self.assertEqual(job, self.job)
+        self.assertEqual(job.status, ImportJob.STATUS_RUNNING)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.worker, 'test')
+        self.assertGreater(job.locked_until, now())
+
+        # A running job cannot be claimed again
+        self.assertIsNone(claim_job())
+
+    def test_claim_job_with_expired_lock(self):
+
+        ImportJob.objects.update(
+            status=ImportJob.STATUS_RUNNING,
+            attempts=1,
+            locked_until=now() - timedelta(seconds=1),
+        )
+
+        job = claim_job()
+        self.assertEqual(job, self.job)
+        self.assertEqual(job.attempts, 2)
+
+    def test_claim_job_before_run_date(self):
+
+        ImportJob.objects.update(run_at=now() + timedelta(hours=1))
+
+        self.assertIsNone(claim_job())
+
+    @override_settings(PIXELS_IMPORT_MAX_RUNNING=0)
+    def test_get_queue(self):
+
+        job = enqueue_import(self.process, self.task)
+        other = self._enqueue_other_pixeler_import()
+        self.assertEqual(list(get_queue()), [self.job, job, other])
+
+        # The pixeler running the fewest jobs comes first
+        self.assertEqual(claim_job(), self.job)
+        self.assertEqual(list(get_queue()), [other, job])
+        self.assertEqual(claim_job(), other)
+        self.assertEqual(claim_job(), job)
+
+    def test_get_queue_least_recently_served_pixeler(self):
+
+        self.job.status = ImportJob.STATUS_DONE
+        self.job.started_at = now()
+        self.job.save()
+        job = enqueue_import(self.process, self.task)
+        other = self._enqueue_other_pixeler_import()
+
+        self.assertEqual(list(get_queue()), [other, job])
+
+    def test_get_queue_with_priority(self):
+
+        other = self._enqueue_other_pixeler_import()
+        other.priority = 1
+        other.save()
+
+        self.assertEqual(list(get_queue()), [other, self.job])
+
+    @override_settings(PIXELS_IMPORT_MAX_RUNNING_PER_PIXELER=1)
+    def test_get_queue_with_max_running_per_pixeler(self):
+
+        job = enqueue_import(self.process, self.task)
+        other = self._enqueue_other_pixeler_import()
+
+        self.assertEqual(claim_job(), self.job)
+        self.assertEqual(list(get_queue()), [other])
+        self.assertEqual(claim_job(), other)
+        self.assertIsNone(claim_job())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_PENDING)
+
+    @override_settings(PIXELS_IMPORT_MAX_RUNNING=1)
+    def test_claim_job_with_max_running(self):
+
+        self._enqueue_other_pixeler_import()
+
+        self.assertEqual(claim_job(), self.job)
+        self.assertIsNone(claim_job())
+
+        # A lost job does not count as running
+        ImportJob.objects.filter(pk=self.job.pk).update(
+            locked_until=now() - timedelta(seconds=1)
+        )
+        self.assertIsNotNone(claim_job())
+
+    def test_get_queue_position(self):
+
+        other = self._enqueue_other_pixeler_import()
+
+        self.assertEqual(get_queue_position(self.process), 1)
+        self.assertEqual(get_queue_position(other.process), 2)
+
+        claim_job()
+        self.assertIsNone(get_queue_position(self.process))
+        self.assertEqual(get_queue_position(other.process), 1)
+
+    def test_run_job(self):
+
+        job = claim_job()
+        self.assertTrue(run_job(job))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_DONE)
+        self.assertIsNotNone(job.finished_at)
+
+        self.process.refresh_from_db()
+        self.assertTrue(self.process.imported)
+        self.assertTrue(self.process.is_done)
+
+    def test_run_job_keeps_cancel_request(self):
+
+        def save(archive, pixeler, submission=None):
+            # Canceled while the importation is being completed
+            SubmissionProcess.objects.filter(pk=submission.pk).update(
+                cancel_requested=True
+            )
+
+        job = claim_job()
+        with patch.object(PixelArchive, 'save', new=save):
+            self.assertTrue(run_job(job))
+
+        self.process.refresh_from_db()
+        self.assertTrue(self.process.imported)
+        self.assertTrue(self.process.cancel_requested)
+
+    @override_settings(PIXELS_IMPORT_RETRY_DELAY=60)
+    def test_run_job_with_error(self):
+
+        job = claim_job()
+        with patch.object(
+                PixelArchive, 'save', side_effect=OperationalError('lost')):
+            self.assertFalse(run_job(job))
+
+        # The job will be retried
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_PENDING)
+        self.assertEqual(job.error, 'lost')
+        self.assertGreater(job.run_at, now() + timedelta(seconds=30))
+        self.task.refresh_from_db()
+        self.assertNotEqual(self.task.status, STATUS.ERROR)
+
+    def test_run_job_with_archive_error(self):
+
+        job = claim_job()
+        with patch.object(
+                PixelArchive,
+                'save',
+                side_effect=exceptions.MissingEntriesError('missing')):
+            self.assertFalse(run_job(job))
+
+        # Archive errors are not retried
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_FAILED)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, STATUS.ERROR)
+        self.assertEqual(self.task.comments, 'missing')
+
+    @override_settings(PIXELS_IMPORT_MAX_ATTEMPTS=2)
+    def test_fail_job_after_max_attempts(self):
+
+        job = claim_job()
+        fail_job(job, OperationalError('lost'))
+        self.assertEqual(job.status, ImportJob.STATUS_PENDING)
+
+        job.attempts = 2
+        fail_job(job, OperationalError('lost'))
+        self.assertEqual(job.status, ImportJob.STATUS_FAILED)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, STATUS.ERROR)
+
+    def test_run_job_with_timeout(self):
+
+        job = claim_job()
+        with patch.object(
+                PixelArchive,
+                'save',
+                side_effect=exceptions.ImportTimeoutError('timeout')):
+            self.assertFalse(run_job(job))
+
+        # Timed out importations are not retried
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_FAILED)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, STATUS.ERROR)
+        self.assertEqual(self.task.comments, 'timeout')
+
+    def test_cancel_import(self):
+
+        cancel_import(self.process)
+
+        self.process.refresh_from_db()
+        self.assertTrue(self.process.cancel_requested)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, ImportJob.STATUS_CANCELED)
+        self.assertIsNotNone(self.job.finished_at)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, STATUS.ERROR)
+        self.assertEqual(self.task.comments, 'Importation has been canceled')
+
+        # Canceled jobs are not claimed
+        self.assertIsNone(claim_job())
+
+    def test_cancel_running_import(self):
+
+        job = claim_job()
+        cancel_import(self.process)
+
+        # The running job is canceled by its worker
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_RUNNING)
+
+        self.assertFalse(run_job(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_CANCELED)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, STATUS.ERROR)
+        self.process.refresh_from_db()
+        self.assertFalse(self.process.imported)
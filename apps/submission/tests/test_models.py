@@ -1,9 +1,12 @@
+from pathlib import Path
+
 from django.test import TestCase, TransactionTestCase
 from django.urls import reverse
 
 from apps.core.factories import PIXELER_PASSWORD, PixelerFactory
 from .. import models
-from .test_views import AsyncImportMixin, TagsTestMixin
+from .io.test_pixel import LoadCGDMixin
+from .test_views import AsyncImportMixin, StartTestMixin, TagsTestMixin
 
 
 class SubmissionProcessTestCase(TestCase):
@@ -123,3 +126,120 @@ class SubmissionProcessHasFailedHelperTestCase(TagsTestMixin,
 
         self.process.refresh_from_db()
         self.assertTrue(self.process.has_failed)
+
+
+class SubmissionProcessCompletionTestCase(StartTestMixin,
+                                          AsyncImportMixin,
+                                          LoadCGDMixin,
+                                          TransactionTestCase):
+
+    fixtures = [
+        'apps/data/fixtures/initial_data.json',
+        'apps/data/fixtures/test_entries.json',
+        'apps/core/fixtures/initial_data.json',
+    ]
+
+    # Forcing data serialization is also required
+    serialized_rollback = True
+
+    def test_completion_along_process(self):
+
+        # Start
+        self.client.post(
+            reverse('submission:start'),
+            data={
+                'label': 'Candida datasest 0001',
+                '_viewflow_activation-started': '2000-01-01',
+            },
+            follow=True,
+        )
+        process = models.SubmissionProcess.objects.get()
+        task = process.task_set.first()
+        process.refresh_from_db()
+        self.assertEqual(process.completion, 7)
+
+        # Download
+        url = reverse(
+            'submission:download',
+            kwargs={
+                'process_pk': process.pk,
+                'task_pk': task.pk,
+            }
+        )
+        self.client.post(
+            url,
+            data={
+                '_viewflow_activation-started': '2000-01-01',
+            }
+        )
+        process.refresh_from_db()
+        self.assertEqual(process.completion, 23)
+
+        # Upload
+        task = process.task_set.first()
+        archive = Path('apps/submission/fixtures/dataset-0001-shrink.zip')
+        url = reverse(
+            'submission:upload',
+            kwargs={
+                'process_pk': process.pk,
+                'task_pk': task.pk,
+            }
+        )
+        with archive.open('rb') as archive_file:
+            self.client.post(
+                url,
+                data={
+                    '_viewflow_activation-started': '2000-01-01',
+                    'archive': archive_file,
+                },
+                follow=True,
+            )
+        process.refresh_from_db()
+        self.assertEqual(process.completion, 53)
+
+        # Validate
+        self._load_cgd_entries()
+        task = process.task_set.first()
+        url = reverse(
+            'submission:validation',
+            kwargs={
+                'process_pk': process.pk,
+                'task_pk': task.pk,
+            }
+        )
+        self.client.post(
+            url,
+            data={
+                '_viewflow_activation-started': '2000-01-01',
+                'validated': True,
+            },
+            follow=True,
+        )
+        process.refresh_from_db()
+        self.assertEqual(process.completion, 69)
+
+        # Tags
+        task = process.task_set.first()
+        url = reverse(
+            'submission:tags',
+            kwargs={
+                'process_pk': process.pk,
+                'task_pk': task.pk,
+            }
+        )
+
+        self.client.post(
+            url,
+            data={
+                '_viewflow_activation-started': '2000-01-01',
+                'new_analysis_tags': 'candida',
+                'new_experiment_tags': 'msms/time',
+            },
+            follow=True,
+        )
+        process.refresh_from_db()
+        self.assertEqual(process.completion, 76)
+
+        self._wait_for_async_import(process)
+        process.refresh_from_db()
+        self.assertEqual(process.completion, 100)
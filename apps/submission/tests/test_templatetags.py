@@ -1,14 +1,10 @@
 from unittest.mock import Mock
-from pathlib import Path
 
 from django.test import TestCase, TransactionTestCase
-from django.urls import reverse
 from viewflow.activation import STATUS
 
-from ..models import SubmissionProcess
 from ..templatetags import submission
-from .io.test_pixel import LoadCGDMixin
-from .test_views import AsyncImportMixin, StartTestMixin, TagsTestMixin
+from .test_views import AsyncImportMixin, TagsTestMixin
 
 
 class HideTracebackFilterTestCase(TestCase):
@@ -108,132 +104,3 @@ class IsCompletedTestCase(TestCase):
         self.assertFalse(submission.is_completed(Mock(status=STATUS.ASSIGNED)))
         self.assertFalse(submission.is_completed(Mock(status=STATUS.NEW)))
         self.assertFalse(submission.is_completed(Mock(status='whatever')))
-
-
-class SubmissionRatioTestCase(StartTestMixin,
-                              AsyncImportMixin,
-                              LoadCGDMixin,
-                              TransactionTestCase):
-
-    fixtures = [
-        'apps/data/fixtures/initial_data.json',
-        'apps/data/fixtures/test_entries.json',
-        'apps/core/fixtures/initial_data.json',
-    ]
-
-    # Forcing data serialization is also required
-    serialized_rollback = True
-
-    def test_submission_ratio_along_process(self):
-
-        # Start
-        self.client.post(
-            reverse('submission:start'),
-            data={
-                'label': 'Candida datasest 0001',
-                '_viewflow_activation-started': '2000-01-01',
-            },
-            follow=True,
-        )
-        process = SubmissionProcess.objects.get()
-        task = process.task_set.first()
-        self.assertEqual(
-            submission.submission_ratio(process),
-            7
-        )
-
-        # Download
-        url = reverse(
-            'submission:download',
-            kwargs={
-                'process_pk': process.pk,
-                'task_pk': task.pk,
-            }
-        )
-        self.client.post(
-            url,
-            data={
-                '_viewflow_activation-started': '2000-01-01',
-            }
-        )
-        self.assertEqual(
-            submission.submission_ratio(process),
-            23
-        )
-
-        # Upload
-        task = process.task_set.first()
-        archive = Path('apps/submission/fixtures/dataset-0001-shrink.zip')
-        url = reverse(
-            'submission:upload',
-            kwargs={
-                'process_pk': process.pk,
-                'task_pk': task.pk,
-            }
-        )
-        with archive.open('rb') as archive_file:
-            self.client.post(
-                url,
-                data={
-                    '_viewflow_activation-started': '2000-01-01',
-                    'archive': archive_file,
-                },
-                follow=True,
-            )
-        self.assertEqual(
-            submission.submission_ratio(process),
-            53
-        )
-
-        # Validate
-        self._load_cgd_entries()
-        task = process.task_set.first()
-        url = reverse(
-            'submission:validation',
-            kwargs={
-                'process_pk': process.pk,
-                'task_pk': task.pk,
-            }
-        )
-        self.client.post(
-            url,
-            data={
-                '_viewflow_activation-started': '2000-01-01',
-                'validated': True,
-            },
-            follow=True,
-        )
-        self.assertEqual(
-            submission.submission_ratio(process),
-            69
-        )
-
-        # Tags
-        task = process.task_set.first()
-        url = reverse(
-            'submission:tags',
-            kwargs={
-                'process_pk': process.pk,
-                'task_pk': task.pk,
-            }
-        )
-
-        self.client.post(
-            url,
-            data={
-                '_viewflow_activation-started': '2000-01-01',
-                'new_analysis_tags': 'candida',
-                'new_experiment_tags': 'msms/time',
-            },
-            follow=True,
-        )
-        self.assertEqual(
-            submission.submission_ratio(process),
-            76
-        )
-
-        self._wait_for_async_import(process)
-        self.assertEqual(
-            submission.submission_ratio(process),
-            100
-        )
@@ -1,11 +1,13 @@
 import pytest
 
 from pathlib import Path
-from tempfile import gettempdir
+from tempfile import gettempdir, mkdtemp
 
 from django.conf import settings
 
-from ..utils import make_absolute_path, is_hidden_task
+from ..utils import (
+    make_absolute_path, is_hidden_task, sha256_digest, store_file
+)
 
 
 def test_is_hidden_task():
@@ -42,3 +44,51 @@ def test_make_absolute_path():
     assert expected.parent.exists() is False
     assert make_absolute_path(relative_path, root=root) == expected
     assert expected.parent.exists() is True
+
+
+def test_sha256_digest():
+
+    path = Path(mkdtemp()) / 'foo.txt'
+    path.write_text('foo')
+
+    expected = (
+        '2c26b46b68ffc68ff99b453c1d30413413422d706483bfa0f98a5e886266e7ae'
+    )
+    assert sha256_digest(path) == expected
+
+
+def test_store_file():
+
+    root = mkdtemp()
+    source = Path(mkdtemp()) / 'foo.txt'
+    source.write_text('foo')
+    digest = sha256_digest(source)
+
+    relative_path = store_file(source, root=root)
+    assert relative_path == Path('files') / digest[:2] / digest / 'foo.txt'
+    assert (Path(root) / relative_path).read_text() == 'foo'
+    assert source.exists() is True
+
+    # The same file is stored once
+    assert store_file(source, root=root, move=True) == relative_path
+    assert source.exists() is False
+
+    # A file with the same content and another name is linked
+    other = Path(mkdtemp()) / 'bar.txt'
+    other.write_text('foo')
+    other_path = store_file(other, root=root, move=True)
+    assert other_path == relative_path.parent / 'bar.txt'
+    assert other.exists() is False
+    stored = (Path(root) / relative_path).stat()
+    assert (Path(root) / other_path).stat().st_ino == stored.st_ino
+
+    # A file with another content is moved
+    source.write_text('bar')
+    moved_path = store_file(source, root=root, move=True)
+    assert moved_path != relative_path
+    assert (Path(root) / moved_path).read_text() == 'bar'
+    assert source.exists() is False
+
+    # Stored file name can be set
+    source.write_text('foo')
+    assert store_file(source, filename='baz.txt', root=root).name == 'baz.txt'
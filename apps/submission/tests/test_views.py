@@ -1,25 +1,34 @@
+import hashlib
 import logging
 
 from pathlib import Path, PurePath
 from tempfile import mkdtemp
+from threading import Thread
 from time import sleep
 from unittest.mock import patch
 
-from django.test import TestCase, TransactionTestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from openpyxl import load_workbook
 from viewflow.activation import STATUS
 from viewflow.base import Flow
+from viewflow.models import Task
 
 from apps.core.factories import PIXELER_PASSWORD, PixelerFactory
 from apps.core.models import Tag
 from apps.core.tests import CoreFixturesTestCase
 from ..flows import SubmissionFlow
 from ..io.archive import PixelArchive
+from ..io.progress import ImportProgress
 from ..io.xlsx import (
     sha256_checksum, generate_template, get_template_version
 )
-from ..models import SubmissionProcess
+from ..models import ImportJob, SubmissionProcess
+from ..utils import get_upload_staging_path
 from ..views import NextTaskRedirectView
 
 logger = logging.getLogger(__name__)
@@ -158,6 +167,13 @@ class AsyncImportMixin(object):
 
     def _wait_for_async_import(self, process, timeout=60):
 
+        # Queued importations are run by an import worker thread
+        Thread(
+            target=call_command,
+            args=('run_import_workers', ),
+            kwargs={'burst': True, 'concurrency': 1},
+        ).start()
+
         for t in range(timeout):
             process.refresh_from_db()
             latest_task = process.task_set.all()[0]
@@ -346,6 +362,52 @@ class StartViewTestCase(StartTestMixin, TestCase):
         self.assertTemplateUsed(response, expected_template)
 
 
+class SubmissionListViewTestCase(StartTestMixin, TestCase):
+
+    def setUp(self):
+
+        super().setUp()
+
+        self.url = reverse('submission:index')
+
+    def _create_processes(self, count):
+
+        for i in range(count):
+            process = SubmissionProcess.objects.create(
+                label='Submission {}'.format(i),
+                flow_class=SubmissionFlow,
+                completion=42,
+            )
+            # The process owner is its start task owner
+            Task.objects.create(
+                process=process,
+                flow_task=SubmissionFlow.start,
+                flow_task_type='START',
+                owner=PixelerFactory(
+                    first_name='Pixeler',
+                    last_name='{}'.format(i)
+                ),
+                status=STATUS.DONE,
+            )
+
+    def test_get(self):
+
+        self._create_processes(1)
+        with CaptureQueriesContext(connection) as one:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '42%')
+        self.assertContains(response, 'Pixeler 0')
+
+        # Rendering does not depend on the number of processes
+        self._create_processes(9)
+        with CaptureQueriesContext(connection) as ten:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '42%', count=10)
+        self.assertEqual(len(ten), len(one))
+
+
 class DownloadXLSXTemplateViewTestCase(DownloadTestMixin, TestCase):
 
     template = 'submission/download_xlsx_template.html'
@@ -460,6 +522,7 @@ class UploadArchiveViewTestCase(UploadTestMixin, CoreFixturesTestCase):
 
         # File name
         process = SubmissionProcess.objects.get()
+        self.assertTrue(process.uploaded)
         expected_name = '{}/submissions/{}/{}'.format(
             process.created_by.id,
             process.id,
@@ -473,13 +536,296 @@ class UploadArchiveViewTestCase(UploadTestMixin, CoreFixturesTestCase):
             self.archive.stat().st_size
         )
 
+    def _post_chunk(self, data, offset, checksum=None, filename=None,
+                    size=None):
+
+        return self.client.post(
+            self.url,
+            data={
+                '_viewflow_activation-started': '2000-01-01',
+                '_continue': 'Submit',
+                'chunk': SimpleUploadedFile('blob', data),
+                'filename': filename or self.archive.name,
+                'offset': offset,
+                'size': size or self.archive.stat().st_size,
+                'checksum': checksum or hashlib.sha256(data).hexdigest(),
+            },
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+
+    def _get_offset(self):
+
+        response = self.client.get(
+            self.url,
+            data={
+                'filename': self.archive.name,
+                'size': self.archive.stat().st_size,
+            },
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()['offset']
+
+    def test_post_chunks(self):
+
+        content = self.archive.read_bytes()
+        chunk_size = 1000
+        staging_path = get_upload_staging_path(
+            self.process,
+            self.archive.name,
+            len(content)
+        )
+
+        self.assertEqual(self._get_offset(), 0)
+        # Looking up the upload offset does not create staging directories
+        self.assertFalse(staging_path.parent.exists())
+        for offset in range(0, len(content), chunk_size):
+            response = self._post_chunk(
+                content[offset:offset + chunk_size],
+                offset
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response.json()['offset'],
+                min(offset + chunk_size, len(content))
+            )
+            if offset + chunk_size < len(content):
+                self.assertEqual(self._get_offset(), offset + chunk_size)
+                self.assertNotIn('redirect', response.json())
+
+        self.assertIn('redirect', response.json())
+
+        process = SubmissionProcess.objects.get()
+        self.assertTrue(process.uploaded)
+        expected_name = '{}/submissions/{}/{}'.format(
+            process.created_by.id,
+            process.id,
+            self.archive.name
+        )
+        self.assertEqual(process.archive.name, expected_name)
+        self.assertEqual(process.archive.size, len(content))
+
+        # Staging files have been removed
+        self.assertFalse(staging_path.parent.exists())
+
+    def test_post_chunk_with_invalid_checksum(self):
+
+        content = self.archive.read_bytes()
+
+        response = self._post_chunk(content[:1000], 0, checksum='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('checksum', response.json()['errors'])
+        self.assertEqual(self._get_offset(), 0)
+
+    @override_settings(PIXELS_UPLOAD_CHUNK_SIZE=100)
+    def test_post_too_large_chunk(self):
+
+        content = self.archive.read_bytes()
+
+        response = self._post_chunk(content[:1000], 0)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('chunk', response.json()['errors'])
+
+    def test_post_chunk_with_invalid_offset(self):
+
+        content = self.archive.read_bytes()
+
+        self._post_chunk(content[:1000], 0)
+        response = self._post_chunk(content[2000:3000], 2000)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 1000)
+
+        # Resume upload
+        response = self._post_chunk(content[1000:2000], 1000)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['offset'], 2000)
+
+    def test_post_chunks_with_unparsable_archive(self):
+
+        content = self.archive.read_bytes()
+
+        with patch(
+                'apps.submission.views.PixelArchive',
+                side_effect=ValueError('Unparsable meta.xlsx')):
+            response = self._post_chunk(content, 0)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json()['errors'],
+            {'archive': ['Unparsable meta.xlsx']}
+        )
+
+        process = SubmissionProcess.objects.get()
+        self.assertFalse(process.uploaded)
+
+    def test_post_chunks_with_invalid_archive(self):
+
+        content = b'not a zip archive'
+
+        response = self._post_chunk(content, 0, size=len(content))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('archive', response.json()['errors'])
+
+        process = SubmissionProcess.objects.get()
+        self.assertFalse(process.uploaded)
+        self.assertFalse(
+            get_upload_staging_path(
+                process,
+                self.archive.name,
+                len(content)
+            ).exists()
+        )
+
+
+class SubmissionProgressViewTestCase(DownloadTestMixin, TestCase):
+
+    def setUp(self):
+
+        super().setUp()
+
+        self.url = reverse(
+            'submission:progress',
+            kwargs={'process_pk': self.process.pk}
+        )
+
+    def test_get(self):
+
+        ImportProgress(self.process).checkpoint(
+            stage=ImportProgress.STAGE_IMPORTING,
+            datasets=2
+        )
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+        data = response.json()
+        self.assertFalse(data['imported'])
+        self.assertFalse(data['failed'])
+        self.assertFalse(data['canceled'])
+        self.assertIsNone(data['queue_position'])
+        self.assertEqual(data['progress']['stage'], 'importing')
+        self.assertEqual(data['progress']['datasets'], 2)
+
+    def test_get_without_progress(self):
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()['progress'])
+
+    def test_get_as_non_staff_pixeler(self):
+
+        self.user.is_staff = False
+        self.user.is_superuser = False
+        self.user.save()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_other_pixeler_submission(self):
+
+        other = PixelerFactory(is_active=True, is_staff=False)
+        self.client.login(
+            username=other.username,
+            password=PIXELER_PASSWORD,
+        )
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 404)
+
+
+class CancelImportViewTestCase(TagsTestMixin, TestCase):
+
+    fixtures = [
+        'apps/data/fixtures/initial_data.json',
+        'apps/data/fixtures/test_entries.json',
+        'apps/core/fixtures/initial_data.json',
+    ]
+
+    def setUp(self):
+
+        super().setUp()
+
+        # Submit tags: the archive importation is queued
+        self.client.post(
+            self.url,
+            data={
+                '_viewflow_activation-started': '2000-01-01',
+            },
+            follow=True,
+        )
+        self.cancel_url = reverse(
+            'submission:cancel',
+            kwargs={'process_pk': self.process.pk}
+        )
+
+    def test_get(self):
+
+        response = self.client.get(self.cancel_url)
+        self.assertEqual(response.status_code, 405)
+
+    def test_post(self):
+
+        response = self.client.post(self.cancel_url)
+        self.assertRedirects(
+            response,
+            reverse(
+                'submission:detail',
+                kwargs={'process_pk': self.process.pk}
+            ),
+            fetch_redirect_response=False
+        )
+
+        self.process.refresh_from_db()
+        self.assertTrue(self.process.cancel_requested)
+        self.assertTrue(self.process.has_failed)
+        job = ImportJob.objects.get()
+        self.assertEqual(job.status, ImportJob.STATUS_CANCELED)
+        self.assertEqual(job.task.status, STATUS.ERROR)
+
+    def test_post_with_unsafe_next(self):
+
+        response = self.client.post(
+            self.cancel_url,
+            data={'next': 'https://example.org/'}
+        )
+        self.assertRedirects(
+            response,
+            reverse(
+                'submission:detail',
+                kwargs={'process_pk': self.process.pk}
+            ),
+            fetch_redirect_response=False
+        )
+
+    def test_post_as_non_staff_pixeler(self):
+
+        self.user.is_staff = False
+        self.user.is_superuser = False
+        self.user.save()
+
+        self.client.post(self.cancel_url)
+        self.process.refresh_from_db()
+        self.assertTrue(self.process.cancel_requested)
+
+    def test_post_other_pixeler_submission(self):
+
+        other = PixelerFactory(is_active=True, is_staff=False)
+        self.client.login(
+            username=other.username,
+            password=PIXELER_PASSWORD,
+        )
+
+        response = self.client.post(self.cancel_url)
+        self.assertEqual(response.status_code, 404)
+        self.process.refresh_from_db()
+        self.assertFalse(self.process.cancel_requested)
+
 
 class ArchiveValidationViewTestCase(ValidateTestMixin, TestCase):
     """
     We use a TransactionTestCase to avoid using transactions for each test. By
     doing so, we commit each request allowing multiple threads to access a
     shared state of the database. This is required as the archive importation
-    is a background task (using concurrent.futures).
+    is run by an import worker thread.
     """
 
     template = 'submission/validation.html'
@@ -631,31 +977,33 @@ class AsyncImportMixinTestCase(TagsTestMixin,
         sleep(10)
 
 
-class AsyncImportTestCase(TagsTestMixin,
-                          AsyncImportMixin,
-                          TransactionTestCase):
+class ParseMetaTestCase(UploadTestMixin, TestCase):
 
     fixtures = [
         'apps/data/fixtures/initial_data.json',
         'apps/core/fixtures/initial_data.json',
     ]
 
-    # Forcing data serialization is also required
-    serialized_rollback = True
-
-    def test_raise_importation_error_without_entries_fixture(self):
+    def test_raise_meta_error_without_entries_fixture(self):
 
-        response = self.client.post(
-            self.url,
-            data={
-                '_viewflow_activation-started': '2000-01-01',
-            },
-            follow=True,
-        )
+        with self.archive.open('rb') as archive_file:
+            response = self.client.post(
+                self.url,
+                data={
+                    '_viewflow_activation-started': '2000-01-01',
+                    'archive': archive_file,
+                },
+                follow=True,
+            )
         self.assertEqual(response.status_code, 200)
-        self._wait_for_async_import(self.process)
+
+        # Datasets are validated before the importation is queued
+        self.process.refresh_from_db()
+        self.assertIsNone(self.process.meta)
+        self.assertEqual(ImportJob.objects.count(), 0)
 
         latest_task = self.process.task_set.all()[0]
+        self.assertEqual(latest_task.flow_task, SubmissionFlow.meta)
         self.assertEqual(latest_task.status, STATUS.ERROR)
 
         # As we are using unorderd set() of missing entries check error message
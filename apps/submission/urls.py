@@ -4,14 +4,33 @@ from viewflow.flow.viewset import FlowViewSet
 from . import flows, views
 
 
+class SubmissionViewSet(FlowViewSet):
+
+    process_list_view = [
+        r'^$',
+        views.SubmissionListView.as_view(),
+        'index'
+    ]
+
+
 urlpatterns = [
     url(
         r'^(?P<process_pk>\d+)/(?P<task_pk>\d+)/next/$',
         views.NextTaskRedirectView.as_view(),
         name='next_task'
     ),
+    url(
+        r'^(?P<process_pk>\d+)/progress/$',
+        views.SubmissionProgressView.as_view(),
+        name='progress'
+    ),
+    url(
+        r'^(?P<process_pk>\d+)/cancel/$',
+        views.CancelImportView.as_view(),
+        name='cancel'
+    ),
     url(
         r'^',
-        include(FlowViewSet(flows.SubmissionFlow).urls),
+        include(SubmissionViewSet(flows.SubmissionFlow).urls),
     ),
 ]
@@ -1,11 +1,18 @@
+import hashlib
+import logging
 import re
 
-from os import makedirs
+from os import link, makedirs
 from pathlib import Path
+from shutil import copyfile, move as move_file
+from tempfile import NamedTemporaryFile
 
 from django.conf import settings
+from django.utils.text import get_valid_filename
 from django.utils.translation import ugettext as _
 
+logger = logging.getLogger(__name__)
+
 
 def is_hidden_task(task_name):
     if not isinstance(task_name, str):
@@ -42,3 +49,157 @@ def make_absolute_path(relative_path, root=settings.MEDIA_ROOT, dry_run=False):
         makedirs(absolute_path.parent)
 
     return absolute_path
+
+
+def sha256_digest(path, block_size=65536):
+    """
+    Return the SHA-256 hexadecimal digest of a file content
+    """
+
+    m = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            m.update(block)
+    return m.hexdigest()
+
+
+def _write_stream(source, root, block_size=65536):
+    """
+    Write a readable source (e.g. an archive member) to a temporary file of
+    the files tree, computing its SHA-256 digest on the fly.
+
+    Returns: the temporary file Path and the digest
+    """
+
+    tmp_path = make_absolute_path(Path('files') / 'tmp' / 'file', root=root)
+    m = hashlib.sha256()
+    with source.open('rb') as src, NamedTemporaryFile(
+            dir=str(tmp_path.parent), delete=False) as dest:
+        for block in iter(lambda: src.read(block_size), b''):
+            m.update(block)
+            dest.write(block)
+    return Path(dest.name), m.hexdigest()
+
+
+def store_file(source, filename=None, move=False, root=settings.MEDIA_ROOT):
+    """
+    Store a file in the content-addressed files tree: a file is stored once
+    given its SHA-256 digest, as `files/<d[:2]>/<digest>/<filename>`. A file
+    with the same content but another name is hard linked to the stored one.
+
+    Parameters
+    ----------
+    source : :obj:`Path`
+        The Path to the file to store, or any object with a Path-like
+        `open()` method and `name` attribute (e.g. an archive member) that
+        will be streamed to the files tree
+    filename : str, optional
+        The stored file name. Defaults to the source file name.
+    move : bool, optional
+        If True the source file is moved (or removed if already stored)
+        rather than copied. Defaults to False.
+    root : str, optional
+        The files tree root. The default root is the MEDIA_ROOT
+
+    Returns
+    -------
+    Path
+        The stored file Path relative to root
+    """
+
+    filename = filename or source.name
+    if isinstance(source, Path):
+        digest = sha256_digest(source)
+    else:
+        source, digest = _write_stream(source, root)
+        move = True
+
+    relative_path = Path('files') / digest[:2] / digest / filename
+    absolute_path = make_absolute_path(relative_path, root=root)
+
+    if absolute_path.exists():
+        logger.debug('File {} is already stored'.format(relative_path))
+        if move:
+            source.unlink()
+        return relative_path
+
+    stored = [p for p in absolute_path.parent.iterdir() if p.is_file()]
+    if len(stored):
+        try:
+            link(stored[0], absolute_path)
+            if move:
+                source.unlink()
+            return relative_path
+        except OSError:
+            logger.debug('Cannot link {}, will copy it'.format(stored[0]))
+
+    if move:
+        move_file(str(source), str(absolute_path))
+    else:
+        copyfile(source, absolute_path)
+
+    return relative_path
+
+
+def get_upload_staging_path(process, filename, size,
+                            root=settings.MEDIA_ROOT):
+    """
+    Return the Path of the staging file a process archive chunks are appended
+    to while it is uploaded. The staging file is named after the archive name
+    and size so that an interrupted upload is only resumed for the same
+    archive.
+
+    Parameters
+    ----------
+    process : :obj:`SubmissionProcess`
+        The submission process the archive is uploaded for
+    filename : str
+        The uploaded archive file name
+    size : int
+        The uploaded archive size (in bytes)
+    root : str, optional
+        The staging files tree root. The default root is the MEDIA_ROOT
+
+    Returns
+    -------
+    Path
+        The absolute Path to the staging file (its directory is created by
+        append_chunk)
+    """
+
+    name = '{}-{}.part'.format(size, get_valid_filename(Path(filename).name))
+    relative_path = Path('files') / 'uploads' / str(process.pk) / name
+    return make_absolute_path(relative_path, root=root, dry_run=True)
+
+
+def get_upload_offset(staging_path):
+    """
+    Return the offset (in bytes) the upload of a staging file resumes at
+    """
+
+    if not staging_path.exists():
+        return 0
+    return staging_path.stat().st_size
+
+
+def append_chunk(staging_path, offset, chunk):
+    """
+    Append an uploaded chunk to a staging file. Starting over (a zero offset)
+    truncates the staging file.
+
+    Returns: the new staging file size, i.e. the next chunk offset
+    """
+
+    staging_path.parent.mkdir(parents=True, exist_ok=True)
+    mode = 'wb' if offset == 0 else 'ab'
+    with staging_path.open(mode) as f:
+        if f.tell() != offset:
+            raise ValueError(
+                _("Chunk offset {} does not match upload offset {}").format(
+                    offset,
+                    f.tell()
+                )
+            )
+        for block in chunk.chunks():
+            f.write(block)
+        return f.tell()
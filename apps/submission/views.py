@@ -1,17 +1,28 @@
 from pathlib import PurePath
+from shutil import rmtree
 from tempfile import mkdtemp
 
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.urlresolvers import reverse
-from django.http import HttpResponse
+from django.db.models import Prefetch
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
+from django.utils.http import is_safe_url
+from django.utils.translation import ugettext as _
 from django.views.generic import RedirectView
-from django.views.generic.detail import SingleObjectMixin
+from django.views.generic.detail import BaseDetailView, SingleObjectMixin
 from viewflow.models import Task
-from viewflow.flow.views import UpdateProcessView
+from viewflow.flow.views import ProcessListView, UpdateProcessView
 
+from .io.archive import PixelArchive
 from .io.xlsx import generate_template
-from .forms import SubmissionTagsForm
+from .jobs import cancel_import, get_queue_position
+from .forms import ArchiveChunkForm, SubmissionTagsForm
 from .models import SubmissionProcess
-from .utils import is_hidden_task
+from .utils import (
+    append_chunk, get_upload_offset, get_upload_staging_path, is_hidden_task
+)
 
 
 class NextTaskRedirectView(SingleObjectMixin,
@@ -64,6 +75,26 @@ class NextTaskRedirectView(SingleObjectMixin,
         )
 
 
+class SubmissionListView(ProcessListView):
+    """Submissions list: completion and status are process columns (see
+    SubmissionProcess.update_completion()) and owners (start tasks owners, see
+    Process.created_by) are prefetched, hence the list is rendered with a
+    constant number of queries
+    """
+
+    def get_queryset(self):
+
+        return super().get_queryset().prefetch_related(
+            Prefetch(
+                'task_set',
+                queryset=Task.objects.filter(
+                    flow_task_type='START'
+                ).select_related('owner'),
+                to_attr='start_tasks'
+            )
+        )
+
+
 class DownloadXLSXTemplateView(UpdateProcessView):
 
     template_name = 'submission/download_xlsx_template.html'
@@ -115,6 +146,12 @@ class DownloadXLSXTemplateView(UpdateProcessView):
 
 
 class UploadArchiveView(UpdateProcessView):
+    """
+    The archive is either posted at once or by chunks (ajax requests). Chunks
+    are appended to a staging file: an interrupted upload resumes at the
+    staging file offset (see get_upload_offset). Once the last chunk has been
+    received, the archive is validated and attached to the process.
+    """
 
     template_name = 'submission/upload_archive.html'
     fields = ['archive', ]
@@ -127,6 +164,99 @@ class UploadArchiveView(UpdateProcessView):
 
         return super().form_valid(form)
 
+    def get_context_data(self, **kwargs):
+
+        ctx = super().get_context_data(**kwargs)
+        ctx.update({
+            'chunk_size': settings.PIXELS_UPLOAD_CHUNK_SIZE,
+        })
+
+        return ctx
+
+    def get_staging_path(self, filename, size):
+
+        return get_upload_staging_path(
+            self.activation.process,
+            filename,
+            size
+        )
+
+    def get(self, request, *args, **kwargs):
+
+        if not request.is_ajax():
+            return super().get(request, *args, **kwargs)
+
+        try:
+            size = int(request.GET.get('size'))
+            filename = request.GET['filename']
+        except (KeyError, TypeError, ValueError):
+            return JsonResponse(
+                {'errors': {'__all__': ['filename and size are required']}},
+                status=400
+            )
+
+        return JsonResponse({
+            'offset': get_upload_offset(self.get_staging_path(filename, size)),
+        })
+
+    def post(self, request, *args, **kwargs):
+
+        if not request.is_ajax():
+            return super().post(request, *args, **kwargs)
+
+        form = ArchiveChunkForm(request.POST, request.FILES)
+        if not form.is_valid():
+            errors = {f: list(e) for f, e in form.errors.items()}
+            return JsonResponse({'errors': errors}, status=400)
+
+        return self.chunk_valid(form)
+
+    def chunk_valid(self, form):
+
+        filename = form.cleaned_data['filename']
+        size = form.cleaned_data['size']
+        staging_path = self.get_staging_path(filename, size)
+
+        try:
+            offset = append_chunk(
+                staging_path,
+                form.cleaned_data['offset'],
+                form.cleaned_data['chunk']
+            )
+        except ValueError:
+            # Tell the client where to resume the upload
+            return JsonResponse(
+                {'offset': get_upload_offset(staging_path)},
+                status=409
+            )
+
+        if offset < size:
+            return JsonResponse({'offset': offset})
+
+        try:
+            archive = PixelArchive(staging_path)
+        except Exception as e:
+            # Parsing errors are not all ArchiveError (e.g. invalid meta.xlsx
+            # workbooks): any of them rejects the uploaded archive
+            staging_path.unlink()
+            return JsonResponse({'errors': {'archive': [str(e)]}}, status=400)
+        # The staging file is about to be moved
+        archive.cleanup()
+
+        process = self.activation.process
+        process.set_archive(staging_path, filename)
+        process.uploaded = True
+        process.save()
+        self.activation_done()
+
+        # Remove stale staging files (e.g. other archives upload attempts)
+        rmtree(str(staging_path.parent), ignore_errors=True)
+
+        return JsonResponse({
+            'offset': offset,
+            'redirect': self.get_success_url(),
+        })
+
 
 class ArchiveValidationView(UpdateProcessView):
 
@@ -138,3 +268,84 @@ class TagsView(UpdateProcessView):
 
     template_name = 'submission/tags.html'
     form_class = SubmissionTagsForm
+
+
+class SubmissionProgressView(LoginRequiredMixin, BaseDetailView):
+    """Submission status and archive importation progress (JSON), polled by
+    the import task page instead of reloading it (and its task list)
+    """
+
+    http_method_names = ['get', ]
+    model = SubmissionProcess
+    pk_url_kwarg = 'process_pk'
+
+    def get_queryset(self):
+
+        qs = super().get_queryset().only(
+            'status', 'imported', 'failed', 'progress', 'cancel_requested'
+        )
+        if not self.request.user.is_staff:
+            # The submission owner is the owner of its start task
+            qs = qs.filter(
+                task__flow_task_type='START',
+                task__owner=self.request.user
+            )
+        return qs
+
+    def render_to_response(self, context):
+
+        process = self.object
+        return JsonResponse({
+            'status': process.status,
+            'imported': process.imported,
+            'failed': process.has_failed,
+            'canceled': process.cancel_requested,
+            'progress': process.progress,
+            'queue_position': get_queue_position(process),
+        })
+
+
+class CancelImportView(LoginRequiredMixin, SingleObjectMixin, RedirectView):
+    """Cancel the submission archive importation (see jobs.cancel_import)"""
+
+    http_method_names = ['post', ]
+    model = SubmissionProcess
+    pk_url_kwarg = 'process_pk'
+
+    def get_queryset(self):
+
+        qs = super().get_queryset()
+        if not self.request.user.is_staff:
+            # The submission owner is the owner of its start task
+            qs = qs.filter(
+                task__flow_task_type='START',
+                task__owner=self.request.user
+            )
+        return qs
+
+    def get_redirect_url(self, *args, **kwargs):
+
+        redirect_to = self.request.POST.get('next')
+        if redirect_to and is_safe_url(
+                redirect_to, allowed_hosts={self.request.get_host()}):
+            return redirect_to
+        return reverse(
+            'submission:detail',
+            kwargs={'process_pk': self.object.pk}
+        )
+
+    def post(self, request, *args, **kwargs):
+
+        self.object = self.get_object()
+        if self.object.imported:
+            messages.error(
+                request,
+                _("This archive has already been imported.")
+            )
+        else:
+            cancel_import(self.object)
+            messages.success(
+                request,
+                _("The archive importation has been canceled.")
+            )
+        return HttpResponseRedirect(self.get_redirect_url(*args, **kwargs))
@@ -139,6 +139,52 @@ class Base(Configuration):
     MEDIA_ROOT = os.path.join(BASE_DIR, 'public', 'media')
     MEDIA_URL = '/media/'
 
+    # Pixels importation backend: "copy" (PostgreSQL COPY) or "orm"
+    # (bulk_create, for other databases)
+    PIXELS_INGESTION_BACKEND = values.Value('copy')
+    # Number of pixels file rows read and saved at once while importing an
+    # archive
+    PIXELS_CHUNK_SIZE = values.IntegerValue(100000)
+    # Number of worker processes used to parse an archive pixels files (1 to
+    # parse them in the importation process)
+    PIXELS_IMPORT_JOBS = values.IntegerValue(1)
+    # Pixels files larger than this size (in bytes) are streamed by chunks in
+    # the importation process instead of being parsed at once by a worker
+    # process
+    PIXELS_IMPORT_JOBS_MAX_FILE_SIZE = values.IntegerValue(64 * 1024 * 1024)
+    # Rescan pixels after an importation to check PixelSet cached fields
+    # (slow, for verification purpose only)
+    PIXELS_VERIFY_CACHED_FIELDS = values.BooleanValue(False)
+    # Number of archives imported concurrently by the run_import_workers
+    # command
+    PIXELS_IMPORT_WORKERS = values.IntegerValue(1)
+    # Seconds an import worker waits for new jobs when the queue is empty
+    PIXELS_IMPORT_POLL_INTERVAL = values.FloatValue(5.)
+    # Number of attempts of an archive importation failing for another reason
+    # than the archive content (e.g. a lost database connection), and the
+    # delay (in seconds) before the first retry (doubled for each retry)
+    PIXELS_IMPORT_MAX_ATTEMPTS = values.IntegerValue(3)
+    PIXELS_IMPORT_RETRY_DELAY = values.IntegerValue(60)
+    # Maximum number of archives imported concurrently by all import workers,
+    # and by a single pixeler (0 for no limit). Pending importations of the
+    # pixelers running the fewest importations are claimed first.
+    PIXELS_IMPORT_MAX_RUNNING = values.IntegerValue(2)
+    PIXELS_IMPORT_MAX_RUNNING_PER_PIXELER = values.IntegerValue(0)
+    # Seconds after which a running importation is considered lost (e.g. its
+    # worker died) and is claimed again
+    PIXELS_IMPORT_JOB_LEASE = values.IntegerValue(6 * 60 * 60)
+    # Maximum duration (in seconds) of an archive importation (it should be
+    # shorter than the job lease), and of each of its database statements (0
+    # to disable)
+    PIXELS_IMPORT_TIMEOUT = values.IntegerValue(4 * 60 * 60)
+    PIXELS_IMPORT_STATEMENT_TIMEOUT = values.IntegerValue(30 * 60)
+    # Minimum delay (in seconds) between two writes of an archive importation
+    # progress (a new stage or imported dataset is always written)
+    PIXELS_PROGRESS_INTERVAL = values.FloatValue(2.)
+    # Maximum size (in bytes) of an archive chunk sent to the upload step
+    # (should be lower than the web server maximum request body size)
+    PIXELS_UPLOAD_CHUNK_SIZE = values.IntegerValue(10 * 1024 * 1024)
+
 
 class Development(Base):
 